@@ -0,0 +1,164 @@
+"""
+Memory-mapped Load Benchmark
+Builds a synthetic vectorstore (no network: vectors are random, the embedding function is a fake),
+then opens it in several worker processes, in memory and read-only memory-mapped, and reports
+the load time and the resident memory of each worker.
+
+RSS counts the page-cached pages a worker touched, so it also includes pages shared with the
+other workers; PSS divides shared pages between the processes mapping them.
+
+Usage:
+    python -m app.benchmarks.mmap_load --documents 200000 --dimensions 1536 --workers 4
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.models.vectorstore import FAISS_DB
+from app.models.mmap_store import resident_memory_mb
+
+
+def proportional_memory_mb() -> (float | None):
+    """
+    Gets the proportional set size (shared pages divided between the processes mapping them) of the current process.
+
+    Returns:
+        (float | None): PSS in MB, None on platforms without /proc/self/smaps_rollup.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r", encoding="utf-8") as smaps_file:
+            for line in smaps_file:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def build_store(path: str, documents: int, dimensions: int, batch_size: int = 10000) -> None:
+    """
+    Writes a synthetic vectorstore of random vectors as a single base snapshot.
+
+    Args:
+        path (str): Persist directory of the store.
+        documents (int): Number of documents.
+        dimensions (int): Dimension of the vectors.
+        batch_size (int): Number of documents added at a time.
+    """
+    vectorstore = FAISS_DB(embedding_function=DeterministicFakeEmbedding(size=dimensions), persist_directory=path)
+    vectorstore.load()
+
+    rng = np.random.default_rng(0)
+    for start in range(0, documents, batch_size):
+        count = min(batch_size, documents - start)
+        vectors = rng.random((count, dimensions), dtype=np.float32)
+        text_embeddings = [(f"synthetic page {start + i}", vector) for i, vector in enumerate(vectors)]
+        metadatas = [
+            {"source": f"/synthetic/file-{(start + i) // 20}.pdf", "page": (start + i) % 20 + 1, "gu_id": f"file-{(start + i) // 20}"}
+            for i in range(count)
+        ]
+        vectorstore.add_embeddings(text_embeddings=text_embeddings, metadatas=metadatas, ids=None)
+
+    vectorstore.merge(background=False)
+
+
+def worker(path: str, dimensions: int, read_only: bool, queries: int, start_barrier, results) -> None:
+    """
+    Opens the store, runs searches and reports memory use. Runs in a child process.
+
+    Args:
+        path (str): Persist directory of the store.
+        dimensions (int): Dimension of the vectors.
+        read_only (bool): If True, the store is opened memory-mapped.
+        queries (int): Number of searches run after the load.
+        start_barrier: Barrier making all workers load at the same time.
+        results: Queue receiving the report of the worker.
+    """
+    report = {"pid": os.getpid(), "rss_mb_before": resident_memory_mb()}
+    start_barrier.wait()
+
+    start = time.perf_counter()
+    vectorstore = FAISS_DB(embedding_function=DeterministicFakeEmbedding(size=dimensions), persist_directory=path, read_only=read_only)
+    vectorstore.load()
+    report["load_s"] = time.perf_counter() - start
+    report["rss_mb_after_load"] = resident_memory_mb()
+
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(queries):
+        vectorstore.similarity_search_by_vector(rng.random(dimensions, dtype=np.float32), k=10)
+    report["rss_mb_after_search"] = resident_memory_mb()
+
+    # Wait for the other workers, so that PSS reflects all of them mapping the store
+    start_barrier.wait()
+    report["pss_mb_after_search"] = proportional_memory_mb()
+    results.put(report)
+    start_barrier.wait()
+
+
+def run(path: str, dimensions: int, workers: int, read_only: bool, queries: int) -> list:
+    """
+    Starts the workers of one load mode and collects their reports.
+
+    Returns:
+        (list): One report per worker.
+    """
+    context = multiprocessing.get_context("spawn")
+    start_barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(path, dimensions, read_only, queries, start_barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return reports
+
+
+def main(argv: list = None) -> dict:
+    """
+    Runs the benchmark and prints a JSON report.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (dict): The benchmark report.
+    """
+    parser = argparse.ArgumentParser(description="Compare worker memory of in-memory and memory-mapped vectorstore loads.")
+    parser.add_argument("--documents", type=int, default=200000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=20, help="Searches run by each worker after the load")
+    parser.add_argument("--path", default=None, help="Existing store to open instead of a synthetic one")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        path = args.path
+        if not path:
+            path = os.path.join(temporary_directory, "store")
+            build_store(path, args.documents, args.dimensions)
+
+        report = {
+            "documents": args.documents,
+            "dimensions": args.dimensions,
+            "workers": args.workers,
+            "in_memory": run(path, args.dimensions, args.workers, False, args.queries),
+            "read_only_mmap": run(path, args.dimensions, args.workers, True, args.queries)
+        }
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+OCR Encoding Benchmark
+Compares the adaptive encoding of page images (app/models/image_encoding.py) with the previous one (every
+page resized to 800x800 and sent as PNG): payload bytes, encoding time and, with --ocr, OCR latency and
+text accuracy on sample pages.
+
+Sample pages are the pages of born-digital PDFs (--pdfs), whose text layer is the reference text, or page
+images (--images), whose reference text is read from "<image>.txt" if it exists. Accuracy is the share of
+the reference words found, in order, in the OCR output (the OCR prompt also describes figures, so extra
+words are not counted against it).
+
+Without --ocr no request is sent. With --ocr the pages are sent to the vision deployment configured in .env.
+
+Usage:
+    python -m app.benchmarks.ocr_encoding --pdfs report.pdf --ocr --output ocr_encoding.json
+"""
+
+import re
+import json
+import time
+import base64
+import asyncio
+import argparse
+import difflib
+from io import BytesIO
+
+import numpy as np
+import pdfplumber
+from PIL import Image
+
+from app.models.image_encoding import encode_page
+from app.models.pdf_rasterizer import RENDER_MAX_SIDE, pdf_page_count, rasterize_pages
+from app.benchmarks.vectorstore_ops import percentiles
+
+
+def legacy_encoding(image: Image.Image) -> list[dict]:
+    """
+    Encodes a page as before the adaptive encoding: resized to 800x800 whatever its aspect ratio, PNG.
+    """
+    buffered = BytesIO()
+    image.convert("RGB").resize((800, 800), Image.LANCZOS).save(buffered, "PNG")
+    data = buffered.getvalue()
+    return [{"data": base64.b64encode(data).decode("utf-8"), "mime_type": "image/png", "format": "png", "bytes": len(data)}]
+
+
+def word_recall(reference: str, text: str) -> float:
+    """
+    Gets the share of the reference words found, in order, in a text (case and punctuation ignored).
+    """
+    reference_words = re.findall(r"\w+", reference.lower())
+    if not reference_words:
+        return None
+    words = re.findall(r"\w+", text.lower())
+    matcher = difflib.SequenceMatcher(None, reference_words, words, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / len(reference_words)
+
+
+async def load_pages(pdfs: list, images: list, max_pages: int) -> list[tuple[str, Image.Image, str]]:
+    """
+    Loads the sample pages.
+
+    Returns:
+        (list): (name, rendered page, reference text or None) of each page.
+    """
+    pages = []
+    for pdf_path in pdfs:
+        page_count = min(pdf_page_count(pdf_path), max_pages)
+        with pdfplumber.open(pdf_path) as pdf:
+            references = [page.extract_text() or "" for page in pdf.pages[:page_count]]
+        async for i, image in rasterize_pages(pdf_path, list(range(page_count)), max_side=RENDER_MAX_SIDE):
+            pages.append((f"{pdf_path}:{i + 1}", image, references[i]))
+
+    for image_path in images:
+        try:
+            with open(image_path + ".txt", encoding="utf-8") as reference_file:
+                reference = reference_file.read()
+        except FileNotFoundError:
+            reference = None
+        pages.append((image_path, Image.open(image_path).convert("RGB"), reference))
+    return pages
+
+
+async def run_ocr(chain, images: list[dict]) -> tuple[str, float]:
+    start = time.perf_counter()
+    text = await chain.ainvoke(images)
+    return text, (time.perf_counter() - start) * 1000
+
+
+def summarize(results: list[dict]) -> dict:
+    """
+    Aggregates the page results of one encoding.
+    """
+    payloads = [result["payload_bytes"] for result in results]
+    summary = {
+        "pages": len(results),
+        "payload_bytes_total": int(np.sum(payloads)),
+        "payload_bytes_mean": float(np.mean(payloads)),
+        "images": int(sum(result["images"] for result in results)),
+        "encode": percentiles([result["encode_ms"] for result in results])
+    }
+    latencies = [result["ocr_ms"] for result in results if "ocr_ms" in result]
+    if latencies:
+        summary["ocr"] = percentiles(latencies)
+    recalls = [result["word_recall"] for result in results if result.get("word_recall") is not None]
+    if recalls:
+        summary["word_recall_mean"] = float(np.mean(recalls))
+    return summary
+
+
+async def benchmark(args: argparse.Namespace) -> dict:
+    """
+    Encodes (and OCRs) every sample page with both encodings.
+
+    Returns:
+        (dict): The benchmark report.
+    """
+    pages = await load_pages(args.pdfs, args.images, args.max_pages)
+    encodings = {
+        "legacy": legacy_encoding,
+        "adaptive": lambda image: encode_page(
+            image,
+            byte_budget=args.byte_budget,
+            image_format=args.format,
+            grayscale=args.grayscale,
+            tiling=args.tiling,
+            density_threshold=args.tile_density
+        )
+    }
+
+    chain = None
+    if args.ocr:
+        # Needs the .env of the application
+        from app.models.image_extract_model import IMAGE_EXTRACTION
+        chain = IMAGE_EXTRACTION().image_extraction_chain()
+
+    results = {name: [] for name in encodings}
+    for page_name, image, reference in pages:
+        for name, encode in encodings.items():
+            start = time.perf_counter()
+            images = encode(image)
+            result = {
+                "page": page_name,
+                "encode_ms": (time.perf_counter() - start) * 1000,
+                "images": len(images),
+                "payload_bytes": sum(len(encoded["data"]) for encoded in images),
+                "formats": [encoded["format"] for encoded in images]
+            }
+            if chain is not None:
+                text, result["ocr_ms"] = await run_ocr(chain, images)
+                if reference:
+                    result["word_recall"] = word_recall(reference, text)
+            results[name].append(result)
+        image.close()
+
+    report = {"encodings": {name: summarize(page_results) for name, page_results in results.items() if page_results}}
+    if results["legacy"]:
+        report["payload_ratio"] = report["encodings"]["adaptive"]["payload_bytes_total"] / report["encodings"]["legacy"]["payload_bytes_total"]
+    report["pages"] = results
+    return report
+
+
+def main(argv: list = None) -> dict:
+    """
+    Runs the benchmark, prints the JSON report and writes it to --output if given.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (dict): The benchmark report.
+    """
+    parser = argparse.ArgumentParser(description="Compare the adaptive OCR image encoding with the fixed 800x800 PNG encoding.")
+    parser.add_argument("--pdfs", nargs="*", default=[], help="Born-digital PDFs, their text layer is the reference text")
+    parser.add_argument("--images", nargs="*", default=[], help="Page images, with their reference text in <image>.txt")
+    parser.add_argument("--max-pages", type=int, default=20, help="Pages taken from each PDF")
+    parser.add_argument("--ocr", action="store_true", help="Send the pages to the vision deployment of .env")
+    parser.add_argument("--byte-budget", type=int, default=200000)
+    parser.add_argument("--format", choices=["auto", "png", "jpeg", "webp"], default="auto")
+    parser.add_argument("--grayscale", choices=["auto", "true", "false"], default="auto")
+    parser.add_argument("--tiling", choices=["auto", "false"], default="auto")
+    parser.add_argument("--tile-density", type=float, default=0.12)
+    parser.add_argument("--output", default=None, help="Path of the JSON report")
+    args = parser.parse_args(argv)
+    if not args.pdfs and not args.images:
+        parser.error("give sample pages with --pdfs or --images")
+
+    report = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    print(json.dumps({key: value for key, value in report.items() if key != "pages"}, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
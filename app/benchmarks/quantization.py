@@ -0,0 +1,157 @@
+"""
+Quantization Benchmark
+Compares the storage modes of FAISS_DB on synthetic vectors (no network): memory and disk size of the
+index, single-query search latency and recall@k against exact flat search.
+
+The vectors are clustered and have a low intrinsic dimension, like real embeddings (see synthetic_vectors).
+Queries are held out from the stored vectors.
+
+Usage:
+    python -m app.benchmarks.quantization --documents 50000 --dimensions 1536 --modes flat sq_fp16 sq_int8 pq
+"""
+
+import os
+import gc
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import faiss
+
+from app.models.index_factory import INDEX_TYPES, build_index, configure_search
+
+
+def synthetic_vectors(count: int, dimensions: int, clusters: int = 100, rank: int = 64, seed: int = 0) -> np.ndarray:
+    """
+    Draws float32 vectors around random cluster centres, varying along a low-rank subspace plus a little
+    isotropic noise. Like real embeddings they have a low intrinsic dimension; uniform or isotropic noise
+    would make every neighbour nearly equidistant and penalise all quantizers unrealistically.
+
+    Args:
+        count (int): Number of vectors.
+        dimensions (int): Dimension of the vectors.
+        clusters (int): Number of cluster centres.
+        rank (int): Dimension of the subspace the vectors vary in.
+        seed (int): Random seed.
+
+    Returns:
+        (np.ndarray): (count, dimensions) float32 vectors.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimensions), dtype=np.float32)
+    basis = rng.standard_normal((rank, dimensions), dtype=np.float32) / np.sqrt(rank)
+    vectors = centres[rng.integers(0, clusters, count)]
+    vectors += rng.standard_normal((count, rank), dtype=np.float32) @ basis
+    vectors += 0.05 * rng.standard_normal((count, dimensions), dtype=np.float32)
+    return vectors
+
+
+def benchmark_mode(
+        mode: str,
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        exact_rows: np.ndarray,
+        k: int,
+        directory: str,
+        **index_params
+        ) -> dict:
+    """
+    Builds, saves and reloads one index type and measures it.
+
+    Args:
+        mode (str): One of INDEX_TYPES.
+        vectors (np.ndarray): Stored vectors.
+        queries (np.ndarray): Query vectors.
+        exact_rows (np.ndarray): Exact top-k rows of each query.
+        k (int): Number of neighbours.
+        directory (str): Directory for the index file.
+        index_params: nlist, nprobe, pq_m, hnsw_m, ef_search.
+
+    Returns:
+        (dict): build_s, memory_mb (size of the index structures held in memory), disk_mb,
+            search_ms_p50 / search_ms_p99 and recall@k.
+    """
+    start = time.perf_counter()
+    index = build_index(vectors, index_type=mode, **index_params)
+    build_seconds = time.perf_counter() - start
+
+    index_path = os.path.join(directory, f"{mode}.faiss")
+    faiss.write_index(index, index_path)
+    del index
+    gc.collect()
+
+    index = faiss.read_index(index_path)
+    # Query-time parameters are not persisted in the file
+    index = configure_search(index, nprobe=index_params.get("nprobe"), ef_search=index_params.get("ef_search"))
+
+    latencies = []
+    found_rows = np.empty((len(queries), k), dtype=np.int64)
+    for position, query in enumerate(queries):
+        start = time.perf_counter()
+        _, rows = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found_rows[position] = rows[0]
+
+    hits = sum(len(set(exact) & set(found)) for exact, found in zip(exact_rows, found_rows))
+    report = {
+        "index": type(faiss.downcast_index(index)).__name__,
+        "build_s": build_seconds,
+        "memory_mb": faiss.serialize_index(index).nbytes / 1024 ** 2,
+        "disk_mb": os.path.getsize(index_path) / 1024 ** 2,
+        "search_ms_p50": float(np.percentile(latencies, 50)),
+        "search_ms_p99": float(np.percentile(latencies, 99)),
+        f"recall@{k}": hits / float(k * len(queries))
+    }
+    del index
+    os.remove(index_path)
+    gc.collect()
+    return report
+
+
+def main(argv: list = None) -> dict:
+    """
+    Runs the benchmark and prints a JSON report.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (dict): The benchmark report.
+    """
+    parser = argparse.ArgumentParser(description="Compare memory, disk, latency and recall of the FAISS_DB storage modes.")
+    parser.add_argument("--documents", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", choices=INDEX_TYPES, default=["flat", "sq_fp16", "sq_int8", "pq"])
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    vectors = synthetic_vectors(args.documents + args.queries, args.dimensions)
+    vectors, queries = vectors[:args.documents], vectors[args.documents:]
+
+    exact_index = faiss.IndexFlatL2(args.dimensions)
+    exact_index.add(vectors)
+    _, exact_rows = exact_index.search(queries, args.k)
+    del exact_index
+
+    report = {"documents": args.documents, "dimensions": args.dimensions, "queries": args.queries, "modes": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            report["modes"][mode] = benchmark_mode(
+                mode, vectors, queries, exact_rows, args.k, directory,
+                nlist=args.nlist, nprobe=args.nprobe, pq_m=args.pq_m, hnsw_m=args.hnsw_m, ef_search=args.ef_search
+            )
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
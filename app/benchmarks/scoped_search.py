@@ -0,0 +1,100 @@
+"""
+Scoped Search Check
+Checks that gu_id-scoped searches (file-specific chats, shard queries) return k hits, ranked like exact
+search over the scoped pages, for every index type of FAISS_DB. Synthetic clustered vectors, no network.
+
+IVF probes and HNSW walks only reach the rows near the query, so a scope enforced by an ID selector alone
+returns few or no hits on those indexes; this check fails (exit code 1) if any scoped query comes back short.
+
+Usage:
+    python -m app.benchmarks.scoped_search --documents 50000 --dimensions 128 --scope-pages 20 --k 6
+"""
+
+import sys
+import json
+import argparse
+
+import numpy as np
+import faiss
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.models.vectorstore import FAISS_DB
+from app.models.index_factory import INDEX_TYPES
+from app.benchmarks.quantization import synthetic_vectors
+
+
+def check_index_type(index_type: str, vectors: np.ndarray, queries: np.ndarray, args: argparse.Namespace) -> dict:
+    """
+    Builds a store of one index type and runs one scoped query per file scope.
+
+    Returns:
+        (dict): Queries, queries with fewer than k hits, and mean overlap with the exact top k of the scope.
+    """
+    vectorstore = FAISS_DB(
+        embedding_function=DeterministicFakeEmbedding(size=args.dimensions),
+        index_type=index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        pq_m=args.pq_m
+    )
+    vectorstore.load()
+    # Pages of a file are scattered over the clusters, as different topics of one report are
+    files = len(vectors) // args.scope_pages
+    gu_ids = [f"file-{row % files}" for row in range(len(vectors))]
+    vectorstore.add_embeddings(
+        text_embeddings=[(f"page {row}", vector) for row, vector in enumerate(vectors)],
+        metadatas=[{"source": f"/synthetic/{gu_id}.pdf", "gu_id": gu_id} for gu_id in gu_ids],
+        ids=None
+    )
+    vectorstore.rebuild_index(index_type)
+
+    short, overlaps = 0, []
+    for query_number, query in enumerate(queries):
+        gu_id = f"file-{query_number % files}"
+        hits = vectorstore.search_ids_by_vector(query, k=args.k, gu_ids=[gu_id])
+        if len(hits) < args.k:
+            short += 1
+
+        scope_ids = vectorstore.gu_id_index[gu_id]
+        scope_rows = np.array([vectorstore.id_to_row[doc_id] for doc_id in scope_ids], dtype=np.int64)
+        _, positions = faiss.knn(query[None, :], vectors[scope_rows], args.k)
+        exact_ids = {scope_ids[position] for position in positions[0]}
+        overlaps.append(len(exact_ids & {doc_id for doc_id, _ in hits}) / args.k)
+
+    return {"queries": len(queries), "short_results": short, "exact_overlap": float(np.mean(overlaps))}
+
+
+def main(argv: list = None) -> dict:
+    """
+    Runs the check for each index type, prints the JSON report and exits with 1 if a scoped query was short.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (dict): Index type -> results.
+    """
+    parser = argparse.ArgumentParser(description="Check that gu_id-scoped searches return k hits for every index type.")
+    parser.add_argument("--documents", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=128)
+    parser.add_argument("--scope-pages", type=int, default=20, help="Pages per gu_id")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--pq-m", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    vectors = synthetic_vectors(args.documents + args.queries, args.dimensions)
+    vectors, queries = vectors[:args.documents], vectors[args.documents:]
+
+    report = {index_type: check_index_type(index_type, vectors, queries, args) for index_type in args.index_types}
+    print(json.dumps(report, indent=2))
+    if any(results["short_results"] for results in report.values()):
+        sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
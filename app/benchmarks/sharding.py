@@ -0,0 +1,160 @@
+"""
+Sharding Benchmark
+Measures search throughput of SHARDED_FAISS_DB against the number of shards, on a synthetic corpus
+(no network: vectors are synthetic and the embedding function is a deterministic fake).
+
+For each shard count the same corpus is loaded into local shard workers, then --clients threads send
+searches for --seconds, like concurrent chat requests. Shard count 0 is the unsharded, in-process FAISS_DB.
+
+Shards only add throughput when each worker process has a CPU of its own. Run it on a machine with at least
+as many cores as the largest shard count (cpu_count is in the report): with fewer, it measures the IPC
+overhead of sharding, not its scaling.
+
+Usage:
+    python -m app.benchmarks.sharding --documents 200000 --dimensions 1536 --shards 0 1 2 4 --clients 8
+"""
+
+import gc
+import os
+import json
+import time
+import argparse
+import threading
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.models.vectorstore import FAISS_DB
+from app.models.sharded_vectorstore import SHARDED_FAISS_DB
+from app.benchmarks.quantization import synthetic_vectors
+from app.benchmarks.vectorstore_ops import percentiles, synthetic_metadata, synthetic_texts
+
+
+def build_store(shards: int, documents: int, dimensions: int, pages_per_file: int, batch_size: int = 20000):
+    """
+    Creates an in-memory store (sharded if shards > 0) and fills it with synthetic pages.
+
+    Returns:
+        (FAISS_DB | SHARDED_FAISS_DB): The loaded store.
+    """
+    embedding_function = DeterministicFakeEmbedding(size=dimensions)
+    if shards:
+        vectorstore = SHARDED_FAISS_DB(embedding_function=embedding_function, shards=shards)
+    else:
+        vectorstore = FAISS_DB(embedding_function=embedding_function)
+    vectorstore.load()
+
+    rng = np.random.default_rng(0)
+    for start in range(0, documents, batch_size):
+        count = min(batch_size, documents - start)
+        vectors = synthetic_vectors(count, dimensions, seed=start)
+        texts = synthetic_texts(start, count, rng)
+        metadatas = [synthetic_metadata(start + i, pages_per_file) for i in range(count)]
+        vectorstore.add_embeddings(text_embeddings=list(zip(texts, vectors)), metadatas=metadatas, ids=None)
+    return vectorstore
+
+
+def run_clients(search, queries: list, clients: int, seconds: float) -> dict:
+    """
+    Runs searches from concurrent threads for a fixed time.
+
+    Args:
+        search: Called with one query.
+        queries (list): Queries, cycled through by each client.
+        clients (int): Number of concurrent threads.
+        seconds (float): Duration of the run.
+
+    Returns:
+        (dict): searches, queries_per_s and latency percentiles.
+    """
+    latencies = [[] for _ in range(clients)]
+    deadline = time.perf_counter() + seconds
+
+    def client(number: int) -> None:
+        position = number
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            search(queries[position % len(queries)])
+            latencies[number].append((time.perf_counter() - start) * 1000)
+            position += clients
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [latency for client_latencies in latencies for latency in client_latencies]
+    return {"searches": len(all_latencies), "queries_per_s": len(all_latencies) / elapsed, **percentiles(all_latencies)}
+
+
+def main(argv: list = None) -> dict:
+    """
+    Runs the benchmark and prints a JSON report.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (dict): The benchmark report.
+    """
+    parser = argparse.ArgumentParser(description="Measure search throughput of the sharded vectorstore against the number of shards.")
+    parser.add_argument("--documents", type=int, default=200000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 1, 2, 4], help="Shard counts; 0 is the unsharded FAISS_DB")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent searching threads")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--pages-per-file", type=int, default=20)
+    parser.add_argument("--output", default=None, help="Path of the JSON report")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    query_vectors = synthetic_vectors(args.queries, args.dimensions, seed=args.documents + 1)
+    query_texts = [f"code{page} w1 w2" for page in rng.integers(0, args.documents, args.queries)]
+    queries = list(zip(query_texts, query_vectors))
+
+    report = {
+        "documents": args.documents,
+        "dimensions": args.dimensions,
+        "clients": args.clients,
+        "k": args.k,
+        "cpu_count": os.cpu_count(),
+        "shards": {}
+    }
+    for shards in args.shards:
+        start = time.perf_counter()
+        vectorstore = build_store(shards, args.documents, args.dimensions, args.pages_per_file)
+        shard_report = {"build_s": time.perf_counter() - start}
+
+        shard_report["vector"] = run_clients(
+            lambda query: vectorstore.similarity_search_by_vector(query[1], k=args.k), queries, args.clients, args.seconds
+        )
+        shard_report["hybrid"] = run_clients(
+            lambda query: vectorstore.hybrid_search_by_vector(query[0], query[1], k=args.k), queries, args.clients, args.seconds
+        )
+        report["shards"][str(shards)] = shard_report
+
+        if shards:
+            vectorstore.close()
+        del vectorstore
+        gc.collect()
+
+    baseline = report["shards"].get(str(args.shards[0]))
+    for shard_report in report["shards"].values():
+        for mode in ("vector", "hybrid"):
+            shard_report[mode]["speedup"] = shard_report[mode]["queries_per_s"] / baseline[mode]["queries_per_s"]
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
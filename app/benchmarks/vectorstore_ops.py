@@ -0,0 +1,275 @@
+"""
+Vectorstore Operations Benchmark
+Measures the hot paths of FAISS_DB on synthetic corpora (no network: vectors are synthetic and the
+embedding function is a deterministic fake): load, save_local, aadd_documents throughput, delete,
+get_files_in_vectorstore, get_embeddings_and_ids and search latency (p50 / p99) at several k, for
+vector, hybrid and gu_id-scoped searches.
+
+Corpora are made of files of --pages-per-file pages, like uploaded PDFs. Page texts are drawn from a
+Zipf-distributed vocabulary plus a code token, so that the BM25 index has realistic posting lists.
+The report is written as JSON (--output), to compare runs between releases.
+
+Usage:
+    python -m app.benchmarks.vectorstore_ops --sizes 10000 100000 1000000 --dimensions 1536 --output vectorstore_ops.json
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.models.vectorstore import FAISS_DB
+from app.models.index_factory import INDEX_TYPES
+from app.models.mmap_store import resident_memory_mb
+from app.benchmarks.quantization import synthetic_vectors
+
+VOCABULARY_SIZE = 20000
+WORDS_PER_PAGE = 40
+
+
+def percentiles(latencies: list) -> dict:
+    """
+    Summarizes latencies in milliseconds.
+
+    Returns:
+        (dict): p50_ms, p99_ms and count.
+    """
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "count": len(latencies)
+    }
+
+
+def synthetic_texts(start: int, count: int, rng: np.random.Generator) -> list[str]:
+    """
+    Draws page texts from a Zipf-distributed vocabulary, each with a code token unique to the page's file.
+
+    Args:
+        start (int): Number of the first page.
+        count (int): Number of pages.
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        (list): The page texts.
+    """
+    words = np.minimum(rng.zipf(1.3, (count, WORDS_PER_PAGE)), VOCABULARY_SIZE)
+    return [
+        f"code{start + i} " + " ".join(f"w{word}" for word in page_words)
+        for i, page_words in enumerate(words)
+    ]
+
+
+def synthetic_metadata(page_number: int, pages_per_file: int, prefix: str = "file") -> dict:
+    """
+    Gets the metadata of a synthetic page, grouped into files of pages_per_file pages.
+    """
+    file_number = page_number // pages_per_file
+    return {
+        "source": f"/synthetic/{prefix}-{file_number}.pdf",
+        "page": page_number % pages_per_file + 1,
+        "LinkingUri": "",
+        "date": "2024/1/1",
+        "gu_id": f"{prefix}-{file_number}"
+    }
+
+
+def build_store(vectorstore: FAISS_DB, documents: int, dimensions: int, pages_per_file: int, batch_size: int = 50000) -> None:
+    """
+    Fills an empty store with synthetic pages through add_embeddings (no embedding calls).
+
+    Args:
+        vectorstore (FAISS_DB): The loaded, empty store.
+        documents (int): Number of pages.
+        dimensions (int): Dimension of the vectors.
+        pages_per_file (int): Number of pages per gu_id.
+        batch_size (int): Number of pages added at a time.
+    """
+    rng = np.random.default_rng(0)
+    for start in range(0, documents, batch_size):
+        count = min(batch_size, documents - start)
+        vectors = synthetic_vectors(count, dimensions, seed=start)
+        texts = synthetic_texts(start, count, rng)
+        metadatas = [synthetic_metadata(start + i, pages_per_file) for i in range(count)]
+        vectorstore.add_embeddings(text_embeddings=list(zip(texts, vectors)), metadatas=metadatas, ids=None)
+
+
+def benchmark_search(vectorstore: FAISS_DB, dimensions: int, k_values: list, queries: int, pages_per_file: int, documents: int) -> dict:
+    """
+    Measures single-query latency of vector, hybrid and gu_id-scoped searches at each k.
+
+    Returns:
+        (dict): k -> mode -> percentiles.
+    """
+    rng = np.random.default_rng(1)
+    query_vectors = synthetic_vectors(queries, dimensions, seed=documents + 1)
+    query_texts = [f"code{page} " + " ".join(f"w{word}" for word in rng.zipf(1.3, 6)) for page in rng.integers(0, documents, queries)]
+    scopes = [[f"file-{file_number}"] for file_number in rng.integers(0, max(1, documents // pages_per_file), queries)]
+
+    report = {}
+    for k in k_values:
+        latencies = {"vector": [], "hybrid": [], "scoped": []}
+        for vector, text, scope in zip(query_vectors, query_texts, scopes):
+            start = time.perf_counter()
+            vectorstore.similarity_search_by_vector(vector, k=k)
+            latencies["vector"].append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            vectorstore.hybrid_search_by_vector(text, vector, k=k)
+            latencies["hybrid"].append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            vectorstore.similarity_search_by_vector(vector, k=k, gu_ids=scope)
+            latencies["scoped"].append((time.perf_counter() - start) * 1000)
+
+        report[str(k)] = {mode: percentiles(values) for mode, values in latencies.items()}
+    return report
+
+
+async def benchmark_size(documents: int, args: argparse.Namespace, directory: str) -> dict:
+    """
+    Builds a store of one size, persists it, reloads it and measures each operation on it.
+
+    Args:
+        documents (int): Number of pages of the corpus.
+        args (argparse.Namespace): Parsed command line arguments.
+        directory (str): Persist directory of the store.
+
+    Returns:
+        (dict): The measurements of this size.
+    """
+    embedding_function = DeterministicFakeEmbedding(size=args.dimensions)
+    store_params = {
+        "embedding_function": embedding_function,
+        "persist_directory": directory,
+        "index_type": args.index_type,
+        "docstore_type": args.docstore,
+        # Keep background merges out of the timed saves; the store is merged explicitly below
+        "merge_threshold": 1000000
+    }
+    report = {"documents": documents, "rss_mb_start": resident_memory_mb()}
+
+    vectorstore = FAISS_DB(**store_params)
+    vectorstore.load()
+    start = time.perf_counter()
+    build_store(vectorstore, documents, args.dimensions, args.pages_per_file)
+    report["build_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorstore.merge(background=False)
+    report["merge_s"] = time.perf_counter() - start
+    del vectorstore
+    gc.collect()
+
+    start = time.perf_counter()
+    vectorstore = FAISS_DB(**store_params)
+    vectorstore.load()
+    report["load_s"] = time.perf_counter() - start
+    report["rss_mb_after_load"] = resident_memory_mb()
+
+    latencies = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        await vectorstore.get_files_in_vectorstore()
+        latencies.append((time.perf_counter() - start) * 1000)
+    report["get_files_in_vectorstore"] = percentiles(latencies)
+
+    rng = np.random.default_rng(2)
+    files = max(1, documents // args.pages_per_file)
+    latencies = []
+    for file_number in rng.integers(0, files, args.repeats):
+        start = time.perf_counter()
+        await vectorstore.get_embeddings_and_ids(f"file-{file_number}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    report["get_embeddings_and_ids"] = percentiles(latencies)
+
+    report["search"] = benchmark_search(vectorstore, args.dimensions, args.k, args.queries, args.pages_per_file, documents)
+
+    new_documents = [
+        Document(page_content=text, metadata=synthetic_metadata(i, args.pages_per_file, prefix="added"))
+        for i, text in enumerate(synthetic_texts(documents, args.add_documents, rng))
+    ]
+    start = time.perf_counter()
+    await vectorstore.aadd_documents(new_documents)
+    seconds = time.perf_counter() - start
+    report["aadd_documents"] = {"documents": len(new_documents), "seconds": seconds, "documents_per_s": len(new_documents) / seconds}
+
+    start = time.perf_counter()
+    vectorstore.save_local()
+    report["save_local_s"] = time.perf_counter() - start
+
+    latencies = []
+    for file_number in rng.choice(files, size=min(args.deletes, files), replace=False):
+        start = time.perf_counter()
+        await vectorstore.delete(f"file-{file_number}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    report["delete"] = percentiles(latencies)
+
+    report["rss_mb_end"] = resident_memory_mb()
+    # Let a compaction started by the deletes finish before the directory is removed
+    for thread in (vectorstore._compact_thread, vectorstore._merge_thread):
+        if thread is not None:
+            thread.join()
+    return report
+
+
+def main(argv: list = None) -> dict:
+    """
+    Runs the benchmark, prints the JSON report and writes it to --output if given.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (dict): The benchmark report.
+    """
+    parser = argparse.ArgumentParser(description="Measure load, save, add, delete, read and search latency of FAISS_DB.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--docstore", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--pages-per-file", type=int, default=20)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--queries", type=int, default=200, help="Searches per k and search mode")
+    parser.add_argument("--repeats", type=int, default=50, help="Calls of get_files_in_vectorstore and get_embeddings_and_ids")
+    parser.add_argument("--add-documents", type=int, default=1000, help="Pages added with aadd_documents")
+    parser.add_argument("--deletes", type=int, default=20, help="Files deleted with delete")
+    parser.add_argument("--output", default=None, help="Path of the JSON report")
+    args = parser.parse_args(argv)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "faiss": faiss.__version__,
+        "dimensions": args.dimensions,
+        "index_type": args.index_type,
+        "docstore": args.docstore,
+        "sizes": {}
+    }
+    for documents in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            report["sizes"][str(documents)] = asyncio.run(benchmark_size(documents, args, os.path.join(directory, "store")))
+        gc.collect()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,7 @@ from app.info import db_info
 from sqlalchemy import text
 
 from app import utils
-from app.info.db_info import FileInfo,get_db,ChatInfo,UploadFileInfo
+from app.info.db_info import FileInfo,get_db,ChatInfo,UploadFileInfo,PageInfo
 from app.models.vectorstore import FAISS_DB
 from app.models.prompts import HISTORY_PROMPT, CONTEXT_PROMPT, ROUTE_PROMPT_RENAULT, NOT_ANSWERABLE_PROMPT, SQL_PROMPT																   
 from app.info.sharepoint_info import SP_RENAULT, SP_LIBRARY_TITLE_UP
@@ -31,6 +31,7 @@ from app.info.agent_info import GraphState, RouteQuery
 from app.logger import logging 
 from app.exception import InternalError,get_error_message_detail
 from app.components.file_handler import get_sharepoint_context
+from app.components.embedder import PAGE_DONE
 
 
 SP_UPLOADS_BASE_PATH = f"{SP_LIBRARY_TITLE_UP}/{SP_RENAULT}"
@@ -133,7 +134,8 @@ def create_chain(
         chat_history: list = None,
         chat_model: BaseChatOpenAI = utils.CHAT_MODEL,
         history_prompt: ChatPromptTemplate = HISTORY_PROMPT,
-        context_prompt: ChatPromptTemplate = CONTEXT_PROMPT
+        context_prompt: ChatPromptTemplate = CONTEXT_PROMPT,
+        gu_ids: list = None
         ) -> tuple[RunnableSerializable[Any, BaseMessage], list]:
     """
     Creates an async chain which modifies question using chat history, retrieves relevant documents, and gets a response for the query.
@@ -144,6 +146,7 @@ def create_chain(
         chat_model (BaseChatOpenAI): OpenAI chat model that is used to create the chain.
         history_prompt (ChatPromptTemplate): The prompt used to change the question using chat history.
         context_prompt (ChatPromptTemplate): The prompt used to get answer to the question based on the retrieved context.
+        gu_ids (list): If passed, retrieval is restricted to the pages of these files.
  
     Returns:
         (chain, list): Langchain chain which retrieves documents and gives responses, A list of chat history.
@@ -155,8 +158,8 @@ def create_chain(
         if chat_history is None:
             chat_history = [HumanMessage(content="Hi"), AIMessage(content="Hi, How can I assist you")]
 
-        # Define retriever
-        retriever = vectorstore.vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 10})
+        # Define retriever (hybrid BM25 + vector retrieval keeps exact-token matches, so fewer pages are needed)
+        retriever = vectorstore.as_retriever(k=utils.RETRIEVAL_K, gu_ids=gu_ids)
  
         # Get text from gpt response
         def get_content_from_response(response):
@@ -193,7 +196,7 @@ def create_chain(
             | RunnableLambda(print_restructured_qn)
             | retrieval_chain
         )
-        logging.info(f"Chain created with vectorstore : {vectorstore.persist_directory}")
+        logging.info(f"Chain created with vectorstore : {vectorstore.persist_directory}, files : {gu_ids if gu_ids is not None else 'all'}")
  
         return custom_chain, chat_history
     
@@ -205,76 +208,37 @@ def create_chain(
 
 ##################################### SPECIFIC ########################################
 
-# Copying Embeddings
-async def single_file_loader_embedding(
-        gu_id: UUID4,
-        vectorstore: FAISS_DB,
-        local_faiss: FAISS_DB
-        ) -> FAISS_DB:
-    """
-    Copies embeddings of a single file from a previously persisted vectorstore into another vectorstore.
-
-    Parameters:
-        gu_id (UUID4): The uuid of the file to load.
-        vectrorstore (faiss db): The vectorstore from which file to be loaded.
-        local_faiss (faiss db): Local vectorstore created for loading the selected file.
-
-    Returns:
-        (faiss db) : In memory faiss db with the specified file only.
-    """
-    try:
-        # Get a list of gu_ids of files present inside the local_faiss
-        _, gu_id_list = await local_faiss.get_files_in_vectorstore()
-        
-        logging.info("Files copying to new vectorstore")
-        # Add embeddings of the file to local_faiss if the file does not exist in it.
-        if gu_id not in gu_id_list:
-
-            # get embeddings from the vectorstore where embeddings of the file is present.
-            embeddings, metadatas, ids = await vectorstore.get_embeddings_and_ids(gu_id)
-            
-            # Add the data of the specified file into local_faiss vectorstore
-            if embeddings and metadatas and ids:
-                local_faiss.vectorstore.add_embeddings(text_embeddings=embeddings, metadatas=metadatas, ids=ids)
-                logging.info(f"Files copied to the new vectorstore : {set(metadata['source'] for metadata in metadatas)}")
-
-        return local_faiss
-
-    except Exception as e:
-        error_message = get_error_message_detail(e, sys)
-        logging.error(error_message)
-        raise InternalError("An error occurred while creating an in memory vectorstore with single file : " + str(e))
-
-
 async def create_specific_chain(
-        gu_id: str, 
-        vectorstore: FAISS_DB, 
-        persist_path: str
+        gu_ids: str | list,
+        vectorstore: FAISS_DB,
+        chat_history: list = None
         ) -> tuple[RunnableSerializable[Any, BaseMessage], list]:
     """
-    Loads embeddings of a the specified file only into another vectorstore and creates a chain to get answer from that bd only.
+    Creates a chain to get answers from the specified file(s) only.
+
+    Retrieval runs on the shared vectorstore restricted to the pages of the files,
+    so no embeddings are copied and no per-chat vectorstore is created.
 
     Parameters:
-        gu_id (str): The guid of the file to load.
-        vectrorstore (faiss db): The vectorstore from which file to be loaded.
-        persist_path (str): Path to which the single file vectorstore is to be saved.
+        gu_ids (str | list): The gu_id of the file, or a list of gu_ids for a multi-file scope.
+        vectrorstore (faiss db): The vectorstore in which the files are embedded.
+        chat_history (list): Chat history.
 
     Returns:
         (chain, list): A chain for retrieving relevent docs and answering the question, A list of chat history.
     """
 
     try:
-        # Create new vectorstore to which the embeddings of the specified files are copied
-        local_faiss = FAISS_DB(embedding_function=utils.EMBEDDINGS, persist_directory=persist_path)
-        local_faiss.load()
-        logging.info(f"New vectorstore created at : {persist_path}")
+        if not isinstance(gu_ids, (list, tuple, set)):
+            gu_ids = [gu_ids]
+        gu_ids = [str(gu_id) for gu_id in gu_ids]
 
-        # Copy embeddings of the file to the new vectorstore
-        local_faiss = await single_file_loader_embedding(gu_id=gu_id, vectorstore=vectorstore, local_faiss=local_faiss)
-        local_faiss.save_local()
+        missing_gu_ids = [gu_id for gu_id in gu_ids if gu_id not in vectorstore.gu_id_index]
+        if missing_gu_ids:
+            logging.warning(f"Files not found in vectorstore {vectorstore.persist_directory} : {missing_gu_ids}")
 
-        # Create chain using the new vectorstore
-        retriever_chain,chat_history=create_chain(vectorstore=local_faiss)
+        # Create chain restricted to the files
+        retriever_chain, chat_history = create_chain(vectorstore=vectorstore, chat_history=chat_history, gu_ids=gu_ids)
         return retriever_chain, chat_history
 
     except Exception as e:
@@ -284,14 +248,24 @@ async def create_specific_chain(
     
 
 
-def embed_failure_cleaning(db: Session,chatid:UUID4 = None) -> None:
+def embed_failure_cleaning(db: Session,chatid:UUID4 = None) -> bool:
     """
     Remove saved data from DB if embedding fails.
+    The upload is kept if OCR pages of its files were checkpointed: /embed retried with the same chatid
+    and gu_id then resumes from those pages instead of starting over.
     Parameters:
         db (Session)    : SQLAlchemy database session used to query the FileInfo table.
         chatid (UUID4)  : The chat ID
+    Returns:
+        (bool): True if the data was removed, False if it was kept for a retry.
     """
 
+    gu_ids = db.query(UploadFileInfo.file_id).filter(UploadFileInfo.chat_id == chatid)
+    resumable = db.query(PageInfo.gu_id).filter(PageInfo.gu_id.in_(gu_ids), PageInfo.status == PAGE_DONE).first()
+    if resumable:
+        logging.info(f"Keeping the upload of chat {chatid} after embedding failure : extracted pages are checkpointed, /embed can resume")
+        return False
+
     logging.info(f"Removing saved chat data for {chatid} due to embedding failure")
     # 1. Delete from SharePoint
     try:
@@ -313,24 +287,29 @@ def embed_failure_cleaning(db: Session,chatid:UUID4 = None) -> None:
     except Exception as fs_err:
         logging.warning(f"Failed to delete local folder {chatid}: {fs_err}")
 
-    # 3. Delete from FileInfo
+    # 3. Delete the page checkpoints (failed pages only) of the uploaded files
+    deleted_count = db.query(PageInfo).filter(PageInfo.gu_id.in_(gu_ids)).delete(synchronize_session=False)
+    logging.info(f"Deleted {deleted_count} record(s) from PageInfo table for chat ID {chatid}")
+
+    # 4. Delete from FileInfo
     deleted_count = db.query(FileInfo).filter(FileInfo.gu_id.in_(
         db.query(UploadFileInfo.file_id).filter(UploadFileInfo.chat_id == chatid)
     )).filter(FileInfo.source == "uploaded").delete(synchronize_session=False)
     logging.info(f"Deleted {deleted_count} record(s) from FileInfo table for chat ID {chatid}")
 
-    # 4. Delete from UploadFileInfo
+    # 5. Delete from UploadFileInfo
     deleted_count = db.query(UploadFileInfo).filter(UploadFileInfo.chat_id == chatid).delete(synchronize_session=False)
     logging.info(f"Deleted {deleted_count} record(s) from UploadFileInfo table for chatID {chatid}")
 
-    # 5. Delete from ChatInfo
+    # 6. Delete from ChatInfo
     deleted_count = db.query(ChatInfo).filter(ChatInfo.chat_id == chatid).delete(synchronize_session=False)
     logging.info(f"Deleted {deleted_count} record(s) from ChatInfo table for chatID {chatid}")
 
-    # 6. Remove from chat_sessions
+    # 7. Remove from chat_sessions
     if chatid in utils.chat_sessions:
         del utils.chat_sessions[chatid]
         logging.info(f"Removed chat_id {chatid} from chat_sessions")
+    return True
 
 
 
@@ -425,8 +404,7 @@ def create_postgres_chain(
 ########################################
 async def create_renault_agent(
     existing_file_db: Any = None,
-    gu_id: UUID4 = None,
-    persist_path: str = None,
+    gu_ids: list = None,
     chat_history: list = None,
     chat_model: BaseChatOpenAI = utils.CHAT_MODEL,
     not_answerable_prompt: ChatPromptTemplate = NOT_ANSWERABLE_PROMPT,
@@ -437,6 +415,8 @@ async def create_renault_agent(
     - vectorstore (file-specific) if available
     - Postgres (aggregate queries)
     - not_answerable (fallback)
+
+    If gu_ids are passed, file-specific retrieval is restricted to those files of existing_file_db.
     """
     try:
         # Init chat history if empty
@@ -446,28 +426,17 @@ async def create_renault_agent(
                 AIMessage(content="Hi, how can I assist you?")
             ]
 
-        # If we have a vectorstore, ensure it's loaded
-        if existing_file_db and gu_id and persist_path:
-            logging.info(f"Creating new vectorstore at {persist_path}")
-            local_faiss = existing_file_db.__class__(
-                embedding_function=utils.EMBEDDINGS,
-                persist_directory=persist_path
-            )
-            local_faiss.load()
-            local_faiss = await single_file_loader_embedding(
-                gu_id, existing_file_db, local_faiss
-            )
-            local_faiss.save_local()
-            existing_file_db = local_faiss
-        elif existing_file_db:
-            logging.info("Using provided vectorstore")
-
         # --- Create chains ---
         file_specific_chain = None
-        if existing_file_db:
-            logging.info("Creating file-specific retrieval chain")
+        if existing_file_db and gu_ids:
+            logging.info(f"Creating file-specific retrieval chain for files : {gu_ids}")
             file_specific_chain, chat_history = await create_specific_chain(
-                gu_id, existing_file_db, persist_path
+                gu_ids, existing_file_db, chat_history
+            )
+        elif existing_file_db:
+            logging.info("Creating retrieval chain with provided vectorstore")
+            file_specific_chain, chat_history = create_chain(
+                vectorstore=existing_file_db, chat_history=chat_history
             )
 
         postgres_chain, _ = create_postgres_chain(chat_history)
@@ -1,13 +1,15 @@
 import sys
 import asyncio
+from functools import partial
 
 from app.models.vectorstore import FAISS_DB
+from app.models.sharded_vectorstore import SHARDED_FAISS_DB
 from app.components.embedder import DATA_LOADER_SP
 from app.info.sharepoint_info import (
     CLIENT_ID, CLIENT_SECRET, SITE_URL, SHAREPOINT_URL, SP_LIBRARY_TITLE, SP_RENAULT
     )
 from app.utils import (
-    RENAULT_DB
+    RENAULT_DB, EMBEDDINGS
 )
 
 from app.logger import logging
@@ -22,11 +24,37 @@ data_loader = DATA_LOADER_SP(
     sharepoint_url=SHAREPOINT_URL
     )
 
+# The API may open RENAULT_DB read-only (FAISS_MMAP), the sync needs a writable copy
+vectorstore = RENAULT_DB
+if RENAULT_DB.read_only:
+    if isinstance(RENAULT_DB, SHARDED_FAISS_DB):
+        VECTORSTORE_CLASS = partial(SHARDED_FAISS_DB, shards=RENAULT_DB.shard_count, addresses=RENAULT_DB.addresses)
+    else:
+        VECTORSTORE_CLASS = FAISS_DB
+
+    vectorstore = VECTORSTORE_CLASS(
+        embedding_function=EMBEDDINGS,
+        persist_directory=RENAULT_DB.persist_directory,
+        index_type=RENAULT_DB.index_type,
+        docstore_type=RENAULT_DB.docstore_type,
+        compact_ratio=RENAULT_DB.compact_ratio,
+        embed_batch_size=RENAULT_DB.embed_params["max_items"],
+        embed_batch_tokens=RENAULT_DB.embed_params["max_tokens"],
+        embed_concurrency=RENAULT_DB.embed_params["max_concurrency"],
+        embed_max_retries=RENAULT_DB.embed_params["max_retries"],
+        dimensions=RENAULT_DB.dimensions,
+        **RENAULT_DB.index_params
+    )
+    vectorstore.load()
+
 asyncio.run(data_loader.data_to_db_sp(
     sp_library_title=SP_LIBRARY_TITLE,
     sp_folder_relative_path=SP_RENAULT,
-    vectorstore=RENAULT_DB,
+    vectorstore=vectorstore,
     source="sharepoint"
 ))
 
+# Write a single base snapshot, which read-only workers open memory-mapped on their next start
+vectorstore.merge(background=False)
+
 
@@ -12,22 +12,36 @@ import os
 import sys
 import shutil
 from io import BytesIO
-from datetime import datetime
+from datetime import datetime, timezone
 import asyncio
 import aiofiles
 import uuid
+import tempfile
+from pathlib import Path
 
-from pdf2image import convert_from_path
+from langchain_core.documents import Document
 
 from app.info import db_info
 from app.models.image_extract_model import IMAGE_EXTRACTION
+from app.models.pdf_rasterizer import pdf_page_count, rasterize_pages
+from app.models.text_layer import TEXT_LAYER, OCR, classify_pages, page_text
+from app.models.ocr_scheduler import INTERACTIVE, BULK
 from app.models.vectorstore import FAISS_DB
+from app.utils import (
+    SYNC_FILE_CONCURRENCY, SYNC_COMMIT_PAGES, SYNC_COMMIT_FILES, SYNC_SCRATCH_DIRECTORY, PAGE_RETRY_ROUNDS, PAGE_MAX_ATTEMPTS,
+    RASTER_WINDOW_PAGES, RASTER_QUEUE_PAGES, RASTER_MAX_SIDE, OCR_PAGE_WORKERS, OCR_BATCH_PAGES,
+    TEXT_LAYER_EXTRACTION, TEXT_LAYER_MIN_CHARACTERS, TEXT_LAYER_MAX_IMAGE_RATIO
+)
 
 from app.logger import logging
 from app.exception import get_error_message_detail
 
 from app.exception import InternalError,BadRequestError
 
+# Status of a page in PageInfo
+PAGE_DONE = "done"
+PAGE_FAILED = "failed"
+
 # SHAREPOINT Specific functions  
 class DATA_LOADER_SP():
     """
@@ -125,9 +139,10 @@ class DATA_LOADER_SP():
 
             libreoffice_path = '/usr/bin/soffice'
             
-            # Run LibreOffice conversion asynchronously
+            # Run LibreOffice conversion asynchronously, with a profile of its own so that conversions can run in parallel
+            profile_uri = Path(os.path.abspath(os.path.join(PDF_folder_path, "libreoffice-profile"))).as_uri()
             process = await asyncio.create_subprocess_exec(
-                libreoffice_path, '--headless', '--convert-to', 'pdf', doc_path, '--outdir', PDF_folder_path,
+                libreoffice_path, f'-env:UserInstallation={profile_uri}', '--headless', '--convert-to', 'pdf', doc_path, '--outdir', PDF_folder_path,
                 stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
             )
 
@@ -147,19 +162,114 @@ class DATA_LOADER_SP():
 
 
 
+    async def extract_ocr_pages(
+            self,
+            pdf_path: str,
+            pages: list[int],
+            file_path: str,
+            linking_uri: str,
+            file_modified_date: str,
+            gu_id: str,
+            priority: int,
+            results: dict,
+            attempts: dict,
+            file_version: str
+            ) -> list[int]:
+        """
+        Asynchronously renders pages of a PDF and extracts their text with the vision model.
+        Pages are rendered window by window (see app/models/pdf_rasterizer.py) into a bounded
+        queue, from which OCR_PAGE_WORKERS workers extract their text: OCR starts with the first window, and
+        at most the current window, the queue and the pages in OCR are held in memory, whatever the page count.
+        A worker sends up to OCR_BATCH_PAGES queued pages in one request (see IMAGE_EXTRACTION.process_images).
+        The outcome of every page is checkpointed, and a failed page does not stop the others.
+
+        Args:
+            pdf_path (str): Local path to the PDF file.
+            pages (list): 0-based indexes of the pages to extract.
+            file_path (str): Original SharePoint file path.
+            linking_uri (str): URI to link the extracted data.
+            file_modified_date (str): The file's last modified date, passed for metadata tracking.
+            gu_id (str): A unique identifier used to trace the file through processing.
+            priority (int): Priority of the OCR requests of the pages.
+            results (dict): Page index -> Document, filled with the extracted pages.
+            attempts (dict): Page index -> number of attempts, incremented for every page extracted.
+            file_version (str): Version of the file the checkpoints are recorded for (see load_page_checkpoints).
+
+        Returns:
+            (list): 0-based indexes of the pages not extracted.
+        """
+        failed_pages = set(pages)
+        extraction = IMAGE_EXTRACTION()
+        queue = asyncio.Queue(maxsize=max(1, RASTER_QUEUE_PAGES))
+        workers = max(1, min(OCR_PAGE_WORKERS, len(pages)))
+
+        async def render() -> None:
+            rendered = rasterize_pages(pdf_path, pages, window_pages=RASTER_WINDOW_PAGES, max_side=RASTER_MAX_SIDE)
+            try:
+                async for i, image in rendered:
+                    await queue.put((i, image))
+            except Exception as e:
+                # Pages not rendered yet stay failed
+                logging.error(f"{file_path} : rendering stopped : {str(e)}")
+            finally:
+                await rendered.aclose()
+                for _ in range(workers):
+                    await queue.put(None)
+
+        async def extract() -> None:
+            stopped = False
+            while not stopped and (item := await queue.get()) is not None:
+                # Pages already rendered join the request, the worker does not wait for more
+                batch = [item]
+                while len(batch) < OCR_BATCH_PAGES and not queue.empty():
+                    if (item := queue.get_nowait()) is None:
+                        stopped = True
+                        break
+                    batch.append(item)
+
+                for i, _ in batch:
+                    attempts[i] = attempts.get(i, 0) + 1
+                try:
+                    documents = await extraction.process_images(
+                        [(i, image, file_path, linking_uri, file_modified_date, gu_id) for i, image in batch], priority=priority
+                    )
+                    for (i, _), document in zip(batch, documents):
+                        results[i] = document
+                        failed_pages.discard(i)
+                        await asyncio.to_thread(
+                            save_page_checkpoint, gu_id, i, file_version, PAGE_DONE, attempts[i], text=document.page_content
+                        )
+                except Exception as e:
+                    for i, _ in batch:
+                        await asyncio.to_thread(save_page_checkpoint, gu_id, i, file_version, PAGE_FAILED, attempts[i], error=str(e))
+                finally:
+                    for _, image in batch:
+                        image.close()
+
+        # Pages are queued in the OCR scheduler, which paces the requests
+        await asyncio.gather(render(), *(extract() for _ in range(workers)))
+        return sorted(failed_pages)
+
+
     async def convert_pdf_to_text(
             self,
             pdf_path: str,
             file_path: str,
             linking_uri: str,
             file_modified_date: str,
-            gu_id: str
+            gu_id: str,
+            priority: int = BULK,
+            file_version: str = None
             ):
         """
-        Asynchronously converts a PDF to text by processing each page as an image.
-        Converts the PDF into images using `pdf2image.convert_from_path` (in a background thread).
-        Processes each image to extract text asynchronously.
-        Collects the results and checks if all pages were successfully processed.
+        Asynchronously converts a PDF to text, page by page.
+        Pages with a usable text layer are extracted locally (see app/models/text_layer.py); only scanned and
+        image-heavy pages go to the vision model (see extract_ocr_pages). The path taken is recorded in the
+        "extraction" metadata of each page.
+
+        OCR pages are checkpointed in PageInfo: a file attempted before resumes from its extracted pages, and
+        only its failed pages are extracted again, in up to PAGE_RETRY_ROUNDS more rounds. A page failing
+        PAGE_MAX_ATTEMPTS times, over all the attempts at the file, gives the file up until it is modified.
 
         Args:
             pdf_path (str): Local path to the PDF file.
@@ -167,6 +277,9 @@ class DATA_LOADER_SP():
             linking_uri (str): URI to link the extracted data.
             file_modified_date (str): The file's last modified date, passed for metadata tracking.
             gu_id (str): A unique identifier used to trace the file through processing.
+            priority (int): Priority of the OCR requests of the pages (INTERACTIVE for /embed uploads, BULK for the sync).
+            file_version (str): Full last modified time of the file, the checkpoints of any other version are dropped.
+                Defaults to file_modified_date.
 
         Returns:
                 (list, bool): A list of processed document objects or text data extracted from the PDF, bool to return True if all pages were successfully embedded; False otherwise.
@@ -175,29 +288,63 @@ class DATA_LOADER_SP():
             documents = []
             embed_flag = False
             time1 = datetime.now()
-            logging.info(f"convert_from_path starting : {pdf_path}")
-            print(f"convert_from_path starting : {pdf_path}")
-
-            # Convert PDF to images (blocking call moved to thread pool)
-            images = await asyncio.to_thread(convert_from_path, pdf_path)
-
-            logging.info(f"time taken to convert pdf to img : {datetime.now() - time1}")
+            logging.info(f"Rasterization starting : {pdf_path}")
+            print(f"Rasterization starting : {pdf_path}")
 
+            page_count = await asyncio.to_thread(pdf_page_count, pdf_path)
             print(f"file_path : {file_path}")
 
-            args_list = [(i, img, file_path, linking_uri, file_modified_date, gu_id) for i, img in enumerate(images)]
-
-            if args_list:
-                # Run process_image asynchronously for all images
-                results = await asyncio.gather(*(IMAGE_EXTRACTION().process_image(args) for args in args_list))
-                documents.extend(results)
-            
-            if len(documents) == len(images):
+            if TEXT_LAYER_EXTRACTION:
+                classified = await asyncio.to_thread(
+                    classify_pages, pdf_path, page_count, TEXT_LAYER_MIN_CHARACTERS, TEXT_LAYER_MAX_IMAGE_RATIO
+                )
+            else:
+                classified = [page_text(i, OCR) for i in range(page_count)]
+
+            results = {
+                page["page"]: page_document(
+                    f"{page['text']}\n Modified date : {file_modified_date}.\n", page["page"], file_path, linking_uri, file_modified_date, gu_id, TEXT_LAYER
+                )
+                for page in classified if page["method"] == TEXT_LAYER
+            }
+            ocr_pages = [page["page"] for page in classified if page["method"] == OCR]
+            logging.info(f"{file_path} : {len(results)} pages extracted from the text layer, {len(ocr_pages)} pages sent to OCR")
+
+            # Resume from the pages extracted by previous attempts at this version of the file
+            file_version = file_version or file_modified_date
+            checkpoints = await asyncio.to_thread(load_page_checkpoints, gu_id, file_version)
+            attempts = {i: checkpoint["attempts"] for i, checkpoint in checkpoints.items()}
+            resumed = 0
+            for i in ocr_pages:
+                if checkpoints.get(i, {}).get("status") == PAGE_DONE:
+                    results[i] = page_document(checkpoints[i]["text"], i, file_path, linking_uri, file_modified_date, gu_id, OCR)
+                    resumed += 1
+            if resumed:
+                logging.info(f"{file_path} : resuming, {resumed} of {len(ocr_pages)} OCR pages already extracted")
+
+            pending = [i for i in ocr_pages if i not in results]
+            for retry_round in range(PAGE_RETRY_ROUNDS + 1):
+                given_up = [i for i in pending if attempts.get(i, 0) >= PAGE_MAX_ATTEMPTS]
+                if given_up or not pending:
+                    break
+                if retry_round:
+                    logging.warning(f"{file_path} : retrying {len(pending)} failed pages (round {retry_round} of {PAGE_RETRY_ROUNDS})")
+                pending = await self.extract_ocr_pages(
+                    pdf_path, pending, file_path, linking_uri, file_modified_date, gu_id, priority, results, attempts, file_version
+                )
+            logging.info(f"time taken to extract pdf text : {datetime.now() - time1}")
+
+            documents = [results[i] for i in sorted(results)]
+
+            if len(documents) == page_count:
                 embed_flag = True
                 logging.info(f"{file_path} : Text extraction completed. Extracted page count = {len(documents)}")
             else:
                 embed_flag = False
-                logging.error(f"{file_path} : All pages are not extracted. Extracted page count = {len(documents)}")
+                given_up = [i + 1 for i in pending if attempts.get(i, 0) >= PAGE_MAX_ATTEMPTS]
+                if given_up:
+                    logging.error(f"{file_path} : pages {given_up} failed {PAGE_MAX_ATTEMPTS} times, the file is given up until it is modified")
+                logging.error(f"{file_path} : All pages are not extracted. Extracted page count = {len(documents)}, failed pages = {[i + 1 for i in pending]}")
 
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
@@ -205,7 +352,7 @@ class DATA_LOADER_SP():
 								
             documents = []
             embed_flag = False
-																							   
+																												   
         finally:
             return documents, embed_flag
 
@@ -215,7 +362,7 @@ class DATA_LOADER_SP():
             self,
             sp_library_title: str,
             sp_folder_relative_path: str
-            ) -> tuple[list, list, list, list]:
+            ) -> tuple[list, list, list, list, list]:
         """
         Recursively lists all files within a SharePoint folder and its subfolders.
 
@@ -227,13 +374,14 @@ class DATA_LOADER_SP():
             sp_folder_relative_path (str): The relative path to the folder within the library (e.g., "Shared Documents/Reports").
 
         Returns:
-               (list of str, list of str, list of str, list of str): Names of the files found, Full SharePoint URLs to each file, Last modified dates of each file in "YYYY/MM/DD" format, Linking URIs for each file (empty string if not available).
+               (list of str, list of str, list of str, list of str, list of str): Names of the files found, Full SharePoint URLs to each file, Last modified dates of each file in "YYYY/MM/DD" format, Linking URIs for each file (empty string if not available), Full last modified times of each file (ISO format), which tell versions of a file modified on the same day apart.
         """
         try:
             file_path_list=[]
             file_list = []
             modified_date_list=[]
             linking_uri_list = []
+            version_list = []
             
             library_title = sp_library_title
             document_library = self.ctx.web.lists.get_by_title(library_title)
@@ -253,6 +401,7 @@ class DATA_LOADER_SP():
                     modified_date = f"{year}/{month}/{day}"
 
                     modified_date_list.append(modified_date)
+                    version_list.append(modified.isoformat())
                     # Construct the full URL
                     full_path = f"{self.sharepoint_url}{server_relative_url}"  # Complete URL to the file
                     file_list.append(file_name)
@@ -273,13 +422,103 @@ class DATA_LOADER_SP():
 
             list_files_in_folder(root_folder)
         
-            return file_list,file_path_list,modified_date_list,linking_uri_list
+            return file_list,file_path_list,modified_date_list,linking_uri_list,version_list
 
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
             logging.error(error_message)
             raise InternalError("An error occurred while listing all files in a given folder : " + str(e))
 
+    async def extract_documents_sp(
+            self,
+            file_path: str,
+            linking_uri: str,
+            modified_date: str,
+            source: str,
+            gu_id: str = None,
+            fileinfo: db_info.FileInfo = None,
+            file_version: str = None
+            ) -> tuple[list, str]:
+        """
+        Asynchronously downloads a SharePoint document, converts it to PDF and extracts the text of its pages.
+        The file is registered in FileInfo (embed_done False) if it is not registered yet.
+
+        Every call works in its own scratch directory under SYNC_SCRATCH_DIRECTORY, removed when it ends,
+        so several files can be processed at the same time.
+
+        Args:
+            file_path (str): The full SharePoint URL to the document.
+            linking_uri (str): A URI used for referencing the document in metadata.
+            modified_date (str): The last modified date of the document.
+            source (str): A string denoting the source system or context for the document.
+            gu_id (str, optional): A unique identifier for the document. If not provided, one is generated.
+            fileinfo (db_info.FileInfo, optional): The FileInfo record of the document, if it is already registered.
+            file_version (str, optional): Full last modified time of the document, the version its page checkpoints are kept for.
+
+        Returns:
+            (list, str): The extracted page documents, gu_id of the document.
+        """
+        if not file_path.lower().endswith((".doc", ".docx", ".ppt", ".pptx", ".pdf")):
+            raise BadRequestError(f"Unsupported file format: {file_path}")
+
+        os.makedirs(SYNC_SCRATCH_DIRECTORY, exist_ok=True)
+        temporary_directory = await asyncio.to_thread(tempfile.mkdtemp, prefix="job-", dir=SYNC_SCRATCH_DIRECTORY)
+        try:
+            file_name = file_path.replace("\\", "/").split("/")[-1]
+            if not gu_id:
+                gu_id = fileinfo.gu_id if fileinfo else uuid.uuid4()
+
+            if not fileinfo:
+                with db_info.get_db_context() as db:
+                    db.add(db_info.FileInfo(
+                        file_name= file_name,
+                        file_path= file_path,
+                        link_uri= linking_uri,
+                        upload_date = modified_date,
+                        gu_id = gu_id,
+                        embed_done = False,
+                        source = source
+                    ))
+                    db.commit()
+
+            # Downloading files to the scratch directory of this job
+            print("Downloading file to temp")
+            temp_file_path = await self.download_file_to_temp(file_path, temporary_directory)
+
+            # Convert other files to pdf
+            if file_path.lower().endswith(".pdf"):
+                pdf_path = temp_file_path
+            else:
+                print("Converting to pdf")
+                pdf_path = await self.convert_to_pdf(temp_file_path, temporary_directory)
+
+            # Extract text from data and convert to Document format.
+            if not pdf_path:
+                logging.error("Conversion to PDF failed.")
+                raise InternalError("Conversion to PDF failed.")
+
+            print("Extracting text")
+            # Uploads wait for their answer in /embed, so their pages go before the pages of the sync
+            priority = INTERACTIVE if source == "uploaded" else BULK
+            documents, embedded_flag = await self.convert_pdf_to_text(
+                pdf_path, file_path, linking_uri, modified_date, gu_id, priority, file_version=file_version
+            )
+            if not (documents and embedded_flag):
+                logging.error(f"An error occurred while extracting the text of {file_path}.")
+                raise InternalError(f"An error occurred while extracting the text of {file_path}.")
+
+            return documents, gu_id
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error(error_message)
+            raise InternalError(f"An error occurred while extracting a file {file_path} : {str(e)}")
+
+        finally:
+            # Only the scratch directory of this job is deleted
+            await asyncio.to_thread(shutil.rmtree, temporary_directory, ignore_errors=True)
+
+
     async def load_and_split_documents_sp(
             self, 
             file_path: str,
@@ -305,96 +544,21 @@ class DATA_LOADER_SP():
             None
         """
         try:
-            with db_info.get_db_context() as db: 
-                temporary_directory = "temp_dir"
-                if not os.path.exists(temporary_directory):
-                    os.mkdir(temporary_directory)
-    
-                if file_path.lower().endswith((".doc", ".docx", ".ppt", ".pptx", ".pdf")):
-                    file_name = file_path.replace("\\", "/").split("/")[-1]
-                    if not gu_id:
-                        gu_id = uuid.uuid4()
-        
-                    if not fileinfo:
-                        fileinfo = db_info.FileInfo(
-                            file_name= file_name,
-                            file_path= file_path,
-                            link_uri= linking_uri,
-                            upload_date = modified_date,
-                            gu_id = gu_id,
-                            embed_done = False,
-                            source = source
-                        )
-                    
-                        db.add(fileinfo)
-                        db.commit()
-                        db.refresh(fileinfo)
-    
-                    try:
-                        # Downloading files to temporary directory
-                        print("Downloading file to temp")
-                        temp_file_path = await self.download_file_to_temp(file_path, temporary_directory)
-    
-                        # Convert other files to pdf
-                        if file_path.lower().endswith(".pdf"):
-                            pdf_path = temp_file_path
-                        else:
-                            print("Converting to pdf")
-                            pdf_path = await self.convert_to_pdf(temp_file_path, temporary_directory)
-    
-                        # Extract text from data and convert to Document format.
-                        if pdf_path:
-                            print("Extracting text")
-                            documents, embedded_flag = await self.convert_pdf_to_text(pdf_path, file_path, linking_uri, modified_date, gu_id)
-                        
-                        else:
-                            logging.error("Conversion to PDF failed.")
-                            raise InternalError("Conversion to PDF failed.")
-    
-                        if documents and embedded_flag:
-                            # Add documents to vactorstore
-                            await vectorstore.aadd_documents(documents)
-                            vectorstore.save_local()
-                            logging.info(f"{file_path} added to vectorstore")
-                            print(f"{file_path} added to vectorstore")
-        
-                            # fileinfo = db.query(db_info.FileInfo).filter(db_info.FileInfo.gu_id == gu_id).first()
-        
-                            if fileinfo:
-                                fileinfo.embed_done = embedded_flag  # Update done status
-                                db.commit()
-                                db.refresh(fileinfo)
-                            
-                            else:
-                                logging.error(f"db_info.FileInfo not found for : {file_path}")
-
-                        else:
-                            logging.error(f"An error occurred while embedding a file {file_path} and adding it to the vectorstore.")
-                            raise InternalError(f"An error occurred while embedding a file {file_path} and adding it to the vectorstore.")
-                    
-                    except Exception as e:
-                        # fileinfo = db.query(db_info.db_info.FileInfo).filter(db_info.db_info.FileInfo.gu_id == gu_id).first()
-    
-                        # if fileinfo:
-                        #     db.delete(fileinfo)
-                        #     db.commit()
+            documents, gu_id = await self.extract_documents_sp(
+                file_path=file_path, linking_uri=linking_uri, modified_date=modified_date, source=source, gu_id=gu_id, fileinfo=fileinfo
+            )
 
-                        error_message = get_error_message_detail(e, sys)
-                        logging.error(error_message)
-                        raise InternalError(f"An error occurred while embedding a file {file_path} and adding it to the vectorstore: {str(e)}")
-        
-                else:
-                    raise BadRequestError(f"Unsupported file format: {file_path}")
+            # Add documents to vactorstore
+            await vectorstore.aadd_documents(documents)
+            await vectorstore.asave_local()
+            await asyncio.to_thread(mark_embedded, [gu_id])
+            logging.info(f"{file_path} added to vectorstore")
+            print(f"{file_path} added to vectorstore")
 
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
             logging.error(error_message)
             raise InternalError(f"An error occurred while loading a file {file_path} and adding it to the DB: {str(e)}")
- 
-        finally:
-            # Ensure the temp directory is deleted
-            if os.path.exists(temporary_directory):
-                await asyncio.to_thread(shutil.rmtree, temporary_directory)
                 
 
     async def data_to_db_sp(
@@ -403,9 +567,14 @@ class DATA_LOADER_SP():
             sp_folder_relative_path: str,
             vectorstore: FAISS_DB,
             source: str,
-            gu_id: str = None):
+            gu_id: str = None,
+            max_concurrency: int = None):
         """
-        Asynchronously processes and adds up to 10 SharePoint files from a specified folder into a vectorstore.
+        Asynchronously processes the SharePoint files of a folder that are not embedded yet and adds them to a vectorstore.
+
+        Files go through a bounded pool of jobs (download, PDF conversion, rasterization, OCR), so network waits
+        of one file overlap with the work on others. Extracted pages are committed to the vectorstore in batches
+        (see BatchCommitter). A file that fails does not stop the others; failures are reported at the end.
 
         Args:
             sp_library_title (str): The title of the SharePoint document library (e.g., "Documents").
@@ -413,19 +582,22 @@ class DATA_LOADER_SP():
             vectorstore (FAISS_DB): An instance of a FAISS vectorstore class.
             source (str): Identifier for the origin or context of the files.
             gu_id (str, optional): Global unique identifier.
+            max_concurrency (int, optional): Number of files processed at the same time. Defaults to SYNC_FILE_CONCURRENCY.
 
         Returns:
             None
         """
         try:
-            with db_info.get_db_context() as db:
- 
-                _,file_path_list,modified_date_list,linking_uri_list = self.list_all_files_in_folder_sp(sp_library_title=sp_library_title,
-                                                                                                        sp_folder_relative_path=sp_folder_relative_path
-                                                                                                        )
+            _,file_path_list,modified_date_list,linking_uri_list,version_list = self.list_all_files_in_folder_sp(sp_library_title=sp_library_title,
+                                                                                                    sp_folder_relative_path=sp_folder_relative_path
+                                                                                                    )
 
-                files_in_db, _ = await vectorstore.get_files_in_vectorstore()
-    
+            files_in_db, _ = await vectorstore.get_files_in_vectorstore()
+
+            # Decide which files to embed before starting any job
+            jobs = []
+            added_unmarked = []
+            with db_info.get_db_context() as db:
                 for i in range(len(file_path_list)):
 
                     file_path = file_path_list[i]
@@ -442,8 +614,10 @@ class DATA_LOADER_SP():
                             
                         elif not fileinfo.embed_done:
                             if file_path in files_in_db:
-                                logging.error(f"{file_path} : Already exist in vectorstore, but embedding flag not updated.")
-                                raise InternalError(f"{file_path} : Already exist in vectorstore, but embedding flag not updated.")
+                                # Added by a commit that failed afterwards and could not be rolled back
+                                logging.warning(f"{file_path} : Already exist in vectorstore, but embedding flag not updated. Marking it embedded.")
+                                added_unmarked.append(fileinfo.gu_id)
+                                continue
 
                             else:
                                 file_info = fileinfo
@@ -451,18 +625,242 @@ class DATA_LOADER_SP():
                     else:
                         file_info = None
 
+                    jobs.append((file_path, linking_uri_list[i], modified_date_list[i], version_list[i], file_info))
+
+                # Jobs only read the records, after this session is closed
+                db.expunge_all()
+
+            if added_unmarked:
+                await asyncio.to_thread(mark_embedded, added_unmarked)
+
+            committer = BatchCommitter(vectorstore, max_pages=SYNC_COMMIT_PAGES, max_files=SYNC_COMMIT_FILES)
+            semaphore = asyncio.Semaphore(max_concurrency or SYNC_FILE_CONCURRENCY)
+            failed_files = []
+
+            async def run_job(file_path: str, linking_uri: str, modified_date: str, file_version: str, file_info: db_info.FileInfo) -> None:
+                async with semaphore:
                     logging.info(f"Embedding file : {file_path}")
                     print(f"Embedding file : {file_path}")
-                    await self.load_and_split_documents_sp(file_path=file_path,
-                                                    linking_uri=linking_uri_list[i],
-                                                    modified_date=modified_date_list[i],
-                                                    vectorstore=vectorstore,
-                                                    source=source,
-                                                    gu_id=gu_id,
-                                                    fileinfo=file_info
-                                                    )
+                    try:
+                        documents, file_gu_id = await self.extract_documents_sp(
+                            file_path=file_path,
+                            linking_uri=linking_uri,
+                            modified_date=modified_date,
+                            source=source,
+                            gu_id=gu_id,
+                            fileinfo=file_info,
+                            file_version=file_version
+                        )
+                    except Exception as e:
+                        failed_files.append(file_path)
+                        logging.error(f"Embedding failed for {file_path} : {str(e)}")
+                        return
+                await committer.add(file_path, file_gu_id, documents)
+
+            logging.info(f"{len(jobs)} files to embed from {sp_folder_relative_path}, {max_concurrency or SYNC_FILE_CONCURRENCY} at a time")
+            await asyncio.gather(*(run_job(*job) for job in jobs))
+            await committer.flush()
+
+            failed_files += committer.failed_files
+            if failed_files:
+                raise InternalError(f"{len(failed_files)} of {len(jobs)} files could not be embedded : {failed_files}")
 
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
             logging.error(error_message)
             raise InternalError("An error occurred while adding the dataset to the vectorstore : " + str(e))
+
+
+def mark_embedded(gu_ids: list) -> None:
+    """
+    Sets embed_done on the FileInfo records of files added to the vectorstore, and deletes their page checkpoints.
+
+    Args:
+        gu_ids (list): gu_ids of the files.
+    """
+    gu_ids = [uuid.UUID(str(gu_id)) for gu_id in gu_ids]
+    with db_info.get_db_context() as db:
+        db.query(db_info.FileInfo).filter(
+            db_info.FileInfo.gu_id.in_(gu_ids)
+        ).update({"embed_done": True}, synchronize_session=False)
+        db.query(db_info.PageInfo).filter(db_info.PageInfo.gu_id.in_(gu_ids)).delete(synchronize_session=False)
+        db.commit()
+
+
+def page_document(
+        text: str,
+        page: int,
+        file_path: str,
+        linking_uri: str,
+        modified_date: str,
+        gu_id: str,
+        extraction: str
+        ) -> Document:
+    """
+    Creates the Document of an extracted page.
+
+    Args:
+        text (str): Page content.
+        page (int): 0-based page index.
+        file_path (str): Original SharePoint file path.
+        linking_uri (str): URI to link the extracted data.
+        modified_date (str): The file's last modified date.
+        gu_id (str): gu_id of the file.
+        extraction (str): TEXT_LAYER or OCR, the path the text was extracted with.
+
+    Returns:
+        (Document): The page.
+    """
+    return Document(
+        page_content=text,
+        metadata={"source": file_path, "page": page + 1, "LinkingUri": linking_uri, "date": modified_date, "gu_id": gu_id, "extraction": extraction}
+    )
+
+
+def load_page_checkpoints(gu_id: str, file_version: str) -> dict:
+    """
+    Gets the page checkpoints of a file. Checkpoints of another version of the file (modified since) are deleted.
+    A failing database only disables the resumption.
+
+    Args:
+        gu_id (str): gu_id of the file.
+        file_version (str): Full last modified time of the file (not only its date: a file edited on the
+            day of a failed attempt must not reuse the pages of the previous version).
+
+    Returns:
+        (dict): 0-based page index -> {"status", "text", "attempts"}.
+    """
+    try:
+        with db_info.get_db_context() as db:
+            rows = db.query(db_info.PageInfo).filter(db_info.PageInfo.gu_id == uuid.UUID(str(gu_id))).all()
+            stale = [row for row in rows if row.file_date != str(file_version)]
+            if stale:
+                for row in stale:
+                    db.delete(row)
+                db.commit()
+            return {
+                row.page - 1: {"status": row.status, "text": row.text, "attempts": row.attempts or 0}
+                for row in rows if row.file_date == str(file_version)
+            }
+
+    except Exception as e:
+        logging.warning(f"Page checkpoints of {gu_id} could not be loaded : {str(e)}")
+        return {}
+
+
+def save_page_checkpoint(
+        gu_id: str,
+        page: int,
+        file_version: str,
+        status: str,
+        attempts: int,
+        text: str = None,
+        error: str = None
+        ) -> None:
+    """
+    Records the outcome of the extraction of a page. A failing database only loses the checkpoint.
+
+    Args:
+        gu_id (str): gu_id of the file.
+        page (int): 0-based page index.
+        file_version (str): Full last modified time of the file.
+        status (str): PAGE_DONE or PAGE_FAILED.
+        attempts (int): Number of attempts at the page so far.
+        text (str): Page content of an extracted page.
+        error (str): Error of a failed page.
+    """
+    try:
+        with db_info.get_db_context() as db:
+            db.merge(db_info.PageInfo(
+                gu_id=uuid.UUID(str(gu_id)),
+                page=page + 1,
+                file_date=str(file_version),
+                status=status,
+                text=text,
+                attempts=attempts,
+                error=error,
+                updated_at=datetime.now(timezone.utc)
+            ))
+            db.commit()
+
+    except Exception as e:
+        logging.warning(f"Page checkpoint {gu_id} : {page + 1} could not be saved : {str(e)}")
+
+
+class BatchCommitter():
+    """
+    Collects the pages of extracted files and adds them to a vectorstore in batches: one embedding pass,
+    one add and one save_local per batch instead of per file, then embed_done is set for the whole batch.
+    A batch whose commit fails is deleted from the vectorstore again, so its files are embedded by the next sync.
+
+    Attributes:
+        vectorstore (FAISS_DB): The vectorstore the pages are added to.
+        max_pages (int): Number of pending pages that triggers a commit.
+        max_files (int): Number of pending files that triggers a commit.
+        failed_files (list): Paths of the files whose commit failed.
+    """
+
+    def __init__(self, vectorstore: FAISS_DB, max_pages: int = 500, max_files: int = 20) -> None:
+        self.vectorstore = vectorstore
+        self.max_pages = max_pages
+        self.max_files = max_files
+        self.failed_files = []
+
+        self._files = []
+        self._documents = []
+        self._lock = asyncio.Lock()
+
+    async def add(self, file_path: str, gu_id: str, documents: list) -> None:
+        """
+        Queues the pages of a file, and commits the batch once it is large enough.
+
+        Args:
+            file_path (str): Path of the file, for logs.
+            gu_id (str): gu_id of the file.
+            documents (list): The extracted pages.
+        """
+        async with self._lock:
+            self._files.append((file_path, gu_id))
+            self._documents.extend(documents)
+            if len(self._documents) >= self.max_pages or len(self._files) >= self.max_files:
+                await self._commit()
+
+    async def flush(self) -> None:
+        """
+        Commits the pending pages.
+        """
+        async with self._lock:
+            await self._commit()
+
+    async def _commit(self) -> None:
+        files, documents = self._files, self._documents
+        self._files, self._documents = [], []
+        if not files:
+            return
+
+        try:
+            await self.vectorstore.aadd_documents(documents)
+            await self.vectorstore.asave_local()
+            await asyncio.to_thread(mark_embedded, [gu_id for _, gu_id in files])
+            logging.info(f"{len(files)} files ({len(documents)} pages) added to vectorstore : {[file_path for file_path, _ in files]}")
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error(f"An error occurred while adding {len(files)} files to the vectorstore : {error_message}")
+            self.failed_files.extend(file_path for file_path, _ in files)
+            await self._rollback(files)
+
+    async def _rollback(self, files: list) -> None:
+        """
+        Deletes the pages of a failed batch that made it into the vectorstore (added, but not saved or not marked
+        embedded). Pages left behind are marked embedded by the next sync (see DATA_LOADER_SP.data_to_db_sp).
+        """
+        try:
+            for _, gu_id in files:
+                await self.vectorstore.delete(gu_id)
+            await self.vectorstore.asave_local()
+            logging.info(f"{len(files)} files removed from the vectorstore after the failed commit")
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error(f"An error occurred while removing a failed batch from the vectorstore : {error_message}")
@@ -7,6 +7,7 @@ and processes the files by embedding their content into a FAISS vector database
 import os
 import sys
 import uuid
+import asyncio
 from pydantic import UUID4
 import json
 from datetime import datetime,timezone
@@ -20,7 +21,7 @@ from app.info.sharepoint_info import (
     SITE_URL, CLIENT_ID, CLIENT_SECRET, SP_LIBRARY_TITLE, 
     SP_LIBRARY_TITLE_UP, SHAREPOINT_URL, SP_RENAULT
 )
-from app.utils import EMBEDDINGS, RENAULT_DB, PERSIST_DIRECTORY
+from app.utils import EMBEDDINGS, RENAULT_DB, PERSIST_DIRECTORY, FAISS_DOCSTORE, HYBRID_SEARCH, EMBEDDING_DIMENSIONS
 
 from app.logger import logging
 from app.exception import get_error_message_detail
@@ -172,7 +173,13 @@ async def embed_pdf_in_vectorstore(
         with db_info.get_db_context() as db:
             logging.info(f"Received request to embed file for chatid: {chatid}")
             persist_directory = f"{PERSIST_DIRECTORY}/{chatid}"
-            uploaded_db = FAISS_DB(embedding_function=EMBEDDINGS, persist_directory=persist_directory)
+            uploaded_db = FAISS_DB(
+                embedding_function=EMBEDDINGS,
+                persist_directory=persist_directory,
+                docstore_type=FAISS_DOCSTORE,
+                hybrid=HYBRID_SEARCH,
+                dimensions=EMBEDDING_DIMENSIONS or None
+            )
             uploaded_db.load()
     
             data_loader = DATA_LOADER_SP(
@@ -190,6 +197,9 @@ async def embed_pdf_in_vectorstore(
                 gu_id=gu_id,
             )
     
+            # A single base snapshot lets /chat reopen the store read-only and memory-mapped
+            await asyncio.to_thread(uploaded_db.merge, background=False)
+
             logging.info(f"Embedding successful for: {chatid}")
     
             return uploaded_db
@@ -0,0 +1,104 @@
+"""
+Rebuild Index Module
+Offline command that retrains and rebuilds a persisted FAISS vectorstore into another index type
+and reports recall against flat search.
+
+Also converts existing stores to the quantized storage modes (sq_fp16, sq_int8, pq).
+
+Usage:
+    python -m app.components.rebuild_index --path <persist_directory> --index-type ivf_flat --nlist 1024 --nprobe 16
+    python -m app.components.rebuild_index --path <persist_directory> --index-type sq_int8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from app.models.vectorstore import FAISS_DB
+from app.models.index_factory import INDEX_TYPES
+from app.logger import logging
+from app.exception import get_error_message_detail
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (argparse.Namespace): Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Rebuild a persisted FAISS vectorstore into another index type.")
+    parser.add_argument("--path", required=True, help="Persist directory of the vectorstore")
+    parser.add_argument("--index-type", required=True, choices=INDEX_TYPES)
+    parser.add_argument("--nlist", type=int, default=1024, help="Number of IVF lists")
+    parser.add_argument("--nprobe", type=int, default=16, help="Number of IVF lists visited per query")
+    parser.add_argument("--pq-m", type=int, default=64, help="Number of PQ sub-quantizers")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="Number of neighbours per HNSW node")
+    parser.add_argument("--ef-search", type=int, default=64, help="HNSW candidate list size per query")
+    parser.add_argument("--sample", type=int, default=200, help="Number of stored vectors used as recall queries, each excluded from its own results")
+    parser.add_argument("--k", type=int, default=10, help="k used for recall@k")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> dict:
+    """
+    Loads the vectorstore, rebuilds it and prints a JSON report.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (dict): The rebuild report.
+    """
+    try:
+        args = parse_args(argv)
+
+        # The embedding function is not needed: the store already exists and nothing is embedded.
+        vectorstore = FAISS_DB(
+            embedding_function=None,
+            persist_directory=args.path,
+            index_type=args.index_type,
+            nlist=args.nlist,
+            nprobe=args.nprobe,
+            pq_m=args.pq_m,
+            hnsw_m=args.hnsw_m,
+            ef_search=args.ef_search
+        )
+        vectorstore.load()
+
+        report = vectorstore.rebuild_index(sample_size=args.sample, k=args.k)
+        report["index_file_bytes"] = os.path.getsize(
+            os.path.join(args.path, f"{vectorstore._manifest['base']}.faiss")
+        )
+
+        # Query latency of the rebuilt index, using stored vectors as queries
+        index = vectorstore.vectorstore.index
+        if index.ntotal:
+            rows = np.random.default_rng(2).choice(index.ntotal, min(args.sample, index.ntotal), replace=False)
+            queries = index.reconstruct_batch(np.sort(rows).astype(np.int64))
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query.reshape(1, -1), args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            report["search_ms_p50"] = float(np.percentile(latencies, 50))
+            report["search_ms_p99"] = float(np.percentile(latencies, 99))
+
+        print(json.dumps(report, indent=2))
+        return report
+
+    except Exception as e:
+        error_message = get_error_message_detail(e, sys)
+        logging.error(f"Index rebuild failed : {error_message}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
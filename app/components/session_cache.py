@@ -0,0 +1,163 @@
+"""
+This module handles the process-wide cache of chat sessions (per-chat vectorstore, chain or agent graph and chat history).
+
+The cache is bounded by number of sessions and by estimated memory, and evicts the least recently used
+sessions first. An evicted session is rebuilt from disk and the database on its next /chat request.
+"""
+
+import threading
+from collections import OrderedDict
+
+from app.logger import logging
+
+
+def estimate_session_bytes(session: dict, shared_vectorstores: tuple = ()) -> int:
+    """
+    Estimates the memory held by a chat session: its own vectorstore and its chat history.
+
+    Args:
+        session (dict): The session ("vectorstore", "chat_history", chain or graph, status flags).
+        shared_vectorstores (tuple): Vectorstores shared by all sessions (e.g. RENAULT_DB), not counted.
+
+    Returns:
+        (int): Estimated size in bytes.
+    """
+    size = 0
+
+    vectorstore = session.get("vectorstore")
+    if vectorstore is not None and not any(vectorstore is shared for shared in shared_vectorstores):
+        size += vectorstore.memory_bytes()
+
+    for message in session.get("chat_history") or []:
+        content = getattr(message, "content", message)
+        size += len(content) if isinstance(content, str) else 0
+
+    return size
+
+
+class SESSION_CACHE():
+    """
+    LRU cache of chat sessions keyed by chatid, bounded by count and estimated bytes.
+
+    Supports the dict operations used on chat sessions (in, [], get, del, pop), so it can replace a plain dict.
+    Only lookup() counts hits and misses, so that housekeeping checks do not skew the hit rate.
+
+    Attributes:
+        max_sessions (int): Maximum number of cached sessions.
+        max_bytes (int): Maximum estimated size of the cached sessions.
+        shared_vectorstores (tuple): Vectorstores not counted in the size of a session.
+        hits (int): Number of lookups that found the session.
+        misses (int): Number of lookups that did not find the session.
+        evictions (int): Number of sessions evicted to stay within the bounds.
+    """
+
+    def __init__(self, max_sessions: int = 256, max_bytes: int = 2 * 1024 ** 3, shared_vectorstores: tuple = ()) -> None:
+        """
+        Initializes the SESSION_CACHE class.
+
+        Args:
+            max_sessions (int): Maximum number of cached sessions.
+            max_bytes (int): Maximum estimated size of the cached sessions, in bytes.
+            shared_vectorstores (tuple): Vectorstores not counted in the size of a session.
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.shared_vectorstores = shared_vectorstores
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._sessions = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, chatid: str) -> (dict | None):
+        """
+        Gets a session, marks it as most recently used and counts the hit or miss.
+
+        Args:
+            chatid (str): Identifier of the chat.
+
+        Returns:
+            (dict | None): The session, None if it is not cached.
+        """
+        with self._lock:
+            session = self._sessions.get(chatid)
+            if session is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._sessions.move_to_end(chatid)
+            return session
+
+    def __contains__(self, chatid: str) -> bool:
+        return chatid in self._sessions
+
+    def __getitem__(self, chatid: str) -> dict:
+        return self._sessions[chatid]
+
+    def get(self, chatid: str, default=None):
+        return self._sessions.get(chatid, default)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __setitem__(self, chatid: str, session: dict) -> None:
+        """
+        Stores (or re-measures) a session as the most recently used and evicts older sessions if a bound is exceeded.
+        Assigning an already cached session again updates its size, e.g. after its chat history grew.
+        """
+        size = estimate_session_bytes(session, self.shared_vectorstores)
+        with self._lock:
+            self._total_bytes += size - self._sizes.get(chatid, 0)
+            self._sessions[chatid] = session
+            self._sizes[chatid] = size
+            self._sessions.move_to_end(chatid)
+            self._evict(keep=chatid)
+
+    def __delitem__(self, chatid: str) -> None:
+        with self._lock:
+            del self._sessions[chatid]
+            self._total_bytes -= self._sizes.pop(chatid, 0)
+
+    def pop(self, chatid: str, default=None):
+        with self._lock:
+            self._total_bytes -= self._sizes.pop(chatid, 0)
+            return self._sessions.pop(chatid, default)
+
+    def _evict(self, keep: str) -> None:
+        """
+        Evicts least recently used sessions until both bounds hold. Must be called with the lock held.
+
+        Args:
+            keep (str): chatid that is never evicted (the session being stored).
+        """
+        while len(self._sessions) > self.max_sessions or self._total_bytes > self.max_bytes:
+            chatid = next(iter(self._sessions))
+            if chatid == keep:
+                break
+            del self._sessions[chatid]
+            self._total_bytes -= self._sizes.pop(chatid, 0)
+            self.evictions += 1
+            logging.info(f"Chat session {chatid} evicted from cache ({len(self._sessions)} sessions, {self._total_bytes} bytes left)")
+
+    def stats(self) -> dict:
+        """
+        Gets the counters and current size of the cache.
+
+        Returns:
+            (dict): hits, misses, evictions, hit_rate, sessions, bytes and the bounds.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "sessions": len(self._sessions),
+                "bytes": self._total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,132 @@
+"""
+Shard Server Module
+Serves one shard of a SHARDED_FAISS_DB over multiprocessing.connection (see app/models/sharded_vectorstore.py).
+
+Started by SHARDED_FAISS_DB as a local worker (shared by the processes of the host), or by hand on another node for a store sharded across nodes
+(FAISS_SHARD_ADDRESSES). Coordinators authenticate with the key in the SHARD_AUTHKEY environment variable.
+
+Usage:
+    SHARD_AUTHKEY=<key> python -m app.components.shard_server --path <shard directory> --listen 0.0.0.0:7400
+"""
+
+import os
+import sys
+import argparse
+import threading
+from multiprocessing.connection import Listener
+
+from app.models.sharded_vectorstore import AUTHKEY_ENV, ShardServer, parse_address
+from app.models.index_factory import INDEX_TYPES
+from app.logger import logging
+from app.exception import get_error_message_detail
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        (argparse.Namespace): Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Serve one shard of a sharded FAISS vectorstore.")
+    parser.add_argument("--path", default=None, help="Persist directory of the shard (in memory if not given)")
+    parser.add_argument("--listen", default="127.0.0.1:7400", help="host:port to listen on (port 0 picks a free port)")
+    parser.add_argument("--port-file", default=None, help="File the listening port is written to once ready")
+    parser.add_argument("--authkey-hex", action="store_true", help="SHARD_AUTHKEY is hex encoded")
+    parser.add_argument("--exit-when-idle", action="store_true", help="Stop when the last connected coordinator disconnects")
+    parser.add_argument("--read-only", action="store_true")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--docstore", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--merge-threshold", type=int, default=32)
+    parser.add_argument("--compact-ratio", type=float, default=0.2)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    """
+    Listens for coordinators and serves each connection in its own thread until the shard is shut down.
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv.
+    """
+    try:
+        args = parse_args(argv)
+        authkey = os.getenv(AUTHKEY_ENV, "")
+        authkey = bytes.fromhex(authkey) if args.authkey_hex else authkey.encode("utf-8")
+        if not authkey:
+            raise ValueError(f"{AUTHKEY_ENV} is not set")
+
+        server = ShardServer(
+            persist_directory=args.path,
+            index_type=args.index_type,
+            nlist=args.nlist,
+            nprobe=args.nprobe,
+            pq_m=args.pq_m,
+            hnsw_m=args.hnsw_m,
+            ef_search=args.ef_search,
+            merge_threshold=args.merge_threshold,
+            read_only=args.read_only,
+            docstore_type=args.docstore,
+            compact_ratio=args.compact_ratio
+        )
+
+        listener = Listener(parse_address(args.listen), authkey=authkey)
+        host, port = listener.address
+        if args.port_file:
+            with open(args.port_file + ".tmp", "w", encoding="utf-8") as port_file:
+                port_file.write(str(port))
+            os.replace(args.port_file + ".tmp", args.port_file)
+        logging.info(f"Shard server {args.path} listening on {host}:{port}")
+
+        # Open connections; once the server decided to stop idle, new connections are closed at once
+        connections = {"open": 0, "closing": False}
+        connections_lock = threading.Lock()
+
+        def serve(connection) -> None:
+            server.serve(connection)
+            with connections_lock:
+                connections["open"] -= 1
+                connections["closing"] = args.exit_when_idle and connections["open"] == 0
+            if connections["closing"] and not server.stopped.is_set():
+                server.shutdown()
+
+        def accept() -> None:
+            while True:
+                try:
+                    connection = listener.accept()
+                except OSError:
+                    break
+                except Exception as e:
+                    # A client failing authentication must not stop the server
+                    logging.warning(f"Shard server {args.path} : connection refused : {e}")
+                    continue
+                with connections_lock:
+                    if connections["closing"]:
+                        connection.close()
+                        continue
+                    connections["open"] += 1
+                threading.Thread(target=serve, args=(connection,), daemon=True).start()
+
+        # Connections are served by daemon threads; the process ends once the shard is shut down
+        threading.Thread(target=accept, daemon=True).start()
+        server.stopped.wait()
+        listener.close()
+
+        logging.info(f"Shard server {args.path} stopped")
+
+    except Exception as e:
+        error_message = get_error_message_detail(e, sys)
+        logging.error(f"Shard server failed : {error_message}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
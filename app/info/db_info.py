@@ -7,7 +7,7 @@ from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import Column, String, DateTime, Boolean, Text, Date
+from sqlalchemy import Column, String, DateTime, Boolean, Text, Date, Integer
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from datetime import datetime, timezone
@@ -64,6 +64,26 @@ class FileInfo(Base):
     source = Column(String(255))
 
 
+class PageInfo(Base):
+    """
+    Represents the extraction progress of one page in the 'ft_page_progress' table within the 'file_management' schema.
+    Pages OCR'd (or failed) in a previous attempt at a file are not extracted again; the rows of a file
+    are deleted once it is embedded.
+    """
+    __tablename__ = "ft_page_progress"
+    __table_args__ = {"schema": "file_management"}
+
+    gu_id = Column(UUID(as_uuid=True), primary_key=True)
+    page = Column(Integer, primary_key=True)
+    # Full last modified time of the version of the file the page was extracted from
+    file_date = Column(String(50))
+    status = Column(String(20))
+    text = Column(Text)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
 class ChatInfo(Base):
     """
     Represents a chat history record in the 'ft_chat_history' table within the 'users' schema.
@@ -9,7 +9,7 @@ from fastapi.responses import JSONResponse
 from fastapi import Request
 from starlette import status
 from app.info.db_info import init_db
-from app.routers import specific
+from app.routers import specific, admin
 from app.components import heartbeat
 from app.middleware import ValidationExceptionMiddleware
 from app.logger import logging
@@ -38,6 +38,7 @@ async def lifespan(app: FastAPI):
 app = FastAPI(lifespan=lifespan)
 
 app.include_router(specific.router, prefix='/report')
+app.include_router(admin.router, prefix='/admin')
 
 app.add_middleware(SessionMiddleware, secret_key="secret_key")
 app.add_middleware(ValidationExceptionMiddleware)
@@ -0,0 +1,147 @@
+"""
+This module handles batched, concurrency-limited embedding of page texts.
+
+Texts are grouped into batches bounded by item count and by token count, the batches are embedded
+with a bounded number of concurrent requests, and requests rejected with 429 (rate limit) are retried
+with exponential backoff. Embeddings are returned in the order of the texts.
+"""
+
+import sys
+import random
+import asyncio
+from functools import lru_cache
+
+import openai
+
+from app.logger import logging
+from app.exception import get_error_message_detail
+
+# Rough number of characters per token, used when no tokenizer is available
+CHARACTERS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """
+    Loads the tokenizer of the OpenAI embedding models, None if it cannot be loaded (e.g. offline).
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logging.warning(f"Tokenizer not available, estimating token counts from text length : {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text for the OpenAI embedding models.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        (int): Number of tokens, estimated from the length if the tokenizer is not available.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // CHARACTERS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def make_batches(texts: list, max_items: int = 64, max_tokens: int = 32000) -> list[tuple[int, int]]:
+    """
+    Splits texts into consecutive batches holding at most max_items texts and max_tokens tokens.
+    A single text longer than max_tokens gets a batch of its own.
+
+    Args:
+        texts (list): The texts.
+        max_items (int): Maximum number of texts per batch.
+        max_tokens (int): Maximum number of tokens per batch.
+
+    Returns:
+        (list): (start, stop) positions of each batch in texts.
+    """
+    batches = []
+    start, batch_tokens = 0, 0
+    for position, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if position > start and (position - start >= max_items or batch_tokens + tokens > max_tokens):
+            batches.append((start, position))
+            start, batch_tokens = position, 0
+        batch_tokens += tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def _retry_delay(error: Exception, attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Gets the wait before retrying a rate-limited request: the Retry-After header if the service sent one,
+    otherwise exponential backoff with full jitter.
+
+    Args:
+        error (Exception): The rate limit error.
+        attempt (int): Number of the failed attempt, starting at 0.
+        base_delay (float): Backoff of the first retry, in seconds.
+        max_delay (float): Upper bound of the backoff, in seconds.
+
+    Returns:
+        (float): Seconds to wait.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), max_delay)
+    except ValueError:
+        pass
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+async def aembed_in_batches(
+        embedding_function,
+        texts: list,
+        max_items: int = 64,
+        max_tokens: int = 32000,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0
+        ) -> list:
+    """
+    Embeds texts in batches, with at most max_concurrency requests in flight.
+
+    Args:
+        embedding_function: The embedding model (aembed_documents is used).
+        texts (list): The texts to embed.
+        max_items (int): Maximum number of texts per request.
+        max_tokens (int): Maximum number of tokens per request.
+        max_concurrency (int): Maximum number of concurrent requests.
+        max_retries (int): Number of retries of a request rejected with 429.
+        base_delay (float): Backoff of the first retry, in seconds.
+        max_delay (float): Upper bound of the backoff, in seconds.
+
+    Returns:
+        (list): One embedding per text, in the order of the texts.
+    """
+    batches = make_batches(texts, max_items=max_items, max_tokens=max_tokens)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def embed_batch(start: int, stop: int) -> list:
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                try:
+                    return await embedding_function.aembed_documents(texts[start:stop])
+                except openai.RateLimitError as e:
+                    if attempt == max_retries:
+                        error_message = get_error_message_detail(e, sys)
+                        logging.error(f"Embedding of texts {start}-{stop} still rate limited after {max_retries} retries : {error_message}")
+                        raise
+                    delay = _retry_delay(e, attempt, base_delay, max_delay)
+                    logging.warning(f"Embedding of texts {start}-{stop} rate limited, retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    logging.info(f"Embedding {len(texts)} texts in {len(batches)} batches, {max_concurrency} at a time")
+    results = await asyncio.gather(*(embed_batch(start, stop) for start, stop in batches))
+    return [embedding for batch in results for embedding in batch]
@@ -0,0 +1,319 @@
+"""
+This module handles the persistent embedding cache put in front of the Azure embedding model.
+
+Embeddings are keyed by sha256(model, text), so the same page text (a re-uploaded report, a re-ingested
+SharePoint file, boilerplate pages shared by many reports) is only sent to the embedding model once.
+Entries are stored as float32 bytes in SQLite, which is safe to share between worker processes, and the
+least recently used entries are evicted once the cache grows past its size limit.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import EncoderBackedStore
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import ByteStore
+
+from app.logger import logging
+
+# After an eviction the cache is shrunk to this fraction of its limit, so evictions run in batches
+EVICTION_LOW_WATERMARK = 0.9
+
+
+class SQLiteByteStore(ByteStore):
+    """
+    Disk-backed ByteStore in one SQLite table, bounded in size with least-recently-used eviction.
+
+    Attributes:
+        path (str): Path of the SQLite database.
+        table (str): Name of the table holding the entries.
+        max_bytes (int): Maximum total size of the stored values.
+        hits (int): Number of keys found by mget.
+        misses (int): Number of keys not found by mget.
+        writes (int): Number of values written by mset.
+        evictions (int): Number of entries evicted to stay within max_bytes.
+    """
+
+    def __init__(self, path: str, table: str = "embeddings", max_bytes: int = 1024 ** 3) -> None:
+        """
+        Initializes the SQLiteByteStore class and creates its table if needed.
+
+        Args:
+            path (str): Path of the SQLite database. Created if it does not exist.
+            table (str): Name of the table holding the entries.
+            max_bytes (int): Maximum total size of the stored values, in bytes.
+        """
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Several uvicorn workers share the file; WAL mode lets readers run alongside a writer
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS cache_size (name TEXT PRIMARY KEY, bytes INTEGER NOT NULL)")
+        self._connection.execute(
+            f"INSERT OR IGNORE INTO cache_size (name, bytes) SELECT ?, COALESCE(SUM(size), 0) FROM {table}", (table,)
+        )
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """
+        Gets the values of the keys and marks the found entries as recently used.
+
+        Args:
+            keys (Sequence[str]): The keys.
+
+        Returns:
+            (list): The value of each key, None for keys not in the cache.
+        """
+        if not keys:
+            return []
+
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    f"UPDATE {self.table} SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+
+            values = [found.get(key) for key in keys]
+            hits = sum(value is not None for value in values)
+            self.hits += hits
+            self.misses += len(values) - hits
+            return values
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        """
+        Stores values and evicts the least recently used entries if the cache grows past max_bytes.
+
+        Args:
+            key_value_pairs (Sequence[Tuple[str, bytes]]): The keys and values.
+        """
+        if not key_value_pairs:
+            return
+
+        now = time.time()
+        with self._lock:
+            with self._transaction():
+                added_bytes = 0
+                for key, value in key_value_pairs:
+                    previous = self._connection.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                    self._connection.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                        (key, value, len(value), now)
+                    )
+                    added_bytes += len(value) - (previous[0] if previous else 0)
+
+                total_bytes = self._add_size(added_bytes)
+                if total_bytes > self.max_bytes:
+                    self._evict(total_bytes)
+
+            self.writes += len(key_value_pairs)
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        """
+        Deletes entries.
+
+        Args:
+            keys (Sequence[str]): The keys. Unknown keys are ignored.
+        """
+        with self._lock:
+            with self._transaction():
+                removed_bytes = 0
+                for key in keys:
+                    row = self._connection.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                        removed_bytes += row[0]
+                self._add_size(-removed_bytes)
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        """
+        Iterates over the stored keys.
+
+        Args:
+            prefix (str): If given, only keys starting with the prefix are returned.
+
+        Yields:
+            (str): The keys.
+        """
+        with self._lock:
+            if prefix:
+                rows = self._connection.execute(
+                    f"SELECT key FROM {self.table} WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                ).fetchall()
+            else:
+                rows = self._connection.execute(f"SELECT key FROM {self.table}").fetchall()
+        for (key,) in rows:
+            yield key
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Opens a write transaction. Taken immediately, so concurrent writers in other processes wait instead of failing.
+        """
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except Exception:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _add_size(self, delta: int) -> int:
+        """
+        Updates the stored total size of the table. Must be called inside a transaction.
+
+        Args:
+            delta (int): Change of the total size, in bytes.
+
+        Returns:
+            (int): The new total size.
+        """
+        self._connection.execute("UPDATE cache_size SET bytes = bytes + ? WHERE name = ?", (delta, self.table))
+        return self._connection.execute("SELECT bytes FROM cache_size WHERE name = ?", (self.table,)).fetchone()[0]
+
+    def _evict(self, total_bytes: int) -> None:
+        """
+        Deletes least recently used entries until the total size is below the low watermark.
+        Must be called inside a transaction.
+
+        Args:
+            total_bytes (int): The current total size.
+        """
+        target_bytes = int(self.max_bytes * EVICTION_LOW_WATERMARK)
+        evicted_keys, freed_bytes = [], 0
+        cursor = self._connection.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access")
+        for key, size in cursor:
+            if total_bytes - freed_bytes <= target_bytes:
+                break
+            evicted_keys.append((key,))
+            freed_bytes += size
+        cursor.close()
+
+        self._connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted_keys)
+        self._add_size(-freed_bytes)
+        self.evictions += len(evicted_keys)
+        logging.info(f"Embedding cache {self.table} : evicted {len(evicted_keys)} entries ({freed_bytes} bytes)")
+
+    def stats(self) -> dict:
+        """
+        Gets the counters and current size of the store.
+
+        Returns:
+            (dict): hits, misses, hit_rate, writes, evictions, entries, bytes and max_bytes.
+        """
+        with self._lock:
+            entries = self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            size = self._connection.execute("SELECT bytes FROM cache_size WHERE name = ?", (self.table,)).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes
+            }
+
+
+def embedding_key(model: str, text: str) -> str:
+    """
+    Gets the cache key of a text embedded by a model.
+
+    Args:
+        model (str): Name of the embedding model (deployment).
+        text (str): The embedded text.
+
+    Returns:
+        (str): sha256 hex digest of the model and the text.
+    """
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _serialize_vector(vector: List[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _deserialize_vector(value: bytes) -> List[float]:
+    return np.frombuffer(value, dtype=np.float32).tolist()
+
+
+class CachedEmbeddings(CacheBackedEmbeddings):
+    """
+    Embeddings served from the persistent cache, falling back to the underlying model for cache misses.
+
+    Attributes:
+        document_cache (SQLiteByteStore): Store of page text embeddings.
+        query_cache (SQLiteByteStore): Store of query embeddings.
+    """
+
+    def __init__(
+            self,
+            underlying_embeddings: Embeddings,
+            model: str,
+            path: str,
+            max_bytes: int = 1024 ** 3,
+            batch_size: int = None
+            ) -> None:
+        """
+        Initializes the CachedEmbeddings class.
+
+        Args:
+            underlying_embeddings (Embeddings): The embedding model called for cache misses.
+            model (str): Name of the embedding model, part of every cache key.
+            path (str): Path of the SQLite cache file.
+            max_bytes (int): Maximum size of each of the document and query caches, in bytes.
+            batch_size (int): Number of missing texts embedded per call. All at once if None.
+        """
+        document_cache = SQLiteByteStore(path, table="document_embeddings", max_bytes=max_bytes)
+        query_cache = SQLiteByteStore(path, table="query_embeddings", max_bytes=max_bytes)
+
+        super().__init__(
+            underlying_embeddings,
+            EncoderBackedStore(document_cache, lambda text: embedding_key(model, text), _serialize_vector, _deserialize_vector),
+            batch_size=batch_size,
+            query_embedding_store=EncoderBackedStore(
+                query_cache, lambda text: embedding_key(model, text), _serialize_vector, _deserialize_vector
+            )
+        )
+        self.document_cache = document_cache
+        self.query_cache = query_cache
+
+    def stats(self) -> dict:
+        """
+        Gets the counters of the document and query caches.
+
+        Returns:
+            (dict): {"documents": {...}, "queries": {...}}, see SQLiteByteStore.stats.
+        """
+        return {"documents": self.document_cache.stats(), "queries": self.query_cache.stats()}
@@ -0,0 +1,209 @@
+"""
+This module handles the encoding of the page images sent to the vision model.
+
+The vision model scales an image to fit in 2048x2048, then its short side down to 768 pixels: pixels beyond
+that are paid for in payload bytes but never read. Pages are therefore resized to that resolution with their
+aspect ratio kept, and pages without colour are sent in grayscale. Pages too dense to be read at that
+resolution (tables, small print) are cut into overlapping parts along their long side, each read at full
+resolution. Each image is encoded lossless (PNG) if it fits the byte budget, otherwise as the WebP (smaller
+than JPEG at the same quality) of the highest quality that fits.
+"""
+
+import base64
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+MODEL_MAX_SIDE = 2048
+MODEL_SHORT_SIDE = 768
+# Images are not shrunk below this short side to fit the byte budget
+MIN_SHORT_SIDE = 512
+# Qualities tried for lossy formats, best first
+QUALITY_STEPS = (85, 75, 65, 55, 45)
+# Share of a part repeated in the next one, so that no line is cut in two
+TILE_OVERLAP = 0.06
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def fit_size(width: int, height: int, max_side: int = MODEL_MAX_SIDE, short_side: int = MODEL_SHORT_SIDE) -> tuple[int, int]:
+    """
+    Gets the size an image is read at by the vision model (never upscaled), aspect ratio kept.
+
+    Args:
+        width (int): Width of the image.
+        height (int): Height of the image.
+        max_side (int): Maximum long side.
+        short_side (int): Maximum short side.
+
+    Returns:
+        (tuple): (width, height).
+    """
+    scale = min(1.0, max_side / max(width, height), short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def is_grayscale(image: Image.Image, tolerance: int = 24, max_colour_ratio: float = 0.002) -> bool:
+    """
+    Checks whether a page has no colour. A page with a few coloured pixels (a chart legend, a highlighted
+    cell) keeps its colours, which the OCR prompt relies on.
+
+    Args:
+        image (PIL.Image): The page.
+        tolerance (int): Spread between the RGB channels of a pixel above which it is coloured.
+        max_colour_ratio (float): Share of coloured pixels above which the page is in colour.
+
+    Returns:
+        (bool): True if the page can be sent in grayscale.
+    """
+    if image.mode in ("L", "1"):
+        return True
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((256, 256))
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    spread = pixels.max(axis=2) - pixels.min(axis=2)
+    return float(np.mean(spread > tolerance)) <= max_colour_ratio
+
+
+def text_density(image: Image.Image) -> float:
+    """
+    Measures how dense the print of a page is at the resolution the vision model reads it: the share of
+    dark / light transitions along the rows, high for small print and table grids.
+
+    Args:
+        image (PIL.Image): The page.
+
+    Returns:
+        (float): Transitions per pixel, between 0 and 1.
+    """
+    preview = image.convert("L").resize(fit_size(*image.size), Image.BILINEAR)
+    dark = np.asarray(preview) < 160
+    return float(np.mean(dark[:, 1:] != dark[:, :-1]))
+
+
+def tile_boxes(width: int, height: int, tiles: int, overlap: float = TILE_OVERLAP) -> list[tuple[int, int, int, int]]:
+    """
+    Cuts a page into overlapping parts along its long side (top to bottom, or left to right if landscape).
+
+    Args:
+        width (int): Width of the page.
+        height (int): Height of the page.
+        tiles (int): Number of parts.
+        overlap (float): Share of a part repeated in the next one.
+
+    Returns:
+        (list): Crop boxes (left, top, right, bottom).
+    """
+    length = max(width, height)
+    step = length / tiles
+    margin = step * overlap
+    boxes = []
+    for tile in range(tiles):
+        start = max(0, round(tile * step - margin))
+        end = min(length, round((tile + 1) * step + margin))
+        boxes.append((0, start, width, end) if height >= width else (start, 0, end, height))
+    return boxes
+
+
+def _encode(image: Image.Image, image_format: str, quality: int = None) -> bytes:
+    buffered = BytesIO()
+    if image_format == "png":
+        image.save(buffered, "PNG")
+    elif image_format == "webp":
+        image.save(buffered, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffered, "JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+def _best_quality(image: Image.Image, image_format: str, byte_budget: int) -> tuple[int, bytes]:
+    """
+    Gets the first of QUALITY_STEPS whose encoding fits the byte budget (the last one if none does).
+    """
+    for quality in QUALITY_STEPS:
+        data = _encode(image, image_format, quality)
+        if len(data) <= byte_budget:
+            break
+    return quality, data
+
+
+def encode_image(image: Image.Image, byte_budget: int, image_format: str = "auto") -> dict:
+    """
+    Encodes one image within a byte budget, shrinking it (down to a MIN_SHORT_SIDE short side) if the
+    lowest quality does not fit.
+
+    Args:
+        image (PIL.Image): The image, at the resolution it is sent at.
+        byte_budget (int): Maximum size of the encoded image, in bytes.
+        image_format (str): "png", "jpeg", "webp", or "auto" for PNG if it fits, else WebP.
+
+    Returns:
+        (dict): data (base64 string), mime_type, format, quality (None for PNG), bytes, width and height.
+    """
+    while True:
+        if image_format in ("auto", "png"):
+            data = _encode(image, "png")
+            if len(data) <= byte_budget or image_format == "png":
+                chosen = ("png", None, data)
+                break
+
+        lossy_format = "webp" if image_format == "auto" else image_format
+        chosen = (lossy_format, *_best_quality(image, lossy_format, byte_budget))
+        if len(chosen[2]) <= byte_budget or min(image.size) <= MIN_SHORT_SIDE:
+            break
+        scale = max(0.85, MIN_SHORT_SIDE / min(image.size))
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+
+    chosen_format, quality, data = chosen
+    return {
+        "data": base64.b64encode(data).decode("utf-8"),
+        "mime_type": MIME_TYPES[chosen_format],
+        "format": chosen_format,
+        "quality": quality,
+        "bytes": len(data),
+        "width": image.width,
+        "height": image.height
+    }
+
+
+def encode_page(
+        image: Image.Image,
+        byte_budget: int = 200000,
+        image_format: str = "auto",
+        grayscale: str = "auto",
+        tiling: str = "auto",
+        density_threshold: float = 0.12,
+        max_tiles: int = 3
+        ) -> list[dict]:
+    """
+    Encodes a page for the vision model (blocking, run it in a thread).
+
+    Args:
+        image (PIL.Image): The rendered page.
+        byte_budget (int): Maximum size of each encoded image, in bytes.
+        image_format (str): "png", "jpeg", "webp" or "auto", see encode_image.
+        grayscale (str): "true", "false", or "auto" to send pages without colour in grayscale.
+        tiling (str): "auto" to cut dense pages into parts, "false" to never cut pages.
+        density_threshold (float): text_density above which a page is cut; one more part per threshold exceeded.
+        max_tiles (int): Maximum number of parts of a page.
+
+    Returns:
+        (list): The encoded images of the page (several for a page cut into parts), see encode_image.
+    """
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if grayscale == "true" or (grayscale == "auto" and is_grayscale(image)):
+        image = image.convert("L")
+
+    tiles = 1
+    if tiling == "auto" and max_tiles > 1:
+        tiles = min(max_tiles, 1 + int(text_density(image) / density_threshold))
+
+    parts = [image.crop(box) for box in tile_boxes(*image.size, tiles)] if tiles > 1 else [image]
+    encoded = []
+    for part in parts:
+        size = fit_size(*part.size)
+        if size != part.size:
+            part = part.resize(size, Image.LANCZOS)
+        encoded.append(encode_image(part, byte_budget, image_format))
+    return encoded
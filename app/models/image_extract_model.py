@@ -2,11 +2,9 @@
 This module handles data extraction from images using openai model.
 """
 
+import re
 import sys
 import asyncio
-from io import BytesIO
-import base64
-from functools import partial
 from typing import Any
 
 from langchain_core.messages import HumanMessage
@@ -17,42 +15,77 @@ from langchain_core.prompts import ChatPromptTemplate
 from PIL import Image
 
 from app.utils import (
-    CHAT_MODEL
+    CHAT_MODEL, OCR_TOKENS_PER_PAGE, ocr_scheduler, ocr_cache,
+    OCR_IMAGE_FORMAT, OCR_IMAGE_BYTE_BUDGET, OCR_IMAGE_GRAYSCALE, OCR_IMAGE_TILING, OCR_TILE_DENSITY, OCR_MAX_TILES
 )
-from app.models.prompts import OCR_PROMPT
+from app.models.ocr_scheduler import BULK
+from app.models.image_encoding import encode_page
+from app.models.text_layer import OCR
+from app.models.prompts import OCR_PROMPT, TILED_PAGE_PROMPT, BATCH_PAGES_PROMPT, PAGE_MARKER
 from app.logger import logging
 from app.exception import get_error_message_detail, InternalError
 
+# Matches the PAGE_MARKER lines of a batched OCR reply
+PAGE_MARKER_PATTERN = re.compile(r"^[ \t]*<<<PAGE (\d+)>>>[ \t]*$", re.MULTILINE)
+
+
+def split_pages(reply: str, pages: list[int]) -> dict:
+    """
+    Splits the reply of a batched OCR request into the texts of its pages.
+
+    Args:
+        reply (str): The model output, each page introduced by its PAGE_MARKER line.
+        pages (list): 1-based page numbers sent in the request.
+
+    Returns:
+        (dict): Page number -> text, for the requested pages found with a non-empty text.
+    """
+    parts = PAGE_MARKER_PATTERN.split(reply)
+    texts = {}
+    for number, text in zip(parts[1::2], parts[2::2]):
+        page = int(number)
+        if page in pages and page not in texts and text.strip():
+            texts[page] = text.strip()
+    return texts
+
+
 class IMAGE_EXTRACTION():
+    # Chains are built once per process and shared by every instance
+    _chains = {}
+
     def __init__(self)-> None:
         pass
 
     def text_prompt_function(
             self,
-            base64str: str,
+            images: list[dict],
             ocr_prompt: ChatPromptTemplate = OCR_PROMPT
             ) -> list[HumanMessage]:
        
         """
-        Combining base64 image string and prompt for extracting data from it.
+        Combining the encoded image(s) of a page and prompt for extracting data from it.
  
         Args:
-            base64str(str): base64-encoded images.
+            images(list): encoded images of the page, see app/models/image_encoding.py (several for a page cut into parts).
        
         Returns:
             (list): list containing the data and prompt wrapped with HumanMessage object.
         """
         try:
             messages = []
+
+            if len(images) > 1:
+                messages.append({"type": "text", "text": TILED_PAGE_PROMPT["text"].format(parts=len(images))})
  
             # Adding image(s) to the messages if present
-            image_message = {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64str}"
-                },
-            }
-            messages.append(image_message)
+            for image in images:
+                image_message = {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{image['mime_type']};base64,{image['data']}"
+                    },
+                }
+                messages.append(image_message)
  
             # Adding the text message for analysis
             text_message = ocr_prompt
@@ -66,24 +99,66 @@ class IMAGE_EXTRACTION():
             raise InternalError("An error occurred while creating prompt function: " + str(e))
 
 
+    def batch_prompt_function(
+            self,
+            pages: list[tuple[int, list[dict]]],
+            ocr_prompt: ChatPromptTemplate = OCR_PROMPT
+            ) -> list[HumanMessage]:
+        """
+        Combining the encoded images of several pages, each introduced by its page marker, and the prompts for extracting their data.
+
+        Args:
+            pages (list): (1-based page number, encoded images of the page) of each page.
+
+        Returns:
+            (list): list containing the data and prompt wrapped with HumanMessage object.
+        """
+        try:
+            messages = []
+            for page, images in pages:
+                messages.append({"type": "text", "text": PAGE_MARKER.format(page=page)})
+                if len(images) > 1:
+                    messages.append({"type": "text", "text": TILED_PAGE_PROMPT["text"].format(parts=len(images))})
+                for image in images:
+                    messages.append({"type": "image_url", "image_url": {"url": f"data:{image['mime_type']};base64,{image['data']}"}})
+
+            messages.append({
+                "type": "text",
+                "text": BATCH_PAGES_PROMPT["text"].format(count=len(pages), example=PAGE_MARKER.format(page=pages[0][0]))
+            })
+            messages.append(ocr_prompt)
+
+            return [HumanMessage(content=messages)]
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error("An error occurred while creating batch prompt function: " + error_message)
+            raise InternalError("An error occurred while creating batch prompt function: " + str(e))
+
+
     def image_extraction_chain(
-            self
+            self,
+            batched: bool = False
             )-> RunnableSerializable[Any, str]:
         """
-        Creates a chain for extracting data from images.
+        Gets the chain for extracting data from images, created on the first call of the process.
+
+        Args:
+            batched (bool): The chain of batched requests (several pages per request, see batch_prompt_function).
  
         Returns:
-            (chain) : langchain chain object which extracts data from image base64 strings.
+            (chain) : langchain chain object which extracts data from the encoded images of a page (of pages if batched).
         """
         try:
-            image_text_extraction_chain = (
-                RunnablePassthrough()
-                | RunnableLambda(self.text_prompt_function)
-                | CHAT_MODEL
-                | StrOutputParser()
-            )
+            if batched not in IMAGE_EXTRACTION._chains:
+                IMAGE_EXTRACTION._chains[batched] = (
+                    RunnablePassthrough()
+                    | RunnableLambda(self.batch_prompt_function if batched else self.text_prompt_function)
+                    | CHAT_MODEL
+                    | StrOutputParser()
+                )
  
-            return image_text_extraction_chain
+            return IMAGE_EXTRACTION._chains[batched]
  
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
@@ -92,47 +167,98 @@ class IMAGE_EXTRACTION():
 
 
 
-    async def img_to_base64(
+    async def encode_page_image(
             self,
             image: Image
-            )-> tuple[str, BytesIO]:
+            )-> list[dict]:
         """
-        Asynchronously resizes an image and converts it to a base64-encoded PNG.
+        Asynchronously encodes a page for the vision model (in a background thread): aspect ratio kept, grayscale
+        if the page has no colour, cut into parts if its print is dense, PNG or WebP within OCR_IMAGE_BYTE_BUDGET.
 
         Args:
-            image (PIL.Image): The image to process.
+            image (PIL.Image): The rendered page.
 
         Returns:
-            tuple: A tuple containing:
-                - str: The base64-encoded string of the resized image.
-                - BytesIO: The buffer containing the image data.
+            (list): The encoded images of the page, see app/models/image_encoding.py.
         """
         try:
-            max_size = (800, 800)
-            loop = asyncio.get_event_loop()
+            return await asyncio.to_thread(
+                encode_page,
+                image,
+                byte_budget=OCR_IMAGE_BYTE_BUDGET,
+                image_format=OCR_IMAGE_FORMAT,
+                grayscale=OCR_IMAGE_GRAYSCALE,
+                tiling=OCR_IMAGE_TILING,
+                density_threshold=OCR_TILE_DENSITY,
+                max_tiles=OCR_MAX_TILES
+            )
 
-            # Resize image in executor
-            image = await loop.run_in_executor(None, image.resize, max_size, Image.LANCZOS)
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error("An error occurred while encoding the page image : " + error_message)
+            raise InternalError("An error occurred while encoding the page image : " + str(e))
 
-            buffered = BytesIO()
 
-            # Correct way to pass keyword arguments
-            save_func = partial(image.save, buffered, "PNG", quality=85)
-            await loop.run_in_executor(None, save_func)
+    async def cached_text(self, cache_key: str) -> str:
+        """
+        Gets the text of a page image from the OCR cache. A failing cache is treated as a miss.
+
+        Args:
+            cache_key (str): Key of the encoded page image, see OCRResultCache.key.
 
-            img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        Returns:
+            (str): The cached text, None if not cached.
+        """
+        try:
+            return await asyncio.to_thread(ocr_cache.get, cache_key)
+        except Exception as e:
+            logging.warning(f"OCR cache read failed : {e}")
+            return None
 
-            return img_str, buffered
 
+    async def cache_text(self, cache_key: str, text: str) -> None:
+        """
+        Stores the text of a page image in the OCR cache. A failing cache does not fail the page.
+
+        Args:
+            cache_key (str): Key of the encoded page image, see OCRResultCache.key.
+            text (str): The extracted text.
+        """
+        try:
+            await asyncio.to_thread(ocr_cache.set, cache_key, text)
         except Exception as e:
-            error_message = get_error_message_detail(e, sys)
-            logging.error("An error occurred while converting image to base64 string : " + error_message)
-            raise InternalError("An error occurred while converting image to base64 string : " + str(e))
+            logging.warning(f"OCR cache write failed : {e}")
+
+
+    def cache_key(self, images: list[dict]) -> str:
+        """
+        Gets the OCR cache key of the encoded images of a page (None if the cache is disabled).
+        """
+        if ocr_cache is None:
+            return None
+        return ocr_cache.key("".join(encoded["data"] for encoded in images).encode("utf-8"))
+
+
+    def page_document(self, texts: str, args: tuple) -> Document:
+        """
+        Creates the Document of a page from the text extracted by the vision model.
+
+        Args:
+            texts (str): The extracted text.
+            args (tuple): The page, see process_image.
+
+        Returns:
+            (Document): The page, with its metadata.
+        """
+        i, _, file_path, linking_uri, modified_date, gu_id = args
+        text_with_date = f"{texts}\n Modified date : {modified_date}.\n"
+        return Document(page_content = text_with_date, metadata = {"source" : file_path, "page": i+1, "LinkingUri": linking_uri , "date": modified_date, "gu_id": gu_id, "extraction": OCR})
 
 
     async def process_image(
             self,
-            args: tuple[int, Image.Image, str, str, str, str]
+            args: tuple[int, Image.Image, str, str, str, str],
+            priority: int = BULK
             )-> Document:
         """
         Asynchronously processes an image by converting it to base64, extracting text using a prompt function,
@@ -146,6 +272,7 @@ class IMAGE_EXTRACTION():
                 - linking_uri (str): A URI for linking or referencing the source.
                 - modified_date (str): Last modified date of the image.
                 - gu_id (str): A unique identifier for the document.
+            priority (int): Priority of the OCR request in the scheduler (INTERACTIVE or BULK).
  
         Returns:
             (Document): A Document object containing extracted text and metadata.
@@ -157,20 +284,103 @@ class IMAGE_EXTRACTION():
             i, image, file_path, linking_uri, modified_date, gu_id = args
             logging.info(f"Processing image :: {file_path} : {i+1}")
  
-            img_str, buffered = await self.img_to_base64(image)
+            images = await self.encode_page_image(image)
             print(f"{file_path} : {i+1}")
- 
-            texts = await self.image_extraction_chain().ainvoke(img_str)
+
+            # The same page image was OCR'd before with the same prompt and deployment
+            cache_key, texts = self.cache_key(images), None
+            if cache_key is not None:
+                texts = await self.cached_text(cache_key)
+
+            if texts is None:
+                # Rate limited and retried by the process-wide scheduler
+                chain = self.image_extraction_chain()
+                texts = await ocr_scheduler.run(
+                    lambda: chain.ainvoke(images), priority=priority, tokens=OCR_TOKENS_PER_PAGE * len(images), label=f"{file_path} : {i+1}"
+                )
+                if cache_key is not None:
+                    await self.cache_text(cache_key, texts)
+            else:
+                logging.info(f"OCR cache hit for {file_path} : {i+1}")
            
-            text_with_date = f"{texts}\n Modified date : {modified_date}.\n"
-            doc = Document(page_content = text_with_date, metadata = {"source" : file_path, "page": i+1, "LinkingUri": linking_uri , "date": modified_date, "gu_id": gu_id})
+            doc = self.page_document(texts, args)
             logging.info(f"Data extracted for {file_path} : {i+1}")
  
-            buffered.close()
             return doc
                
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
             logging.error(f"Text extraction failed for {file_path}, page {i+1} with ERROR : {error_message}")
             raise InternalError("Text extraction failed")
-            
\ No newline at end of file
+            
+
+    async def process_images(
+            self,
+            args_list: list[tuple[int, Image.Image, str, str, str, str]],
+            priority: int = BULK
+            )-> list[Document]:
+        """
+        Asynchronously processes several pages of a file with one vision request: the pages are sent together,
+        each introduced by its page marker, and the reply is split back into one Document per page. The OCR
+        prompt is sent once for all of them. Pages found in the OCR cache are not sent; pages missing from the
+        reply are extracted again one by one.
+
+        Args:
+            args_list (list): The pages, see process_image.
+            priority (int): Priority of the OCR request in the scheduler (INTERACTIVE or BULK).
+
+        Returns:
+            (list): The Documents of the pages, in the order of args_list.
+        """
+        if len(args_list) == 1:
+            return [await self.process_image(args_list[0], priority=priority)]
+
+        try:
+            file_path = args_list[0][2]
+            numbers = [args[0] + 1 for args in args_list]
+            label = f"{file_path} : {numbers}"
+            logging.info(f"Processing images :: {label}")
+
+            encoded_pages = await asyncio.gather(*(self.encode_page_image(args[1]) for args in args_list))
+            cache_keys = [self.cache_key(images) for images in encoded_pages]
+
+            texts = {}
+            for number, cache_key in zip(numbers, cache_keys):
+                if cache_key is not None and (cached := await self.cached_text(cache_key)) is not None:
+                    texts[number] = cached
+
+            pending = [(number, images) for number, images in zip(numbers, encoded_pages) if number not in texts]
+            if len(pending) > 1:
+                # Rate limited and retried by the process-wide scheduler, as one request
+                chain = self.image_extraction_chain(batched=True)
+                reply = await ocr_scheduler.run(
+                    lambda: chain.ainvoke(pending),
+                    priority=priority,
+                    tokens=OCR_TOKENS_PER_PAGE * sum(len(images) for _, images in pending),
+                    label=label
+                )
+                extracted = split_pages(reply, [number for number, _ in pending])
+                for number, cache_key in zip(numbers, cache_keys):
+                    if number in extracted:
+                        texts[number] = extracted[number]
+                        if cache_key is not None:
+                            await self.cache_text(cache_key, extracted[number])
+
+                missing = [number for number, _ in pending if number not in extracted]
+                if missing:
+                    logging.warning(f"Batched OCR reply of {file_path} is missing pages {missing}, extracted one by one")
+
+            documents = []
+            for number, args in zip(numbers, args_list):
+                if number in texts:
+                    documents.append(self.page_document(texts[number], args))
+                else:
+                    documents.append(await self.process_image(args, priority=priority))
+            logging.info(f"Data extracted for {label}")
+
+            return documents
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error(f"Text extraction failed for {file_path}, pages {numbers} with ERROR : {error_message}")
+            raise InternalError("Text extraction failed")
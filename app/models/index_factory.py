@@ -0,0 +1,294 @@
+"""This module builds and tunes the FAISS indexes used by FAISS_DB"""
+
+import numpy as np
+import faiss
+
+from app.logger import logging
+
+# Supported values for FAISS_DB(index_type=...)
+# sq_fp16 / sq_int8 / pq store every vector compressed (2, 1 and pq_m / (4 * dimensions) of the float32 size)
+INDEX_TYPES = ("flat", "sq_fp16", "sq_int8", "pq", "ivf_flat", "ivf_pq", "hnsw")
+
+# faiss needs roughly this many training points per IVF list / PQ centroid
+MIN_POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256
+
+
+def needs_training(index_type: str) -> bool:
+    """
+    Tells if an index type has to be trained on sample vectors before vectors can be added.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+
+    Returns:
+        (bool): True for the IVF based index types and the trained quantizers (int8 ranges, PQ codebooks).
+    """
+    return index_type in ("ivf_flat", "ivf_pq", "sq_int8", "pq")
+
+
+def create_index(
+        dimensions: int,
+        index_type: str = "flat",
+        nlist: int = 1024,
+        pq_m: int = 64,
+        hnsw_m: int = 32,
+        ntrain: int = None
+        ) -> faiss.Index:
+    """
+    Creates an empty FAISS index of the requested type (L2 metric).
+
+    Args:
+        dimensions (int): Dimension of the vectors.
+        index_type (str): One of INDEX_TYPES.
+        nlist (int): Number of IVF lists (ivf_flat, ivf_pq).
+        pq_m (int): Number of PQ sub-quantizers (pq, ivf_pq). Must divide dimensions.
+        hnsw_m (int): Number of neighbours per HNSW node (hnsw).
+        ntrain (int): Number of vectors available for training. Used to shrink nlist on small stores.
+
+    Returns:
+        (faiss.Index): The new, possibly untrained, index.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index type '{index_type}'. Expected one of {INDEX_TYPES}")
+
+    if index_type in ("pq", "ivf_pq") and ntrain is not None and ntrain < PQ_CENTROIDS:
+        fallback_type = "sq_int8" if index_type == "pq" else "ivf_flat"
+        logging.warning(f"Only {ntrain} vectors available, too few to train PQ. Using {fallback_type} instead.")
+        index_type = fallback_type
+
+    if index_type in ("ivf_flat", "ivf_pq") and ntrain is not None:
+        max_nlist = max(1, ntrain // MIN_POINTS_PER_CENTROID)
+        if nlist > max_nlist:
+            logging.warning(f"nlist reduced from {nlist} to {max_nlist} for {ntrain} training vectors")
+            nlist = max_nlist
+
+    if index_type == "flat":
+        description = "Flat"
+    elif index_type == "sq_fp16":
+        description = "SQfp16"
+    elif index_type == "sq_int8":
+        description = "SQ8"
+    elif index_type == "pq":
+        description = f"PQ{pq_m}"
+    elif index_type == "ivf_flat":
+        description = f"IVF{nlist},Flat"
+    elif index_type == "ivf_pq":
+        description = f"IVF{nlist},PQ{pq_m}"
+    else:
+        description = f"HNSW{hnsw_m},Flat"
+
+    return faiss.index_factory(dimensions, description, faiss.METRIC_L2)
+
+
+def configure_search(
+        index: faiss.Index,
+        nprobe: int = None,
+        ef_search: int = None
+        ) -> faiss.Index:
+    """
+    Applies query-time parameters to an index. Parameters that do not apply to the index are ignored.
+
+    Args:
+        index (faiss.Index): The index to tune.
+        nprobe (int): Number of IVF lists visited per query.
+        ef_search (int): Size of the HNSW candidate list per query.
+
+    Returns:
+        (faiss.Index): The same index.
+    """
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None:
+        if nprobe:
+            ivf_index.nprobe = nprobe
+        # reconstruct() on IVF indexes needs a direct map
+        if ivf_index.direct_map.type == faiss.DirectMap.NoMap:
+            ivf_index.make_direct_map()
+
+    hnsw_index = faiss.downcast_index(index)
+    if isinstance(hnsw_index, faiss.IndexHNSW) and ef_search:
+        hnsw_index.hnsw.efSearch = ef_search
+
+    return index
+
+
+def supports_compacting_remove(index: faiss.Index) -> bool:
+    """
+    Tells if remove_ids() on the index renumbers the remaining rows contiguously,
+    which is what LangChain's FAISS.delete assumes.
+
+    Args:
+        index (faiss.Index): The index.
+
+    Returns:
+        (bool): True for flat-code indexes (flat, sq_fp16, sq_int8, pq).
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes)
+
+
+def build_index(
+        vectors: np.ndarray,
+        index_type: str = "flat",
+        nlist: int = 1024,
+        nprobe: int = None,
+        pq_m: int = 64,
+        hnsw_m: int = 32,
+        ef_search: int = None,
+        max_training_points: int = 100000
+        ) -> faiss.Index:
+    """
+    Creates an index of the requested type, trains it on (a sample of) the vectors and adds all vectors in row order.
+
+    Args:
+        vectors (np.ndarray): float32 array of shape (n, dimensions).
+        index_type (str): One of INDEX_TYPES.
+        nlist (int): Number of IVF lists.
+        nprobe (int): Number of IVF lists visited per query.
+        pq_m (int): Number of PQ sub-quantizers.
+        hnsw_m (int): Number of neighbours per HNSW node.
+        ef_search (int): Size of the HNSW candidate list per query.
+        max_training_points (int): Upper bound on the number of vectors used for training.
+
+    Returns:
+        (faiss.Index): The populated index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimensions = vectors.shape
+
+    index = create_index(dimensions, index_type=index_type, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m, ntrain=count)
+
+    if not index.is_trained:
+        if count > max_training_points:
+            sample_rows = np.random.default_rng(0).choice(count, max_training_points, replace=False)
+            training_vectors = vectors[np.sort(sample_rows)]
+        else:
+            training_vectors = vectors
+        index.train(training_vectors)
+
+    if count:
+        index.add(vectors)
+
+    return configure_search(index, nprobe=nprobe, ef_search=ef_search)
+
+
+def measure_recall(
+        index: faiss.Index,
+        vectors: np.ndarray,
+        sample_size: int = 200,
+        k: int = 10
+        ) -> float:
+    """
+    Measures recall@k of an index against exact (flat) search, using stored vectors as queries.
+
+    Each query is a stored row, which every index finds at distance 0: that row is dropped from both
+    result lists, so recall is measured on its k other neighbours, as for a query that is not stored.
+
+    Args:
+        index (faiss.Index): The index to evaluate. Rows must match the rows of `vectors`.
+        vectors (np.ndarray): The vectors stored in the index, in row order.
+        sample_size (int): Number of query vectors sampled from `vectors`.
+        k (int): Number of neighbours compared.
+
+    Returns:
+        (float): Mean fraction of the exact top-k found by the index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count = vectors.shape[0]
+    k = min(k, count - 1)
+    if k <= 0:
+        return 1.0
+
+    sample_rows = np.random.default_rng(1).choice(count, min(sample_size, count), replace=False)
+    queries = vectors[sample_rows]
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    _, exact_rows = exact_index.search(queries, k + 1)
+    _, found_rows = index.search(queries, k + 1)
+
+    hits = 0
+    for row, exact, found in zip(sample_rows, exact_rows, found_rows):
+        exact = [neighbour for neighbour in exact if neighbour != row][:k]
+        found = [neighbour for neighbour in found if neighbour != row and neighbour != -1][:k]
+        hits += len(set(exact) & set(found))
+    return hits / float(k * len(queries))
+
+
+def get_index_type(index: faiss.Index) -> str:
+    """
+    Tells which of INDEX_TYPES an existing index corresponds to.
+
+    Args:
+        index (faiss.Index): The index.
+
+    Returns:
+        (str): One of INDEX_TYPES, 'flat' for anything else.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+
+def is_exhaustive(index: faiss.Index) -> bool:
+    """
+    Tells if a search on the index compares the query with every row, so that a search restricted with an
+    ID selector finds the nearest selected rows. IVF indexes only visit nprobe lists and HNSW only walks
+    the graph around the query, so selected rows elsewhere are never reached.
+
+    Args:
+        index (faiss.Index): The index.
+
+    Returns:
+        (bool): True for flat-code indexes (flat, sq_fp16, sq_int8, pq).
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes)
+
+
+def supports_selector(index: faiss.Index) -> bool:
+    """
+    Tells if searches on the index can be restricted with an ID selector.
+
+    Args:
+        index (faiss.Index): The index.
+
+    Returns:
+        (bool): False for pq indexes, whose search does not accept a selector.
+    """
+    return not isinstance(faiss.downcast_index(index), faiss.IndexPQ)
+
+
+def search_parameters(
+        index: faiss.Index,
+        selector: faiss.IDSelector = None,
+        nprobe: int = None,
+        ef_search: int = None
+        ) -> faiss.SearchParameters:
+    """
+    Creates per-query search parameters of the right kind for an index, optionally restricted to an ID selector.
+
+    Args:
+        index (faiss.Index): The index that will be searched.
+        selector (faiss.IDSelector): Only rows accepted by the selector are returned.
+        nprobe (int): Number of IVF lists visited per query.
+        ef_search (int): Size of the HNSW candidate list per query.
+
+    Returns:
+        (faiss.SearchParameters): Parameters to pass as `params` to index.search.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexPQ):
+        return faiss.SearchParametersPQ(sel=selector)
+    return faiss.SearchParameters(sel=selector)
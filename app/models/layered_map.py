@@ -0,0 +1,173 @@
+"""
+This module holds the layered map and set in which FAISS_DB snapshots publish their per-file side-indexes
+and tombstones.
+
+A layered collection is a base (shared by every snapshot derived from it, never modified) plus a small
+layer of the changes made since. A writer derives a draft with child(), which copies the layer only, and
+modifies the draft before it is published; published collections are never modified. Once the layer
+outgrows LAYER_MIN_SIZE and the square root of the base, child() folds it into a new base, so a change
+costs O(sqrt(entries)) amortized instead of a copy of every entry.
+"""
+
+import math
+from collections.abc import MutableMapping, MutableSet
+
+import numpy as np
+import faiss
+
+# Changes kept in the layer before it is folded into a new base, at least
+LAYER_MIN_SIZE = 64
+
+_REMOVED = object()
+
+
+def _layer_is_full(layer_size: int, base_size: int) -> bool:
+    return layer_size > max(LAYER_MIN_SIZE, math.isqrt(base_size))
+
+
+class LayeredMap(MutableMapping):
+    """
+    Dict-like map made of a shared base dict and a layer of the entries set or removed since.
+
+    Attributes:
+        base (dict): Entries shared with the maps derived from the same base.
+    """
+
+    __slots__ = ("base", "_changes", "_length")
+
+    def __init__(self, base: dict = None) -> None:
+        """
+        Initializes the LayeredMap class.
+
+        Args:
+            base (dict): The entries. Owned by the map from now on: the caller must not modify it.
+        """
+        self.base = base if base is not None else {}
+        self._changes = {}
+        self._length = len(self.base)
+
+    def child(self) -> "LayeredMap":
+        """
+        Gets a modifiable copy of the map, sharing its base.
+
+        Returns:
+            (LayeredMap): The copy.
+        """
+        if _layer_is_full(len(self._changes), len(self.base)):
+            return LayeredMap(dict(self.items()))
+        draft = LayeredMap.__new__(LayeredMap)
+        draft.base = self.base
+        draft._changes = dict(self._changes)
+        draft._length = self._length
+        return draft
+
+    def __getitem__(self, key):
+        value = self._changes.get(key, self._changes)
+        if value is self._changes:
+            return self.base[key]
+        if value is _REMOVED:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        value = self._changes.get(key, self._changes)
+        if value is self._changes:
+            return key in self.base
+        return value is not _REMOVED
+
+    def __setitem__(self, key, value) -> None:
+        if key not in self:
+            self._length += 1
+        self._changes[key] = value
+
+    def __delitem__(self, key) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._length -= 1
+        if key in self.base:
+            self._changes[key] = _REMOVED
+        else:
+            del self._changes[key]
+
+    def __iter__(self):
+        for key in self.base:
+            if key not in self._changes:
+                yield key
+        for key, value in self._changes.items():
+            if value is not _REMOVED:
+                yield key
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class LayeredSet(MutableSet):
+    """
+    Set made of a shared frozenset base and a layer of the elements added since. Elements are only
+    removed by starting over from an empty set (compaction).
+
+    Attributes:
+        base (frozenset): Elements shared with the sets derived from the same base.
+    """
+
+    __slots__ = ("base", "_added", "_base_selector")
+
+    def __init__(self, base: frozenset = frozenset()) -> None:
+        """
+        Initializes the LayeredSet class.
+
+        Args:
+            base (frozenset): The elements.
+        """
+        self.base = frozenset(base)
+        self._added = set()
+        # [selector] of the base rows, built once and shared by the sets derived from the same base
+        self._base_selector = []
+
+    def child(self) -> "LayeredSet":
+        """
+        Gets a modifiable copy of the set, sharing its base.
+
+        Returns:
+            (LayeredSet): The copy.
+        """
+        if _layer_is_full(len(self._added), len(self.base)):
+            return LayeredSet(self.base | self._added)
+        draft = LayeredSet.__new__(LayeredSet)
+        draft.base = self.base
+        draft._added = set(self._added)
+        draft._base_selector = self._base_selector
+        return draft
+
+    def __contains__(self, element) -> bool:
+        return element in self._added or element in self.base
+
+    def __iter__(self):
+        yield from self.base
+        yield from self._added
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self._added)
+
+    def add(self, element) -> None:
+        if element not in self.base:
+            self._added.add(element)
+
+    def discard(self, element) -> None:
+        raise NotImplementedError("Elements of a LayeredSet are only removed by starting over from an empty set")
+
+    def selector(self) -> tuple:
+        """
+        Gets a FAISS ID selector of the elements (index rows). The selector of the base is built once for
+        every set sharing it; only the layer is converted per set.
+
+        Returns:
+            (tuple): The selector, then the selectors it references, which must be kept alive with it.
+        """
+        if not self._base_selector:
+            self._base_selector.append(faiss.IDSelectorBatch(np.fromiter(self.base, dtype=np.int64, count=len(self.base))))
+        base_selector = self._base_selector[0]
+        if not self._added:
+            return (base_selector,)
+        added_selector = faiss.IDSelectorBatch(np.fromiter(self._added, dtype=np.int64, count=len(self._added)))
+        return (faiss.IDSelectorOr(base_selector, added_selector), base_selector, added_selector)
@@ -0,0 +1,338 @@
+"""
+This module handles the BM25 inverted index kept alongside a FAISS_DB for exact-token matches
+(dealer codes, question numbers such as "148c", labels such as "FLASH ARES MAINTENANCE").
+
+The index is a list of immutable segments, like the vector store's segmented persistence: every add
+appends a small segment, and segments of similar size are merged so there are O(log n) of them.
+A LexicalIndex is never modified (add and compact return a new one), so a published snapshot can
+be searched while a writer prepares the next one. Deleted pages are filtered at search time with
+the snapshot's tombstones and dropped from the segments when they are merged or compacted.
+
+Each segment stores its postings in CSR form: for term t, rows offsets[t]:offsets[t + 1] of
+doc_index / tf are the segment documents holding t and how often.
+"""
+
+import re
+import math
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Rank constant of reciprocal rank fusion
+RRF_K = 60
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits a text into lowercase, accent-free word tokens. Codes like "148c" or "B2-07" stay searchable
+    ("148c", "b2", "07").
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        (list): The tokens.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return _TOKEN_PATTERN.findall(text)
+
+
+class LexicalSegment():
+    """
+    Immutable inverted index of a set of pages.
+
+    Attributes:
+        doc_ids (list): Docstore ids of the pages, in segment order.
+        lengths (np.ndarray): Number of tokens of each page.
+        vocabulary (dict): term -> term number.
+        offsets (np.ndarray): Start of the postings of each term number (length len(vocabulary) + 1).
+        doc_index (np.ndarray): Segment position of the page of each posting.
+        tf (np.ndarray): Term frequency of each posting.
+    """
+
+    __slots__ = ("doc_ids", "lengths", "vocabulary", "offsets", "doc_index", "tf", "_positions")
+
+    def __init__(self, doc_ids: list, lengths: np.ndarray, vocabulary: dict, offsets: np.ndarray, doc_index: np.ndarray, tf: np.ndarray) -> None:
+        self.doc_ids = doc_ids
+        self.lengths = lengths
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_index = doc_index
+        self.tf = tf
+        self._positions = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def positions(self, doc_ids: set) -> np.ndarray:
+        """
+        Gets the segment positions of the given docstore ids that are in the segment.
+        """
+        if self._positions is None:
+            self._positions = {doc_id: position for position, doc_id in enumerate(self.doc_ids)}
+        return np.array([self._positions[doc_id] for doc_id in doc_ids if doc_id in self._positions], dtype=np.int64)
+
+    def nbytes(self) -> int:
+        """
+        Estimates the memory held by the segment (arrays, plus about 100 bytes per term and per page id).
+        """
+        arrays = self.lengths.nbytes + self.offsets.nbytes + self.doc_index.nbytes + self.tf.nbytes
+        return arrays + 100 * (len(self.vocabulary) + len(self.doc_ids))
+
+    @classmethod
+    def from_postings(cls, doc_ids: list, lengths: np.ndarray, vocabulary: dict, term_ids: np.ndarray, doc_index: np.ndarray, tf: np.ndarray) -> "LexicalSegment":
+        """
+        Builds a segment from unordered (term number, page position, frequency) postings.
+        """
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(doc_ids, lengths, vocabulary, offsets, doc_index[order].astype(np.int32), tf[order].astype(np.float32))
+
+    @classmethod
+    def build(cls, doc_ids: list, texts: list) -> "LexicalSegment":
+        """
+        Tokenizes pages into a new segment.
+
+        Args:
+            doc_ids (list): Docstore ids of the pages.
+            texts (list): Texts of the pages, in the same order.
+
+        Returns:
+            (LexicalSegment): The segment.
+        """
+        vocabulary = {}
+        term_ids, doc_index, tf = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.int32)
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[position] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_index.append(position)
+                tf.append(count)
+
+        return cls.from_postings(
+            list(doc_ids), lengths, vocabulary,
+            np.array(term_ids, dtype=np.int64), np.array(doc_index, dtype=np.int64), np.array(tf, dtype=np.float32)
+        )
+
+    @classmethod
+    def merge(cls, segments: list, is_live=None) -> "LexicalSegment":
+        """
+        Merges segments into one, dropping pages that are no longer live.
+
+        Args:
+            segments (list): The segments, in order.
+            is_live: Called with a docstore id, False for deleted pages. All pages are kept if None.
+
+        Returns:
+            (LexicalSegment): The merged segment.
+        """
+        if not segments:
+            return cls.build([], [])
+
+        vocabulary = {}
+        doc_ids, lengths, term_ids, doc_index, tf = [], [], [], [], []
+        for segment in segments:
+            keep = np.array([is_live is None or is_live(doc_id) for doc_id in segment.doc_ids], dtype=bool)
+            # Old page position -> new page position (-1 for dropped pages)
+            new_position = np.full(len(segment), -1, dtype=np.int64)
+            new_position[keep] = np.arange(len(doc_ids), len(doc_ids) + int(keep.sum()))
+            doc_ids.extend(doc_id for doc_id, kept in zip(segment.doc_ids, keep) if kept)
+            lengths.append(segment.lengths[keep])
+
+            term_map = np.empty(len(segment.vocabulary), dtype=np.int64)
+            for term, term_id in segment.vocabulary.items():
+                term_map[term_id] = vocabulary.setdefault(term, len(vocabulary))
+            posting_terms = np.repeat(term_map, np.diff(segment.offsets))
+            posting_positions = new_position[segment.doc_index]
+            kept_postings = posting_positions >= 0
+            term_ids.append(posting_terms[kept_postings])
+            doc_index.append(posting_positions[kept_postings])
+            tf.append(segment.tf[kept_postings])
+
+        return cls.from_postings(
+            doc_ids, np.concatenate(lengths), vocabulary,
+            np.concatenate(term_ids), np.concatenate(doc_index), np.concatenate(tf)
+        )
+
+    def postings(self, term: str) -> (tuple[np.ndarray, np.ndarray] | None):
+        """
+        Gets the page positions and frequencies of a term, None if no page holds it.
+        """
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return None
+        start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.doc_index[start:stop], self.tf[start:stop]
+
+    def to_arrays(self) -> dict:
+        """
+        Gets the segment as numpy arrays (no pickled objects), see from_arrays.
+        """
+        terms = [None] * len(self.vocabulary)
+        for term, term_id in self.vocabulary.items():
+            terms[term_id] = term
+        return {
+            "doc_ids": np.array(self.doc_ids, dtype=str),
+            "lengths": self.lengths,
+            "terms": np.array(terms, dtype=str),
+            "offsets": self.offsets,
+            "doc_index": self.doc_index,
+            "tf": self.tf
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "LexicalSegment":
+        """
+        Rebuilds a segment saved with to_arrays.
+        """
+        return cls(
+            arrays["doc_ids"].tolist(),
+            arrays["lengths"],
+            {term: term_id for term_id, term in enumerate(arrays["terms"].tolist())},
+            arrays["offsets"],
+            arrays["doc_index"],
+            arrays["tf"]
+        )
+
+
+class LexicalIndex():
+    """
+    Immutable BM25 index over all pages of a vector store, made of LexicalSegments.
+
+    Attributes:
+        segments (tuple): The segments, oldest first.
+    """
+
+    __slots__ = ("segments",)
+
+    def __init__(self, segments: tuple = ()) -> None:
+        self.segments = tuple(segments)
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def nbytes(self) -> int:
+        """
+        Estimates the memory held by the index.
+        """
+        return sum(segment.nbytes() for segment in self.segments)
+
+    def add(self, doc_ids: list, texts: list, is_live=None) -> "LexicalIndex":
+        """
+        Gets a new index holding the given pages as well.
+
+        The new pages form a segment; while the previous segment is not larger than the last one,
+        the two are merged, so the number of segments stays logarithmic in the number of pages.
+
+        Args:
+            doc_ids (list): Docstore ids of the pages.
+            texts (list): Texts of the pages, in the same order.
+            is_live: Called with a docstore id, False for deleted pages (dropped when segments merge).
+
+        Returns:
+            (LexicalIndex): The new index.
+        """
+        segments = list(self.segments) + [LexicalSegment.build(doc_ids, texts)]
+        while len(segments) > 1 and len(segments[-2]) <= len(segments[-1]):
+            segments[-2:] = [LexicalSegment.merge(segments[-2:], is_live)]
+        return LexicalIndex(segments)
+
+    def compact(self, is_live) -> "LexicalIndex":
+        """
+        Gets a new index made of a single segment without the deleted pages.
+
+        Args:
+            is_live: Called with a docstore id, False for deleted pages.
+
+        Returns:
+            (LexicalIndex): The new index.
+        """
+        return LexicalIndex([LexicalSegment.merge(self.segments, is_live)])
+
+    def search(self, query: str, n: int, allowed_ids: set = None, excluded_ids: set = None) -> list[tuple[str, float]]:
+        """
+        Ranks pages by BM25 score for the query.
+
+        Args:
+            query (str): The query text.
+            n (int): Maximum number of pages to return.
+            allowed_ids (set): If given, only these docstore ids are ranked.
+            excluded_ids (set): Docstore ids never returned (e.g. tombstoned pages).
+
+        Returns:
+            (list): (docstore id, score) pairs, best first. Pages without any query term are not returned.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.segments or n <= 0:
+            return []
+
+        total_pages = len(self)
+        average_length = max(sum(float(segment.lengths.sum()) for segment in self.segments) / max(total_pages, 1), 1.0)
+        document_frequency = {
+            term: sum(len(postings[0]) for postings in (segment.postings(term) for segment in self.segments) if postings is not None)
+            for term in terms
+        }
+
+        candidates = []
+        for segment in self.segments:
+            scores = None
+            for term in terms:
+                postings = segment.postings(term)
+                if postings is None:
+                    continue
+                doc_index, tf = postings
+                df = document_frequency[term]
+                idf = math.log(1 + (total_pages - df + 0.5) / (df + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.lengths[doc_index] / average_length)
+                if scores is None:
+                    scores = np.zeros(len(segment), dtype=np.float32)
+                scores[doc_index] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            if scores is None:
+                continue
+
+            if allowed_ids is not None:
+                allowed = np.zeros(len(segment), dtype=bool)
+                allowed[segment.positions(allowed_ids)] = True
+                scores[~allowed] = 0
+            positions = np.flatnonzero(scores)
+
+            # Excluded pages are few (tombstones not merged away yet): rank a few more and drop them
+            top_n = n + len(excluded_ids or ())
+            if len(positions) > top_n:
+                positions = positions[np.argpartition(-scores[positions], top_n - 1)[:top_n]]
+            candidates.extend(
+                (segment.doc_ids[position], float(scores[position])) for position in positions
+                if not (excluded_ids and segment.doc_ids[position] in excluded_ids)
+            )
+
+        candidates.sort(key=lambda candidate: candidate[1], reverse=True)
+        return candidates[:n]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list[str]:
+    """
+    Fuses rankings with reciprocal rank fusion: each id scores sum(1 / (k + rank)) over the rankings it appears in.
+
+    Args:
+        rankings (list): Lists of ids, best first.
+        k (int): Rank constant; higher values flatten the contribution of the top ranks.
+
+    Returns:
+        (list): The ids, best fused score first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
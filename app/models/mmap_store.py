@@ -0,0 +1,224 @@
+"""
+This module handles read-only, memory-mapped access to a FAISS_DB base snapshot.
+
+The vectors of a flat index are mapped straight out of the base .faiss file and the documents
+out of the docstore files written next to it (see segment_store.write_mmap_docstore):
+
+    base-000003.ids.json     -> docstore ids, in index row order
+    base-000003.docs.bin     -> one JSON record {"page_content", "metadata"} per row, concatenated
+    base-000003.docs.npy     -> int64 byte offsets of the records (rows + 1 entries)
+
+Pages are only read when a search touches them and stay in the OS page cache, so every worker
+process that opens the same snapshot shares one copy of the corpus instead of holding its own.
+"""
+
+import os
+import json
+import struct
+
+import numpy as np
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+# Header of an IndexFlat written by faiss.write_index:
+# fourcc, d (int32), ntotal (int64), two dummy int64, is_trained (bool), metric_type (int32), code count (uint64)
+_FLAT_HEADER = struct.Struct("<4siqqq?iQ")
+_FLAT_FOURCCS = {b"IxF2": faiss.METRIC_L2, b"IxFI": faiss.METRIC_INNER_PRODUCT}
+
+
+def resident_memory_mb() -> (float | None):
+    """
+    Gets the resident set size of the current process.
+
+    Returns:
+        (float | None): RSS in MB, None on platforms without /proc.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def is_flat_index_file(index_path: str) -> bool:
+    """
+    Tells if a .faiss file holds a plain IndexFlat (L2 or inner product), which can be memory-mapped directly.
+
+    Args:
+        index_path (str): Path of the .faiss file.
+
+    Returns:
+        (bool): True for IndexFlatL2 / IndexFlatIP files.
+    """
+    with open(index_path, "rb") as index_file:
+        return index_file.read(4) in _FLAT_FOURCCS
+
+
+class MmapFlatIndex():
+    """
+    Read-only stand-in for a faiss IndexFlat whose vectors stay in a memory-mapped file.
+
+    Implements the subset of the faiss.Index interface used by FAISS_DB and LangChain's FAISS
+    for searching and reading (d, ntotal, search, reconstruct, reconstruct_n, reconstruct_batch).
+
+    Attributes:
+        d (int): Dimension of the vectors.
+        ntotal (int): Number of vectors.
+        metric_type (int): faiss.METRIC_L2 or faiss.METRIC_INNER_PRODUCT.
+        vectors (np.memmap): The (ntotal, d) float32 vectors, mapped read-only.
+    """
+
+    is_trained = True
+
+    def __init__(self, index_path: str) -> None:
+        """
+        Maps the vectors of a flat .faiss file.
+
+        Args:
+            index_path (str): Path of the .faiss file.
+        """
+        with open(index_path, "rb") as index_file:
+            header = index_file.read(_FLAT_HEADER.size)
+        fourcc, d, ntotal, _, _, _, metric_type, code_count = _FLAT_HEADER.unpack(header)
+
+        if fourcc not in _FLAT_FOURCCS or metric_type != _FLAT_FOURCCS[fourcc]:
+            raise ValueError(f"{index_path} is not a flat FAISS index")
+        if code_count != ntotal * d or os.path.getsize(index_path) != _FLAT_HEADER.size + code_count * 4:
+            raise ValueError(f"Unexpected layout of flat FAISS index {index_path}")
+
+        self.d = d
+        self.ntotal = ntotal
+        self.metric_type = metric_type
+        if ntotal:
+            self.vectors = np.memmap(index_path, dtype=np.float32, mode="r", offset=_FLAT_HEADER.size, shape=(ntotal, d))
+        else:
+            self.vectors = np.zeros((0, d), dtype=np.float32)
+
+    def search(self, x: np.ndarray, k: int, params=None, rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Exact k-nearest-neighbour search, like IndexFlat.search.
+
+        Args:
+            x (np.ndarray): (n, d) float32 queries.
+            k (int): Number of neighbours.
+            params: Ignored. Accepted for compatibility with faiss.Index.search.
+            rows (np.ndarray): If given, only these rows are searched.
+
+        Returns:
+            (np.ndarray, np.ndarray): Distances and row labels, -1 padded like faiss.
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        candidates = self.vectors if rows is None else self.vectors[np.sort(rows)]
+
+        distances = np.full((x.shape[0], k), np.inf if self.metric_type == faiss.METRIC_L2 else -np.inf, dtype=np.float32)
+        labels = np.full((x.shape[0], k), -1, dtype=np.int64)
+
+        found = min(k, candidates.shape[0])
+        if found:
+            distances[:, :found], labels[:, :found] = faiss.knn(x, candidates, found, metric=self.metric_type)
+            if rows is not None:
+                labels[:, :found] = np.sort(rows)[labels[:, :found]]
+
+        return distances, labels
+
+    def reconstruct(self, key: int) -> np.ndarray:
+        """
+        Copies one stored vector.
+        """
+        return np.array(self.vectors[key])
+
+    def reconstruct_n(self, n0: int, ni: int) -> np.ndarray:
+        """
+        Copies `ni` consecutive stored vectors starting at row `n0`.
+        """
+        return np.array(self.vectors[n0:n0 + ni])
+
+    def reconstruct_batch(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Copies the stored vectors of the given rows.
+        """
+        return np.array(self.vectors[np.asarray(keys, dtype=np.int64)])
+
+
+class MmapDocstore(Docstore):
+    """
+    Read-only docstore reading documents on demand from the memory-mapped docstore files of a base snapshot.
+
+    Attributes:
+        ids (list): Docstore ids, in index row order.
+    """
+
+    def __init__(self, directory: str, base: str) -> None:
+        """
+        Maps the docstore files of a base snapshot.
+
+        Args:
+            directory (str): The persist directory.
+            base (str): Name of the base snapshot.
+        """
+        with open(os.path.join(directory, f"{base}.ids.json"), "r", encoding="utf-8") as ids_file:
+            self.ids = json.load(ids_file)
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(os.path.join(directory, f"{base}.docs.npy"), mmap_mode="r")
+
+        data_path = os.path.join(directory, f"{base}.docs.bin")
+        if os.path.getsize(data_path):
+            self._data = np.memmap(data_path, dtype=np.uint8, mode="r")
+        else:
+            self._data = np.zeros(0, dtype=np.uint8)
+
+    def search(self, search: str) -> (Document | str):
+        """
+        Reads a document by docstore id.
+
+        Args:
+            search (str): The docstore id.
+
+        Returns:
+            (Document | str): The document, or a not-found message like InMemoryDocstore.
+        """
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+
+        record = json.loads(self._data[int(self._offsets[row]):int(self._offsets[row + 1])].tobytes())
+        return Document(id=search, page_content=record["page_content"], metadata=record["metadata"])
+
+
+def has_mmap_docstore(directory: str, base: str) -> bool:
+    """
+    Tells if the memory-mappable docstore files of a base snapshot exist.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+
+    Returns:
+        (bool): True if all docstore files exist.
+    """
+    return all(
+        os.path.exists(os.path.join(directory, f"{base}{extension}"))
+        for extension in (".ids.json", ".docs.bin", ".docs.npy")
+    )
+
+
+def load_index(index_path: str):
+    """
+    Opens the index of a base snapshot without reading it into memory.
+
+    Flat indexes are mapped with MmapFlatIndex. Other index types are read with faiss' own
+    mmap flag, which maps the inverted lists of IVF indexes (HNSW graphs are still read).
+
+    Args:
+        index_path (str): Path of the .faiss file.
+
+    Returns:
+        (MmapFlatIndex | faiss.Index): The read-only index.
+    """
+    if is_flat_index_file(index_path):
+        return MmapFlatIndex(index_path)
+    return faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
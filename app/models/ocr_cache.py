@@ -0,0 +1,113 @@
+"""
+This module handles the persistent cache of OCR results put in front of the vision model.
+
+Extracted page texts are keyed by sha256 of the encoded page image, under a prefix derived from the vision
+deployment and the OCR prompt. A re-uploaded report, an unchanged SharePoint file synced again, or a file
+retried after one failed page is then served from the cache instead of the vision model. Entries of another
+prompt or deployment are never served: they are purged when the cache is opened, and are least recently
+used anyway. Entries live in a SQLiteByteStore (see app/models/embedding_cache.py), shared by the workers.
+"""
+
+import json
+import hashlib
+from typing import Optional
+
+from app.models.embedding_cache import SQLiteByteStore
+from app.logger import logging
+
+
+def prompt_version(deployment: str, ocr_prompt: dict | list) -> str:
+    """
+    Gets the version of the OCR results of a deployment and prompt: any change of either gives another version.
+
+    Args:
+        deployment (str): Name of the vision model deployment.
+        ocr_prompt (dict | list): The OCR prompt message(s), and any other text the requests are built from
+            (see app/models/prompts.py).
+
+    Returns:
+        (str): 16 hex characters.
+    """
+    payload = json.dumps({"deployment": deployment, "prompt": ocr_prompt}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class OCRResultCache():
+    """
+    Disk-backed cache of the text extracted from page images.
+
+    Attributes:
+        version (str): Prompt version of the entries served, see prompt_version.
+        store (SQLiteByteStore): Store of the page texts.
+    """
+
+    def __init__(self, path: str, deployment: str, ocr_prompt: dict | list, max_bytes: int = 512 * 1024 ** 2) -> None:
+        """
+        Initializes the OCRResultCache class and purges the entries of other prompt versions.
+
+        Args:
+            path (str): Path of the SQLite cache file.
+            deployment (str): Name of the vision model deployment, part of the prompt version.
+            ocr_prompt (dict | list): The OCR prompt message(s), part of the prompt version.
+            max_bytes (int): Maximum size of the stored texts, in bytes.
+        """
+        self.version = prompt_version(deployment, ocr_prompt)
+        self.store = SQLiteByteStore(path, table="ocr_results", max_bytes=max_bytes)
+        self.purge_stale()
+
+    def key(self, image_bytes: bytes) -> str:
+        """
+        Gets the cache key of an encoded page image.
+
+        Args:
+            image_bytes (bytes): The image as sent to the vision model.
+
+        Returns:
+            (str): "<prompt version>:<sha256 of the image>".
+        """
+        return f"{self.version}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Gets the cached text of a page image.
+
+        Args:
+            key (str): Key of the image, see key.
+
+        Returns:
+            (str): The extracted text, None if not cached.
+        """
+        value = self.store.mget([key])[0]
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, text: str) -> None:
+        """
+        Stores the text extracted from a page image.
+
+        Args:
+            key (str): Key of the image, see key.
+            text (str): The extracted text.
+        """
+        self.store.mset([(key, text.encode("utf-8"))])
+
+    def purge_stale(self) -> int:
+        """
+        Deletes the entries of other prompt versions (changed OCR prompt or deployment).
+
+        Returns:
+            (int): Number of deleted entries.
+        """
+        stale_keys = [key for key in self.store.yield_keys() if not key.startswith(f"{self.version}:")]
+        if stale_keys:
+            self.store.mdelete(stale_keys)
+            logging.info(f"OCR cache : purged {len(stale_keys)} entries of previous prompt versions")
+        return len(stale_keys)
+
+    def stats(self) -> dict:
+        """
+        Gets the counters and current size of the cache.
+
+        Returns:
+            (dict): The SQLiteByteStore stats and the prompt version.
+        """
+        return {**self.store.stats(), "prompt_version": self.version}
@@ -0,0 +1,274 @@
+"""
+This module handles the scheduling of OCR (vision model) requests.
+
+All page extractions of a process go through one OCR_SCHEDULER, which keeps the request rate under
+the requests-per-minute and tokens-per-minute quota of the deployment with two token buckets, bounds
+the number of requests in flight, and serves waiting requests by priority: pages of interactive /embed
+uploads before pages of the bulk SharePoint sync, first come first served within a priority.
+
+Requests rejected with 429 or failing transiently are retried with jittered exponential backoff (or the
+Retry-After delay sent by the service); a 429 also pauses dispatching, since the whole deployment is
+over its quota.
+"""
+
+import sys
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from collections import deque
+
+import openai
+
+from app.logger import logging
+from app.exception import get_error_message_detail
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Errors worth retrying: rate limiting, timeouts, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket():
+    """
+    Token bucket refilled continuously at rate_per_minute / 60 per second.
+
+    Attributes:
+        rate_per_minute (float): Refill rate.
+        capacity (float): Maximum number of stored tokens (the allowed burst).
+        tokens (float): Tokens currently available.
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10) -> None:
+        """
+        Initializes the TokenBucket class, full.
+
+        Args:
+            rate_per_minute (float): Refill rate.
+            burst_seconds (float): The capacity is the refill of this many seconds (Azure enforces quotas over short windows).
+        """
+        self.rate_per_minute = rate_per_minute
+        self.capacity = max(1.0, rate_per_minute * burst_seconds / 60)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Gets the seconds until amount tokens are available (0 if they are). Amounts above the capacity need a full bucket.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.rate_per_minute
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def empty(self) -> None:
+        self._refill()
+        self.tokens = 0.0
+
+
+class OCR_SCHEDULER():
+    """
+    Process-wide, rate-limited, prioritized scheduler of OCR requests.
+
+    Attributes:
+        requests_per_minute (int): Request quota of the vision deployment.
+        tokens_per_minute (int): Token quota of the vision deployment.
+        max_concurrency (int): Maximum number of requests in flight.
+        max_retries (int): Number of retries of a failed request.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: int = 60,
+            tokens_per_minute: int = 60000,
+            max_concurrency: int = 8,
+            max_retries: int = 6,
+            base_delay: float = 1.0,
+            max_delay: float = 60.0,
+            history: int = 1000
+            ) -> None:
+        """
+        Initializes the OCR_SCHEDULER class.
+
+        Args:
+            requests_per_minute (int): Request quota of the vision deployment.
+            tokens_per_minute (int): Token quota of the vision deployment (prompt + image + max completion tokens).
+            max_concurrency (int): Maximum number of requests in flight.
+            max_retries (int): Number of retries of a failed request.
+            base_delay (float): Backoff of the first retry, in seconds.
+            max_delay (float): Upper bound of the backoff, in seconds.
+            history (int): Number of recent queue wait times kept per priority for the percentiles.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer = None
+
+        self._waits = {priority: deque(maxlen=history) for priority in PRIORITY_NAMES}
+        self.counters = {"dispatched": 0, "succeeded": 0, "failed": 0, "retries": 0, "rate_limited": 0}
+
+    def _dispatch(self) -> None:
+        """
+        Starts waiting requests, in priority order, while the concurrency limit and both buckets allow it.
+        If the head of the queue has to wait for the buckets, a timer calls this again when it can start.
+        """
+        self._timer = None
+        while self._waiters and self._in_flight < self.max_concurrency:
+            _, _, future, tokens, _ = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self._request_bucket.wait_time(1),
+                self._token_bucket.wait_time(tokens)
+            )
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._waiters)
+            self._request_bucket.take(1)
+            self._token_bucket.take(tokens)
+            self._in_flight += 1
+            self.counters["dispatched"] += 1
+            future.set_result(None)
+
+    async def _acquire(self, priority: int, tokens: int) -> None:
+        """
+        Waits for the turn of a request, see _dispatch.
+        """
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future, tokens, enqueued))
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Dispatched just before the cancellation: give the slot back
+                self._release()
+            raise
+        self._waits[priority].append(time.monotonic() - enqueued)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        if self._timer is None:
+            self._dispatch()
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Gets the wait before a retry: the Retry-After header of a 429 if sent, otherwise full-jitter exponential backoff.
+        """
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), self.max_delay) + random.uniform(0, self.base_delay)
+        except ValueError:
+            pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, request, priority: int = BULK, tokens: int = 1000, label: str = ""):
+        """
+        Runs an OCR request when its turn comes, retrying it on rate limiting and transient errors.
+
+        Args:
+            request: Called without arguments to get the awaitable of one attempt (e.g. lambda: chain.ainvoke(image)).
+            priority (int): INTERACTIVE or BULK.
+            tokens (int): Estimated tokens of the request, taken from the tokens-per-minute bucket.
+            label (str): Name of the request for logs (e.g. file and page).
+
+        Returns:
+            The result of the request.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, tokens)
+            try:
+                result = await request()
+                self.counters["succeeded"] += 1
+                return result
+
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, openai.RateLimitError):
+                    self.counters["rate_limited"] += 1
+                if attempt == self.max_retries:
+                    self.counters["failed"] += 1
+                    error_message = get_error_message_detail(e, sys)
+                    logging.error(f"OCR request {label} still failing after {self.max_retries} retries : {error_message}")
+                    raise
+
+                delay = self._retry_delay(e, attempt)
+                if isinstance(e, openai.RateLimitError):
+                    # The deployment is over its quota: hold every request, not only this one
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    self._request_bucket.empty()
+                self.counters["retries"] += 1
+                logging.warning(f"OCR request {label} failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+
+            except Exception:
+                self.counters["failed"] += 1
+                raise
+
+            finally:
+                self._release()
+
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """
+        Gets the queue depth, the requests in flight, the counters and the recent queue wait times per priority.
+
+        Returns:
+            (dict): The scheduler metrics.
+        """
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future, _, _ in self._waiters:
+            if not future.done():
+                queued[PRIORITY_NAMES[priority]] += 1
+
+        waits = {}
+        for priority, name in PRIORITY_NAMES.items():
+            recent = sorted(self._waits[priority])
+            waits[name] = {
+                "count": len(recent),
+                "p50_s": recent[len(recent) // 2] if recent else None,
+                "p95_s": recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else None,
+                "max_s": recent[-1] if recent else None
+            }
+
+        return {
+            "queued": queued,
+            "in_flight": self._in_flight,
+            "paused_s": max(0.0, self._paused_until - time.monotonic()),
+            "wait": waits,
+            **self.counters,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "max_concurrency": self.max_concurrency
+        }
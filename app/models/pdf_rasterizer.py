@@ -0,0 +1,107 @@
+"""
+This module handles the rasterization of PDF pages for OCR.
+
+Pages are rendered a window of pages at a time (pdftoppm -f/-l), directly at the resolution the encoding
+stage needs (see app/models/image_encoding.py) instead of 200 DPI, and handed out one by one. Only the pages of the current window and the pages
+waiting for OCR are held in memory, so the peak memory of a file does not depend on its page count, and
+the first pages can be extracted while the next windows are rendered.
+"""
+
+import sys
+import asyncio
+from typing import AsyncIterator
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+from app.logger import logging
+from app.exception import get_error_message_detail, InternalError
+
+# Long side of the rendered pages, aspect ratio kept: enough for a page cut into parts to be read at full resolution
+RENDER_MAX_SIDE = 1600
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    """
+    Gets the number of pages of a PDF without rendering it.
+
+    Args:
+        pdf_path (str): Local path to the PDF file.
+
+    Returns:
+        (int): The page count.
+    """
+    try:
+        return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+    except Exception as e:
+        error_message = get_error_message_detail(e, sys)
+        logging.error(f"An error occurred while reading the page count of {pdf_path} : {error_message}")
+        raise InternalError(f"An error occurred while reading the page count of {pdf_path} : {str(e)}")
+
+
+def page_windows(pages: list[int], window_pages: int) -> list[tuple[int, int]]:
+    """
+    Groups page indexes into runs of at most window_pages consecutive pages.
+
+    Args:
+        pages (list): 0-based page indexes.
+        window_pages (int): Maximum length of a run.
+
+    Returns:
+        (list): (first_page, last_page) of each run, 1-based and inclusive like pdftoppm -f/-l.
+    """
+    windows = []
+    for page in sorted(set(pages)):
+        if windows and windows[-1][1] == page and windows[-1][1] - windows[-1][0] + 1 < max(1, window_pages):
+            windows[-1] = (windows[-1][0], page + 1)
+        else:
+            windows.append((page + 1, page + 1))
+    return windows
+
+
+async def rasterize_pages(
+        pdf_path: str,
+        pages: list[int],
+        window_pages: int = 4,
+        max_side: int = RENDER_MAX_SIDE
+        ) -> AsyncIterator[tuple[int, Image.Image]]:
+    """
+    Renders pages of a PDF window by window (in a background thread) and yields them in order.
+    A window is a run of consecutive pages, so pages left out (e.g. extracted from the text layer) are not rendered.
+    The next window is rendered only when the pages of the current one have been taken.
+
+    Args:
+        pdf_path (str): Local path to the PDF file.
+        pages (list): 0-based indexes of the pages to render (see pdf_page_count).
+        window_pages (int): Maximum number of pages rendered per pdftoppm call.
+        max_side (int): Long side the pages are rendered at (pdftoppm -scale-to), aspect ratio kept.
+
+    Yields:
+        (int, PIL.Image): The 0-based page index and the page image. The consumer closes the image.
+    """
+    for first_page, last_page in page_windows(pages, window_pages):
+        try:
+            images = await asyncio.to_thread(
+                convert_from_path, pdf_path, first_page=first_page, last_page=last_page, size=max_side
+            )
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error(f"An error occurred while rendering pages {first_page}-{last_page} of {pdf_path} : {error_message}")
+            raise InternalError(f"An error occurred while rendering pages {first_page}-{last_page} of {pdf_path} : {str(e)}")
+
+        if len(images) != last_page - first_page + 1:
+            for image in images:
+                image.close()
+            raise InternalError(f"Pages {first_page}-{last_page} of {pdf_path} rendered {len(images)} images")
+
+        try:
+            for offset, image in enumerate(images):
+                # Drop the window's reference so a page is freed as soon as its consumer closes it
+                images[offset] = None
+                yield first_page - 1 + offset, image
+        finally:
+            # Pages of the window not taken when the consumer stops early
+            for image in images:
+                if image is not None:
+                    image.close()
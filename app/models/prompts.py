@@ -38,6 +38,28 @@ OCR_PROMPT = {
                 ),
             }
  
+# Sent before the images of a page cut into parts (see app/models/image_encoding.py)
+TILED_PAGE_PROMPT = {
+                "type": "text",
+                "text": (
+                    "The page is sent as {parts} overlapping parts, in reading order (top to bottom, or left to right). "
+                    "Extract it as one page and do not repeat the lines shown in two parts."
+                ),
+            }
+
+# Line introducing each page in the request and in the reply of a batched OCR request
+PAGE_MARKER = "<<<PAGE {page}>>>"
+
+# Sent after the pages of a batched OCR request; each page is introduced by its marker (see IMAGE_EXTRACTION.process_images)
+BATCH_PAGES_PROMPT = {
+                "type": "text",
+                "text": (
+                    "The images above are {count} pages of one document, each introduced by its page marker. "
+                    "Apply the instructions below to each page separately. Start the output of each page with its marker "
+                    "alone on a line, exactly as given (for example {example}), and give every page, in order, without merging pages."
+                ),
+            }
+
 #Context Prompt (Prompt for new contexts from our documents)
 CONTEXT_PROMPT = ChatPromptTemplate.from_messages([
     ("system", """
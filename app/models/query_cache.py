@@ -0,0 +1,167 @@
+"""
+This module handles the in-process cache of query embeddings.
+
+Every /chat turn embeds the (history-rewritten) question before searching, and users repeat and slightly
+rephrase the same questions all day. Query embeddings are kept in an LRU cache with a time-to-live, keyed
+on the normalized query text (case, accents, whitespace and trailing punctuation ignored), so a repeated
+question skips the round-trip to the embedding model. Page texts (embed_documents) are passed through.
+"""
+
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a query for cache lookups: Unicode compatibility form, lowercase, single spaces,
+    no leading / trailing spaces or trailing punctuation.
+
+    Args:
+        text (str): The query.
+
+    Returns:
+        (str): The normalized query.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _WHITESPACE_PATTERN.sub(" ", text).strip()
+    return text.rstrip(" ?!.;:")
+
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    Embeddings whose embed_query results are cached in memory (LRU, bounded by count and age).
+
+    Attributes:
+        underlying_embeddings (Embeddings): The embedding model called for cache misses and for documents.
+        max_entries (int): Maximum number of cached queries.
+        ttl_seconds (float): Age after which a cached embedding is no longer used.
+        hits (int): Number of queries served from the cache.
+        misses (int): Number of queries sent to the embedding model.
+        expirations (int): Number of cached embeddings dropped because they were too old.
+        evictions (int): Number of cached embeddings dropped to stay within max_entries.
+    """
+
+    def __init__(self, underlying_embeddings: Embeddings, max_entries: int = 2048, ttl_seconds: float = 3600) -> None:
+        """
+        Initializes the QueryEmbeddingCache class.
+
+        Args:
+            underlying_embeddings (Embeddings): The embedding model called for cache misses and for documents.
+            max_entries (int): Maximum number of cached queries.
+            ttl_seconds (float): Age in seconds after which a cached embedding is no longer used.
+        """
+        self.underlying_embeddings = underlying_embeddings
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> (List[float] | None):
+        """
+        Gets a cached embedding, marks it as most recently used and counts the hit or miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key: str, embedding: List[float]) -> None:
+        """
+        Caches an embedding as the most recently used and evicts the oldest entries beyond max_entries.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a query, from the cache if the same normalized query was embedded recently.
+
+        Args:
+            text (str): The query.
+
+        Returns:
+            (list): The embedding.
+        """
+        key = normalize_query(text)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = self.underlying_embeddings.embed_query(text)
+            self._store(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Asynchronously embeds a query, from the cache if the same normalized query was embedded recently.
+
+        Args:
+            text (str): The query.
+
+        Returns:
+            (list): The embedding.
+        """
+        key = normalize_query(text)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = await self.underlying_embeddings.aembed_query(text)
+            self._store(key, embedding)
+        return embedding
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying_embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying_embeddings.aembed_documents(texts)
+
+    def clear(self) -> None:
+        """
+        Drops all cached embeddings (the counters are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Gets the counters and current size of the cache.
+
+        Returns:
+            (dict): hits, misses, hit_rate, expirations, evictions, entries and the bounds.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds
+            }
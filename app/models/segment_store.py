@@ -0,0 +1,403 @@
+"""
+This module handles the segmented on-disk layout of a FAISS_DB persist directory.
+
+Layout:
+    manifest.json                  -> {"base": "base-000003", "wal": "wal-000003.jsonl"}
+    base-000003.faiss / .pkl       -> full snapshot (LangChain FAISS.save_local format)
+    base-000003.metadata.json      -> gu_id / source side-index of the snapshot
+    base-000003.lexical.npz        -> BM25 inverted index of the snapshot (see lexical_index)
+    wal-000003.jsonl               -> ordered log of changes applied after the snapshot
+    segment-000007.npy / .pkl      -> vectors and documents of one logged add
+    writer.lock                    -> locked by the one process that has the store open writable
+
+A change is durable once its line is in the write-ahead log. Segments are written before
+the log line that references them and the manifest is replaced atomically, so a crash at any
+point leaves either the old or the new state on disk, never a mix.
+Stores saved before this layout existed (index.faiss / index.pkl without manifest) are read
+as a base snapshot named 'index'.
+"""
+
+import os
+import re
+import json
+import fcntl
+import pickle
+
+import numpy as np
+import faiss
+
+MANIFEST_FILE = "manifest.json"
+LEGACY_BASE = "index"
+WRITER_LOCK_FILE = "writer.lock"
+
+_FILE_NUMBER_PATTERN = re.compile(r"^(?:base|wal|segment)-(\d+)\.")
+
+
+def _fsync_directory(directory: str) -> None:
+    """
+    Flushes a directory entry (renames, new files) to disk. No-op on platforms without directory fds.
+
+    Args:
+        directory (str): The directory.
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path: str, write_function) -> None:
+    """
+    Writes a file through a temporary file, fsyncs it and renames it into place.
+
+    Args:
+        path (str): Final path of the file.
+        write_function: Called with the open (binary) temporary file.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as temp_file:
+        write_function(temp_file)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+    _fsync_directory(os.path.dirname(path) or ".")
+
+
+def read_manifest(directory: str) -> (dict | None):
+    """
+    Reads the manifest of a persist directory.
+
+    Args:
+        directory (str): The persist directory.
+
+    Returns:
+        (dict | None): The manifest, a manifest for the legacy single-file layout, or None if nothing is stored.
+    """
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+
+    if os.path.exists(os.path.join(directory, f"{LEGACY_BASE}.faiss")):
+        return {"base": LEGACY_BASE, "wal": None}
+
+    return None
+
+
+def write_manifest(directory: str, manifest: dict) -> None:
+    """
+    Atomically replaces the manifest of a persist directory.
+
+    Args:
+        directory (str): The persist directory.
+        manifest (dict): The new manifest.
+    """
+    _write_atomic(
+        os.path.join(directory, MANIFEST_FILE),
+        lambda manifest_file: manifest_file.write(json.dumps(manifest).encode("utf-8"))
+    )
+
+
+def lock_writer(directory: str):
+    """
+    Takes the writer lock of a persist directory, without waiting.
+
+    The lock is held while the returned file is open, and released when the process exits.
+
+    Args:
+        directory (str): The persist directory.
+
+    Returns:
+        The open lock file.
+
+    Raises:
+        BlockingIOError: If the lock is held by another process (or another open store of this one).
+    """
+    lock_file = open(os.path.join(directory, WRITER_LOCK_FILE), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise
+    return lock_file
+
+
+def next_file_number(directory: str) -> int:
+    """
+    Gets a file number higher than any base, log or segment file in the directory,
+    including files written after the last manifest.
+
+    Args:
+        directory (str): The persist directory.
+
+    Returns:
+        (int): The next free file number.
+    """
+    numbers = [0]
+    if os.path.isdir(directory):
+        for file_name in os.listdir(directory):
+            match = _FILE_NUMBER_PATTERN.match(file_name)
+            if match:
+                numbers.append(int(match.group(1)))
+    return max(numbers) + 1
+
+
+def metadata_path(directory: str, base: str) -> str:
+    """
+    Gets the path of the side-index file of a base snapshot.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+
+    Returns:
+        (str): Path of the side-index file.
+    """
+    return os.path.join(directory, f"{base}.metadata.json")
+
+
+def write_metadata(directory: str, base: str, metadata_index: dict) -> None:
+    """
+    Atomically writes the side-index of a base snapshot.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+        metadata_index (dict): The side-index.
+    """
+    _write_atomic(
+        metadata_path(directory, base),
+        lambda metadata_file: metadata_file.write(json.dumps(metadata_index).encode("utf-8"))
+    )
+
+
+def lexical_path(directory: str, base: str) -> str:
+    """
+    Gets the path of the BM25 inverted index file of a base snapshot.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+
+    Returns:
+        (str): Path of the inverted index file.
+    """
+    return os.path.join(directory, f"{base}.lexical.npz")
+
+
+def write_lexical(directory: str, base: str, arrays: dict) -> None:
+    """
+    Atomically writes the inverted index of a base snapshot.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+        arrays (dict): The index as numpy arrays (LexicalSegment.to_arrays).
+    """
+    _write_atomic(lexical_path(directory, base), lambda lexical_file: np.savez(lexical_file, **arrays))
+
+
+def read_lexical(directory: str, base: str) -> (dict | None):
+    """
+    Reads the inverted index of a base snapshot.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+
+    Returns:
+        (dict | None): The numpy arrays, None if the snapshot has no inverted index.
+    """
+    path = lexical_path(directory, base)
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def write_segment(directory: str, name: str, vectors: np.ndarray, documents: list) -> None:
+    """
+    Writes the vectors and documents of one add as an immutable segment.
+
+    Args:
+        directory (str): The persist directory.
+        name (str): Name of the segment.
+        vectors (np.ndarray): float32 vectors, one row per document.
+        documents (list): (docstore id, Document) pairs, in the same order as the vectors.
+    """
+    _write_atomic(os.path.join(directory, f"{name}.npy"), lambda segment_file: np.save(segment_file, vectors))
+    _write_atomic(os.path.join(directory, f"{name}.pkl"), lambda segment_file: pickle.dump(documents, segment_file))
+
+
+def read_segment(directory: str, name: str) -> tuple[np.ndarray, list]:
+    """
+    Reads a segment written by write_segment.
+
+    Args:
+        directory (str): The persist directory.
+        name (str): Name of the segment.
+
+    Returns:
+        (np.ndarray, list): The vectors, (docstore id, Document) pairs.
+    """
+    vectors = np.load(os.path.join(directory, f"{name}.npy"))
+    with open(os.path.join(directory, f"{name}.pkl"), "rb") as segment_file:
+        documents = pickle.load(segment_file)
+    return vectors, documents
+
+
+def append_wal(path: str, records: list) -> int:
+    """
+    Appends records to a write-ahead log and fsyncs it.
+
+    Args:
+        path (str): Path of the log.
+        records (list): JSON-serialisable records.
+
+    Returns:
+        (int): Size of the log after the append.
+    """
+    payload = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+    with open(path, "ab") as wal_file:
+        wal_file.write(payload)
+        wal_file.flush()
+        os.fsync(wal_file.fileno())
+        return wal_file.tell()
+
+
+def read_wal(path: str) -> list:
+    """
+    Reads the records of a write-ahead log.
+
+    A torn last line (crash during an append) is dropped and truncated away,
+    so later appends start on a clean line.
+
+    Args:
+        path (str): Path of the log.
+
+    Returns:
+        (list): The records, in order.
+    """
+    if not path or not os.path.exists(path):
+        return []
+
+    records = []
+    valid_size = 0
+    with open(path, "rb") as wal_file:
+        for line in wal_file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            valid_size += len(line)
+
+    if valid_size != os.path.getsize(path):
+        with open(path, "r+b") as wal_file:
+            wal_file.truncate(valid_size)
+
+    return records
+
+
+def referenced_segments(records: list) -> set:
+    """
+    Gets the names of the segments referenced by log records.
+
+    Args:
+        records (list): Log records.
+
+    Returns:
+        (set): Segment names.
+    """
+    return {record["segment"] for record in records if record.get("op") == "add"}
+
+
+def remove_unreferenced_files(directory: str, keep: set) -> None:
+    """
+    Deletes base, log and segment files that are not in `keep` (obsolete or orphaned by a crash).
+
+    Args:
+        directory (str): The persist directory.
+        keep (set): Names (without extension) of the base, log and segments still in use.
+    """
+    for file_name in os.listdir(directory):
+        match = _FILE_NUMBER_PATTERN.match(file_name)
+        if not match:
+            continue
+        stem = file_name.split(".")[0]
+        if stem not in keep:
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+
+
+def write_base(directory: str, base: str, index, docstore, index_to_docstore_id: dict) -> None:
+    """
+    Writes a full snapshot in the LangChain FAISS.save_local format (readable by FAISS.load_local),
+    fsyncing both files before they are renamed into place.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+        index (faiss.Index): The FAISS index.
+        docstore: The docstore.
+        index_to_docstore_id (dict): FAISS row -> docstore id.
+    """
+    index_path = os.path.join(directory, f"{base}.faiss")
+    faiss.write_index(index, index_path + ".tmp")
+    with open(index_path + ".tmp", "rb") as index_file:
+        os.fsync(index_file.fileno())
+    os.replace(index_path + ".tmp", index_path)
+
+    _write_atomic(
+        os.path.join(directory, f"{base}.pkl"),
+        lambda docstore_file: pickle.dump((docstore, index_to_docstore_id), docstore_file)
+    )
+
+
+def write_wal(path: str, records: list) -> None:
+    """
+    Atomically creates a write-ahead log holding the given records.
+
+    Args:
+        path (str): Path of the log.
+        records (list): JSON-serialisable records.
+    """
+    payload = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+    _write_atomic(path, lambda wal_file: wal_file.write(payload))
+
+
+def write_mmap_docstore(directory: str, base: str, docstore, index_to_docstore_id: dict) -> None:
+    """
+    Writes the documents of a base snapshot in the memory-mappable format read by mmap_store.MmapDocstore:
+    the docstore ids in row order, the JSON records concatenated, and the byte offset of each record.
+
+    Args:
+        directory (str): The persist directory.
+        base (str): Name of the base snapshot.
+        docstore: The docstore.
+        index_to_docstore_id (dict): FAISS row -> docstore id.
+    """
+    ids = [index_to_docstore_id[row] for row in range(len(index_to_docstore_id))]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+
+    def write_records(data_file):
+        for row, doc_id in enumerate(ids):
+            document = docstore.search(doc_id)
+            record = json.dumps({"page_content": document.page_content, "metadata": document.metadata}, default=str)
+            offsets[row + 1] = offsets[row] + data_file.write(record.encode("utf-8"))
+
+    _write_atomic(os.path.join(directory, f"{base}.docs.bin"), write_records)
+    _write_atomic(os.path.join(directory, f"{base}.docs.npy"), lambda offsets_file: np.save(offsets_file, offsets))
+    _write_atomic(
+        os.path.join(directory, f"{base}.ids.json"),
+        lambda ids_file: ids_file.write(json.dumps(ids).encode("utf-8"))
+    )
@@ -0,0 +1,956 @@
+"""
+This module handles the sharded vectorstore mode.
+
+The corpus is partitioned across N shards by a hash of the gu_id, so all pages of a file live on one shard.
+Each shard is a FAISS_DB held by its own process, a shard server (app/components/shard_server.py): either a
+local worker started by SHARDED_FAISS_DB, or a server on another node. Both are reached over
+multiprocessing.connection, authenticated with a shared key.
+
+Searches are scattered to every shard (or only to the shards owning the requested gu_ids) and gathered:
+shards return docstore ids with their distance / BM25 score, the hits are merged by score, and only the
+documents of the final top k are read from their shards. Writes and file lookups go to the owning shard.
+
+SHARDED_FAISS_DB exposes the FAISS_DB methods used by the application, so it can replace RENAULT_DB.
+
+Layout of a sharded store with local workers:
+    <persist_directory>/shards.json      number of shards and dimension of the vectors
+    <persist_directory>/workers.json     pids, ports and key of the running local workers (workers.read-only.json
+                                         for read-only ones), so that every process of the host shares them
+    <persist_directory>/workers.lock     locked while a process starts or connects to the local workers
+    <persist_directory>/shard-00/ ...    one segmented FAISS_DB store per shard
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import atexit
+import asyncio
+import hashlib
+import inspect
+import tempfile
+import threading
+import subprocess
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.models import segment_store
+from app.models.vectorstore import FAISS_DB, HYBRID_FETCH_FACTOR, DIMENSION_PROBE, ScopedRetriever
+from app.models.embedding_batcher import aembed_in_batches
+from app.models.lexical_index import reciprocal_rank_fusion
+
+from app.logger import logging
+from app.exception import get_error_message_detail, InternalError
+
+SHARDS_FILE = "shards.json"
+# Record of the local workers of a persist directory, by read_only mode
+WORKERS_FILES = {False: "workers.json", True: "workers.read-only.json"}
+WORKERS_LOCK_FILE = "workers.lock"
+AUTHKEY_ENV = "SHARD_AUTHKEY"
+WORKER_START_TIMEOUT = 120
+
+# Project root, so that local workers can run "python -m app.components.shard_server" from any working directory
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def shard_for(gu_id, shards: int) -> int:
+    """
+    Gets the shard owning a file. The hash is stable across processes and Python versions.
+
+    Args:
+        gu_id: gu_id of the file.
+        shards (int): Number of shards.
+
+    Returns:
+        (int): Shard number in [0, shards).
+    """
+    digest = hashlib.blake2b(str(gu_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """
+    Parses a "host:port" shard address.
+    """
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def process_alive(pid: int) -> bool:
+    """
+    Checks whether a process is still running. An exited child of this process is reaped.
+    """
+    try:
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return False
+    except ChildProcessError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ShardEmbeddings(Embeddings):
+    """
+    Embedding function of a shard. Shards are given vectors by the coordinator and never embed text;
+    only the dimension is needed, to create an empty store.
+
+    Attributes:
+        dimensions (int): Dimension of the vectors.
+    """
+
+    def __init__(self, dimensions: int = None) -> None:
+        self.dimensions = dimensions
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.dimensions is None:
+            raise InternalError("The dimension of the vectors is needed to create a new shard")
+        return [0.0] * self.dimensions
+
+    def embed_documents(self, texts: list) -> list[list[float]]:
+        raise InternalError("Shards are given embeddings by the coordinator, not texts")
+
+
+class ShardServer():
+    """
+    Serves one FAISS_DB shard to coordinators, one thread per connection.
+
+    A request is a (method, args, kwargs) tuple; the reply is ("ok", result) or ("error", message).
+    Only the methods listed in STORE_METHODS and SERVER_METHODS can be called.
+
+    Attributes:
+        persist_directory (str): Persist directory of the shard.
+        store_params (dict): FAISS_DB parameters of the shard (index type, docstore type, read_only...).
+        store (FAISS_DB): The shard, created by the first load request.
+    """
+
+    STORE_METHODS = frozenset({
+        "save_local", "merge", "compact", "rebuild_index", "add_embeddings", "delete", "get",
+        "get_files_in_vectorstore", "get_embeddings_and_ids", "get_page", "get_documents",
+        "search_ids_by_vector", "lexical_search_ids", "stats", "memory_bytes"
+    })
+    SERVER_METHODS = frozenset({"ping", "load", "rows", "gu_ids", "gu_id_pages", "hybrid_ids", "shutdown"})
+
+    def __init__(self, persist_directory: str = None, **store_params) -> None:
+        """
+        Initializes the ShardServer class.
+
+        Args:
+            persist_directory (str): Persist directory of the shard. In memory if None.
+            store_params: Other FAISS_DB parameters.
+        """
+        self.persist_directory = persist_directory
+        self.store_params = store_params
+        self.store = None
+        self.stopped = threading.Event()
+        self._load_lock = threading.Lock()
+
+    def ping(self) -> int:
+        """
+        Answers a coordinator checking that the server is up, with its pid.
+        """
+        return os.getpid()
+
+    def load(self, dimensions: int = None) -> int:
+        """
+        Loads the shard, creating it if nothing is stored yet. Later calls (other coordinators) reuse it.
+
+        Args:
+            dimensions (int): Dimension of the vectors, used if the shard is created.
+
+        Returns:
+            (int): Number of rows in the shard index.
+        """
+        with self._load_lock:
+            if self.store is None:
+                store = FAISS_DB(
+                    embedding_function=ShardEmbeddings(dimensions),
+                    persist_directory=self.persist_directory,
+                    dimensions=dimensions,
+                    **self.store_params
+                )
+                store.load()
+                self.store = store
+        return self.rows()
+
+    def rows(self) -> int:
+        """
+        Gets the number of rows in the shard index, tombstoned ones included (the range of get_page offsets).
+        """
+        return self.store.vectorstore.index.ntotal
+
+    def gu_ids(self) -> list:
+        """
+        Gets the gu_ids of the files stored in the shard.
+        """
+        return list(self.store.gu_id_index)
+
+    def gu_id_pages(self, gu_id) -> (list | None):
+        """
+        Gets the docstore ids of the pages of a file, None if the file is not stored in the shard.
+        """
+        pages = self.store.gu_id_index.get(str(gu_id))
+        return list(pages) if pages is not None else None
+
+    def hybrid_ids(self, query: str, embedding: np.ndarray, k: int, gu_ids: list = None) -> tuple[list, list]:
+        """
+        Runs both rankings of a hybrid search in one request.
+
+        Returns:
+            (list, list): (docstore id, distance) vector hits and (docstore id, score) BM25 hits.
+        """
+        return self.store.search_ids_by_vector(embedding, k, gu_ids), self.store.lexical_search_ids(query, k, gu_ids)
+
+    def shutdown(self) -> None:
+        """
+        Waits for the background merge and compaction of the shard, then stops the server.
+        """
+        if self.store is not None:
+            for thread in (self.store._merge_thread, self.store._compact_thread):
+                if thread is not None:
+                    thread.join()
+        self.stopped.set()
+
+    def handle(self, method: str, args: tuple, kwargs: dict):
+        """
+        Runs one request. Coroutines (async FAISS_DB methods) are run to completion.
+        """
+        if method in self.SERVER_METHODS:
+            target = getattr(self, method)
+        elif method in self.STORE_METHODS:
+            if self.store is None:
+                raise InternalError("The shard is not loaded")
+            target = getattr(self.store, method)
+        else:
+            raise InternalError(f"Unknown shard method : {method}")
+
+        result = target(*args, **kwargs)
+        if inspect.iscoroutine(result):
+            result = asyncio.run(result)
+        return result
+
+    def serve(self, connection) -> None:
+        """
+        Answers the requests of one connection until it is closed or the server is shut down.
+
+        Args:
+            connection: A multiprocessing.connection.Connection.
+        """
+        while not self.stopped.is_set():
+            try:
+                method, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                break
+
+            try:
+                reply = ("ok", self.handle(method, args, kwargs))
+            except Exception as e:
+                error_message = get_error_message_detail(e, sys)
+                logging.error(f"Shard {self.persist_directory} : {method} failed : {error_message}")
+                reply = ("error", str(e))
+
+            try:
+                connection.send(reply)
+            except (EOFError, OSError):
+                break
+        connection.close()
+
+
+class ShardClient():
+    """
+    Connection of the coordinator to one shard server. Requests on a connection are serialized.
+
+    Attributes:
+        name (str): Shard name, for errors and logs.
+        address (tuple): (host, port) of the shard server.
+        process (subprocess.Popen): The local worker process stopped by close, None for a remote or shared shard.
+        pid (int): Process id of a local worker, None for a remote shard.
+    """
+
+    def __init__(self, name: str, address: tuple, authkey: bytes, process: subprocess.Popen = None) -> None:
+        self.name = name
+        self.address = address
+        self.process = process
+        self.pid = process.pid if process is not None else None
+        self._connection = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Sends a request to the shard and waits for its reply.
+
+        Returns:
+            The result of the method on the shard.
+        """
+        with self._lock:
+            self._connection.send((method, args, kwargs))
+            status, result = self._connection.recv()
+        if status != "ok":
+            raise InternalError(f"Shard {self.name} : {result}")
+        return result
+
+    def close(self, shutdown: bool = False) -> None:
+        """
+        Closes the connection. With shutdown, the shard server is stopped first (local workers).
+        """
+        try:
+            if shutdown:
+                self.call("shutdown")
+            self._connection.close()
+        except (EOFError, OSError, InternalError):
+            pass
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class ShardedGuIdIndex(Mapping):
+    """
+    Read-only view of the gu_id -> docstore ids mapping of a sharded store.
+    Lookups ask the owning shard only; iteration gathers the gu_ids of every shard.
+    """
+
+    def __init__(self, store: "SHARDED_FAISS_DB") -> None:
+        self._store = store
+
+    def __getitem__(self, gu_id) -> list:
+        pages = self._store._client_for(gu_id).call("gu_id_pages", str(gu_id))
+        if pages is None:
+            raise KeyError(gu_id)
+        return pages
+
+    def __iter__(self):
+        gu_ids = set()
+        for shard_gu_ids in self._store._broadcast("gu_ids"):
+            gu_ids.update(shard_gu_ids)
+        return iter(gu_ids)
+
+    def __len__(self) -> int:
+        return sum(len(shard_gu_ids) for shard_gu_ids in self._store._broadcast("gu_ids"))
+
+
+class SHARDED_FAISS_DB():
+    """
+    Vectorstore partitioned by gu_id across shard servers, with the FAISS_DB interface used by the application.
+
+    Attributes:
+        embedding_function: Embeds page texts and queries (in the coordinator; shards only receive vectors).
+        persist_directory (str): Root directory of the local shards.
+        shard_count (int): Number of shards.
+        addresses (list): "host:port" of remote shard servers. Local workers are started if None.
+        read_only (bool): If True, local shards are opened read-only (memory-mapped when possible).
+        hybrid (bool): Default of as_retriever, see FAISS_DB.
+        dimensions (int): Dimension of the vectors of a new store, None to embed DIMENSION_PROBE to get it.
+    """
+
+    def __init__(
+            self,
+            embedding_function,
+            persist_directory: str = None,
+            shards: int = 2,
+            addresses: list = None,
+            authkey: bytes = None,
+            index_type: str = "flat",
+            nlist: int = 1024,
+            nprobe: int = 16,
+            pq_m: int = 64,
+            hnsw_m: int = 32,
+            ef_search: int = 64,
+            merge_threshold: int = 32,
+            read_only: bool = False,
+            embed_batch_size: int = 64,
+            embed_batch_tokens: int = 32000,
+            embed_concurrency: int = 4,
+            embed_max_retries: int = 6,
+            docstore_type: str = "memory",
+            compact_ratio: float = 0.2,
+            hybrid: bool = True,
+            dimensions: int = None
+            ) -> None:
+        """
+        Initializes the SHARDED_FAISS_DB class.
+
+        Args:
+            embedding_function: A function to convert text into vector embeddings.
+            persist_directory (str): Root directory of the local shards (shard-00, shard-01...).
+            shards (int): Number of local worker processes. Ignored if addresses are given.
+            addresses (list): "host:port" of shard servers started with app.components.shard_server, in shard order.
+            authkey (bytes): Key shared with the shard servers. Defaults to the SHARD_AUTHKEY environment variable
+                for remote shards, and to a random key for local workers.
+            read_only (bool): If True, local shards are opened read-only (see FAISS_DB).
+            hybrid (bool): If True, retrievers created by as_retriever fuse vector and BM25 hits.
+            dimensions (int): Dimension of the vectors of a new store. If None, DIMENSION_PROBE is embedded once
+                to get it. Existing stores use the dimension recorded in shards.json.
+            Other arguments are the FAISS_DB parameters of each local shard.
+        """
+        self.embedding_function = embedding_function
+        self.dimensions = dimensions
+        self.persist_directory = persist_directory
+        self.addresses = list(addresses) if addresses else None
+        self.shard_count = len(self.addresses) if self.addresses else shards
+        self.read_only = read_only
+        self.hybrid = hybrid
+        self.index_type = index_type
+        self.index_params = {"nlist": nlist, "nprobe": nprobe, "pq_m": pq_m, "hnsw_m": hnsw_m, "ef_search": ef_search}
+        self.docstore_type = docstore_type if persist_directory else "memory"
+        self.compact_ratio = compact_ratio
+        self.merge_threshold = merge_threshold
+        self.embed_params = {
+            "max_items": embed_batch_size,
+            "max_tokens": embed_batch_tokens,
+            "max_concurrency": embed_concurrency,
+            "max_retries": embed_max_retries
+        }
+
+        if authkey is None and self.addresses:
+            authkey = os.getenv(AUTHKEY_ENV, "").encode("utf-8")
+        self._authkey = authkey or os.urandom(32)
+        self._clients = []
+        self._executor = None
+
+    @property
+    def gu_id_index(self) -> ShardedGuIdIndex:
+        return ShardedGuIdIndex(self)
+
+    def load(self) -> None:
+        """
+        Starts (or connects to) the shard servers and loads every shard.
+
+        The number of shards and the dimension of the vectors are recorded in <persist_directory>/shards.json;
+        a store written with another number of shards is refused, since files would be looked up on the wrong shard.
+        An unsharded FAISS_DB found in the persist directory is distributed across the new shards once.
+        """
+        try:
+            layout = self._read_layout()
+            unsharded = None
+            if layout is not None:
+                if layout["shards"] != self.shard_count:
+                    raise InternalError(
+                        f"Vectorstore {self.persist_directory} has {layout['shards']} shards, not {self.shard_count}"
+                    )
+                dimensions = layout["dimensions"]
+            elif not self.addresses and self.persist_directory and segment_store.read_manifest(self.persist_directory):
+                unsharded = FAISS_DB(embedding_function=None, persist_directory=self.persist_directory, read_only=True)
+                unsharded.load()
+                dimensions = unsharded.vectorstore.index.d
+            elif self.dimensions:
+                dimensions = self.dimensions
+            else:
+                # A non-empty text: the embeddings endpoint may reject an empty input
+                dimensions = len(self.embedding_function.embed_query(DIMENSION_PROBE))
+
+            self._executor = ThreadPoolExecutor(max_workers=4 * self.shard_count, thread_name_prefix="shard")
+            self._clients = self._connect_remote() if self.addresses else self._start_local_workers()
+            atexit.register(self.close)
+
+            rows = self._broadcast("load", dimensions)
+            if unsharded is not None:
+                self._distribute(unsharded)
+            self._write_layout(dimensions)
+
+            logging.info(f"Sharded vectorstore loaded : {self.shard_count} shards, {sum(rows)} rows")
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error("An error occurred while loading sharded vectorstore : " + error_message)
+            raise InternalError("An error occurred while loading sharded vectorstore : " + str(e))
+
+    def _read_layout(self) -> (dict | None):
+        if not self.persist_directory or not os.path.exists(os.path.join(self.persist_directory, SHARDS_FILE)):
+            return None
+        with open(os.path.join(self.persist_directory, SHARDS_FILE), "r", encoding="utf-8") as layout_file:
+            return json.load(layout_file)
+
+    def _write_layout(self, dimensions: int) -> None:
+        if not self.persist_directory or self.read_only or self.addresses:
+            return
+        layout_path = os.path.join(self.persist_directory, SHARDS_FILE)
+        with open(layout_path + ".tmp", "w", encoding="utf-8") as layout_file:
+            json.dump({"shards": self.shard_count, "dimensions": dimensions}, layout_file)
+        os.replace(layout_path + ".tmp", layout_path)
+
+    def _shard_directory(self, shard: int) -> (str | None):
+        return os.path.join(self.persist_directory, f"shard-{shard:02d}") if self.persist_directory else None
+
+    def _start_local_workers(self) -> list[ShardClient]:
+        """
+        Connects to the local workers of the persist directory, starting them if no process of this host runs them.
+
+        Each shard directory must have one writer: API workers, the sync and other processes of the host that
+        open the store share one set of workers, recorded in workers.json by the process that started them.
+        The lock on workers.lock is held while starting or connecting, so two processes never start workers
+        of the same shards. Workers stop when their last coordinator disconnects, and are started again by the
+        next process that finds them gone. A store without persist directory gets workers of its own.
+        """
+        if not self.persist_directory:
+            return self._spawn_workers(shared=False)
+
+        os.makedirs(self.persist_directory, exist_ok=True)
+        record_path = os.path.join(self.persist_directory, WORKERS_FILES[self.read_only])
+        with open(os.path.join(self.persist_directory, WORKERS_LOCK_FILE), "a") as lock_file:
+            # Released when the lock file is closed
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            record = None
+            if os.path.exists(record_path):
+                with open(record_path, "r", encoding="utf-8") as record_file:
+                    record = json.load(record_file)
+                clients = self._connect_workers(record)
+                if clients is not None:
+                    logging.info(f"Connected to the local shard workers of {self.persist_directory} (pids {record['pids']})")
+                    return clients
+
+            if record is not None:
+                # Workers stopping after their last coordinator left still hold their shard directories
+                self._wait_for_exit(record["pids"])
+            clients = self._spawn_workers(shared=True)
+
+            record = {
+                "pids": [client.pid for client in clients],
+                "ports": [client.address[1] for client in clients],
+                "authkey": self._authkey.hex()
+            }
+            descriptor = os.open(record_path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "w", encoding="utf-8") as record_file:
+                json.dump(record, record_file)
+            os.replace(record_path + ".tmp", record_path)
+        return clients
+
+    def _connect_workers(self, record: dict) -> (list[ShardClient] | None):
+        """
+        Connects to the workers of a workers.json record.
+
+        Returns:
+            (list | None): The clients, None if a worker is gone (or stopping).
+        """
+        authkey = bytes.fromhex(record["authkey"])
+        clients = []
+        try:
+            if len(record["ports"]) != self.shard_count:
+                return None
+            for shard, port in enumerate(record["ports"]):
+                clients.append(ShardClient(f"shard-{shard:02d}", ("127.0.0.1", port), authkey))
+                clients[-1].pid = clients[-1].call("ping")
+        except (OSError, EOFError, AuthenticationError, InternalError):
+            for client in clients:
+                client.close()
+            return None
+        self._authkey = authkey
+        return clients
+
+    @staticmethod
+    def _wait_for_exit(pids: list) -> None:
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while any(process_alive(pid) for pid in pids):
+            if time.monotonic() > deadline:
+                raise InternalError(f"Previous shard workers {pids} did not stop")
+            time.sleep(0.05)
+
+    def _spawn_workers(self, shared: bool) -> list[ShardClient]:
+        """
+        Starts one shard server process per shard on a loopback port and connects to each.
+        The servers exit when their last coordinator disconnects. Shared workers run in their own session,
+        so that they outlive the process that started them while other processes use them.
+        """
+        environment = dict(os.environ)
+        environment[AUTHKEY_ENV] = self._authkey.hex()
+        environment["PYTHONPATH"] = os.pathsep.join(filter(None, [_PROJECT_ROOT, environment.get("PYTHONPATH")]))
+
+        workers = []
+        with tempfile.TemporaryDirectory() as port_directory:
+            for shard in range(self.shard_count):
+                port_file = os.path.join(port_directory, f"shard-{shard:02d}.port")
+                command = [
+                    sys.executable, "-m", "app.components.shard_server",
+                    "--listen", "127.0.0.1:0", "--port-file", port_file, "--authkey-hex", "--exit-when-idle",
+                    "--index-type", self.index_type, "--docstore", self.docstore_type,
+                    "--merge-threshold", str(self.merge_threshold), "--compact-ratio", str(self.compact_ratio),
+                    *[f"--{name.replace('_', '-')}={value}" for name, value in self.index_params.items()]
+                ]
+                if self.persist_directory:
+                    command += ["--path", self._shard_directory(shard)]
+                if self.read_only:
+                    command.append("--read-only")
+                workers.append((shard, port_file, subprocess.Popen(command, env=environment, start_new_session=shared)))
+
+            clients = []
+            try:
+                for shard, port_file, process in workers:
+                    deadline = time.monotonic() + WORKER_START_TIMEOUT
+                    while not os.path.exists(port_file):
+                        if process.poll() is not None or time.monotonic() > deadline:
+                            raise InternalError(f"Shard worker {shard} did not start (exit code {process.poll()})")
+                        time.sleep(0.05)
+                    with open(port_file, "r", encoding="utf-8") as file:
+                        port = int(file.read())
+                    client = ShardClient(f"shard-{shard:02d}", ("127.0.0.1", port), self._authkey, process=None if shared else process)
+                    client.pid = process.pid
+                    clients.append(client)
+            except Exception:
+                # Workers that started wait for a first coordinator; do not leave them behind
+                for _, _, process in workers:
+                    process.kill()
+                raise
+        return clients
+
+    def _connect_remote(self) -> list[ShardClient]:
+        return [
+            ShardClient(f"shard-{shard:02d}@{address}", parse_address(address), self._authkey)
+            for shard, address in enumerate(self.addresses)
+        ]
+
+    def close(self) -> None:
+        """
+        Disconnects from the shards. Local workers stop, letting their background merges finish, once their last
+        coordinator has disconnected.
+        """
+        clients, self._clients = self._clients, []
+        for client in clients:
+            client.close(shutdown=client.process is not None)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _client_for(self, gu_id) -> ShardClient:
+        return self._clients[shard_for(gu_id, self.shard_count)]
+
+    def _scatter(self, calls: list) -> list:
+        """
+        Sends requests to shards concurrently and waits for all replies.
+
+        Args:
+            calls (list): (shard, method, args, kwargs) tuples.
+
+        Returns:
+            (list): The results, in the order of calls.
+        """
+        if len(calls) == 1:
+            shard, method, args, kwargs = calls[0]
+            return [self._clients[shard].call(method, *args, **kwargs)]
+        futures = [
+            self._executor.submit(self._clients[shard].call, method, *args, **kwargs)
+            for shard, method, args, kwargs in calls
+        ]
+        return [future.result() for future in futures]
+
+    def _broadcast(self, method: str, *args, shards: list = None, **kwargs) -> list:
+        """
+        Sends the same request to the given shards (all by default), see _scatter.
+        """
+        shards = range(self.shard_count) if shards is None else shards
+        return self._scatter([(shard, method, args, kwargs) for shard in shards])
+
+    def _shards_of(self, gu_ids: list = None) -> list:
+        """
+        Gets the shards holding the given files, all shards if gu_ids is None.
+        """
+        if gu_ids is None:
+            return list(range(self.shard_count))
+        return sorted({shard_for(gu_id, self.shard_count) for gu_id in gu_ids})
+
+    def _distribute(self, unsharded: FAISS_DB, batch_size: int = 10000) -> None:
+        """
+        Copies the pages of an unsharded store (stored vectors included) to their shards and persists them.
+        The unsharded files are left in place.
+        """
+        copied = 0
+        for page in unsharded.iter_documents(batch_size=batch_size, include_vectors=True):
+            text_embeddings = [(record["page_content"], record["vector"]) for record in page]
+            self.add_embeddings(text_embeddings, [record["metadata"] for record in page], [record["id"] for record in page])
+            copied += len(page)
+        self._broadcast("merge", background=False)
+        logging.info(f"Vectorstore {self.persist_directory} : {copied} pages distributed across {self.shard_count} shards")
+
+    # Writes
+
+    def add_embeddings(self, text_embeddings, metadatas, ids) -> None:
+        """
+        Adds precomputed embeddings, each page on the shard of its gu_id.
+
+        Args:
+            text_embeddings (list): A list of (text, embedding) pairs.
+            metadatas (list): A list of metadata dictionaries.
+            ids (list): A list of docstore ids, or None to generate them.
+        """
+        groups = {}
+        for position, metadata in enumerate(metadatas):
+            groups.setdefault(shard_for(metadata.get("gu_id"), self.shard_count), []).append(position)
+
+        text_embeddings = list(text_embeddings)
+        calls = []
+        for shard, positions in groups.items():
+            calls.append((shard, "add_embeddings", (), {
+                "text_embeddings": [
+                    (text_embeddings[position][0], np.asarray(text_embeddings[position][1], dtype=np.float32))
+                    for position in positions
+                ],
+                "metadatas": [metadatas[position] for position in positions],
+                "ids": [ids[position] for position in positions] if ids is not None else None
+            }))
+        self._scatter(calls)
+
+    def add_documents(self, documents) -> None:
+        """
+        Embeds documents and adds them to their shards.
+
+        Args:
+            documents (list): A list of document objects to be indexed.
+        """
+        if not documents:
+            return
+        texts = [document.page_content for document in documents]
+        embeddings = self.embedding_function.embed_documents(texts)
+        self.add_embeddings(list(zip(texts, embeddings)), [document.metadata for document in documents], self._document_ids(documents))
+
+    async def aadd_documents(self, documents) -> None:
+        """
+        Asynchronously embeds documents in batches (see embedding_batcher) and adds them to their shards.
+
+        Args:
+            documents (list): A list of document objects to be indexed.
+        """
+        if not documents:
+            return
+        texts = [document.page_content for document in documents]
+        embeddings = await aembed_in_batches(self.embedding_function, texts, **self.embed_params)
+        await asyncio.to_thread(
+            self.add_embeddings, list(zip(texts, embeddings)), [document.metadata for document in documents],
+            self._document_ids(documents)
+        )
+
+    @staticmethod
+    def _document_ids(documents: list) -> (list | None):
+        return [document.id for document in documents] if all(document.id for document in documents) else None
+
+    async def delete(self, gu_id) -> None:
+        """
+        Deletes the pages of a file from its shard.
+
+        Args:
+            gu_id (str): gu_id of the file
+        """
+        await asyncio.to_thread(self._client_for(gu_id).call, "delete", str(gu_id))
+
+    def save_local(self) -> None:
+        """
+        Persists the changes of every shard (see FAISS_DB.save_local).
+        """
+        self._broadcast("save_local")
+
+    async def asave_local(self) -> None:
+        await asyncio.to_thread(self.save_local)
+
+    def merge(self, background: bool = True) -> None:
+        """
+        Writes a new base snapshot of every shard (see FAISS_DB.merge).
+        """
+        self._broadcast("merge", background=background)
+
+    def compact(self) -> dict:
+        """
+        Removes the tombstoned pages of every shard (see FAISS_DB.compact).
+
+        Returns:
+            (dict): Total removed pages and rows left.
+        """
+        reports = self._broadcast("compact")
+        return {"removed": sum(report["removed"] for report in reports), "ntotal": sum(report["ntotal"] for report in reports)}
+
+    def rebuild_index(self, **kwargs) -> dict:
+        """
+        Rebuilds the index of every shard (see FAISS_DB.rebuild_index).
+
+        Returns:
+            (dict): The report of each shard.
+        """
+        return {"shards": self._broadcast("rebuild_index", **kwargs)}
+
+    # Reads
+
+    async def get_files_in_vectorstore(self) -> tuple[set, set]:
+        """
+        Get a list of files stored in vectorstore
+
+        Returns:
+            (set, set) : Filenames stored in the shards, file gu_ids stored in the shards
+        """
+        file_paths, gu_id_list = set(), set()
+        for shard_paths, shard_gu_ids in await asyncio.to_thread(self._broadcast, "get_files_in_vectorstore"):
+            file_paths.update(shard_paths)
+            gu_id_list.update(shard_gu_ids)
+        return file_paths, gu_id_list
+
+    async def get_embeddings_and_ids(self, gu_id) -> tuple[list, list, list]:
+        """
+        Get embeddings, metadata and ids of a file from its shard (see FAISS_DB.get_embeddings_and_ids).
+        """
+        return await asyncio.to_thread(self._client_for(gu_id).call, "get_embeddings_and_ids", str(gu_id))
+
+    async def get(self) -> dict:
+        """
+        Gets all documents and metadata stored in the shards.
+        """
+        documents, metadatas = [], []
+        for shard_documents in await asyncio.to_thread(self._broadcast, "get"):
+            documents += shard_documents.get("documents", [])
+            metadatas += shard_documents.get("metadatas", [])
+        return {"documents": documents, "metadatas": metadatas}
+
+    def iter_documents(self, batch_size: int = 1000, include_vectors: bool = False, offset: int = 0):
+        """
+        Streams the stored documents shard by shard, holding a single page in memory at a time.
+        Unlike FAISS_DB.iter_documents each page reads the current state of its shard, so a compaction
+        during the stream may skip or repeat pages.
+
+        Args:
+            batch_size (int): Number of documents per page.
+            include_vectors (bool): If True, the stored vectors are reconstructed from the indexes.
+            offset (int): Row position, in the shards taken one after the other, to start streaming from.
+
+        Yields:
+            (list): A page of documents, as returned by FAISS_DB.get_page.
+        """
+        for shard, rows in enumerate(self._broadcast("rows")):
+            if offset >= rows:
+                offset -= rows
+                continue
+            while offset < rows:
+                page = self._clients[shard].call("get_page", offset, batch_size, include_vectors)
+                offset += batch_size
+                if page:
+                    yield page
+            offset = 0
+
+    def stats(self) -> dict:
+        """
+        Gets the size of every shard without reading the documents.
+
+        Returns:
+            (dict): Totals of documents, tombstones, files and memory_bytes, and the stats of each shard.
+        """
+        reports = self._broadcast("stats")
+        totals = {key: sum(report[key] for report in reports) for key in ("documents", "tombstones", "files", "memory_bytes")}
+        return {"shards": self.shard_count, **totals, "docstore": reports[0]["docstore"] if reports else None, "per_shard": reports}
+
+    def memory_bytes(self) -> int:
+        """
+        Gets the memory held by the shard indexes (in the shard processes).
+        """
+        return sum(self._broadcast("memory_bytes"))
+
+    def _read_documents(self, hits: list) -> list[Document]:
+        """
+        Reads the documents of merged hits from their shards, one request per shard.
+
+        Args:
+            hits (list): (shard, docstore id) pairs, in result order.
+
+        Returns:
+            (list): The documents, in the order of hits. Pages deleted meanwhile are skipped.
+        """
+        ids_by_shard = {}
+        for shard, doc_id in hits:
+            ids_by_shard.setdefault(shard, []).append(doc_id)
+        shards = list(ids_by_shard)
+        results = self._scatter([(shard, "get_documents", (ids_by_shard[shard],), {}) for shard in shards])
+
+        documents = {}
+        for shard, shard_documents in zip(shards, results):
+            documents.update(zip(ids_by_shard[shard], shard_documents))
+        return [documents[doc_id] for _, doc_id in hits if documents.get(doc_id) is not None]
+
+    def similarity_search_by_vector(self, embedding: list, k: int = 10, gu_ids: list = None) -> list[Document]:
+        """
+        Searches the shards holding the files with an embedding and merges their hits by distance.
+
+        Args:
+            embedding (list): The query embedding.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, closest first.
+        """
+        shards = self._shards_of(gu_ids)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        results = self._broadcast("search_ids_by_vector", embedding, k, gu_ids, shards=shards)
+
+        hits = [(distance, shard, doc_id) for shard, shard_hits in zip(shards, results) for doc_id, distance in shard_hits]
+        hits.sort(key=lambda hit: hit[0])
+        return self._read_documents([(shard, doc_id) for _, shard, doc_id in hits[:k]])
+
+    def hybrid_search_by_vector(self, query: str, embedding: list, k: int = 10, gu_ids: list = None) -> list[Document]:
+        """
+        Gathers the vector and BM25 rankings of the shards, merges each by score and fuses them with
+        reciprocal rank fusion (see FAISS_DB.hybrid_search_by_vector). BM25 scores use the statistics of
+        each shard, which are close to the global ones since files are spread by hash.
+
+        Args:
+            query (str): The query text, for BM25.
+            embedding (list): The query embedding.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, best fused rank first.
+        """
+        shards = self._shards_of(gu_ids)
+        fetch_k = k * HYBRID_FETCH_FACTOR
+        embedding = np.asarray(embedding, dtype=np.float32)
+        results = self._broadcast("hybrid_ids", query, embedding, fetch_k, gu_ids, shards=shards)
+
+        shard_of_id = {}
+        vector_hits, lexical_hits = [], []
+        for shard, (shard_vector_hits, shard_lexical_hits) in zip(shards, results):
+            for doc_id, distance in shard_vector_hits:
+                shard_of_id[doc_id] = shard
+                vector_hits.append((distance, doc_id))
+            for doc_id, score in shard_lexical_hits:
+                shard_of_id[doc_id] = shard
+                lexical_hits.append((-score, doc_id))
+        vector_hits.sort(key=lambda hit: hit[0])
+        lexical_hits.sort(key=lambda hit: hit[0])
+
+        fused_ids = reciprocal_rank_fusion([
+            [doc_id for _, doc_id in vector_hits[:fetch_k]], [doc_id for _, doc_id in lexical_hits[:fetch_k]]
+        ])[:k]
+        return self._read_documents([(shard_of_id[doc_id], doc_id) for doc_id in fused_ids])
+
+    def hybrid_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        embedding = self.embedding_function.embed_query(query)
+        return self.hybrid_search_by_vector(query, embedding, k=k, gu_ids=gu_ids)
+
+    async def ahybrid_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        embedding = await self.embedding_function.aembed_query(query)
+        return await asyncio.to_thread(self.hybrid_search_by_vector, query, embedding, k, gu_ids)
+
+    def similarity_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, gu_ids=gu_ids)
+
+    async def asimilarity_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        embedding = await self.embedding_function.aembed_query(query)
+        return await asyncio.to_thread(self.similarity_search_by_vector, embedding, k, gu_ids)
+
+    def as_retriever(self, k: int = 10, gu_ids: list = None, hybrid: bool = None) -> ScopedRetriever:
+        """
+        Creates a retriever over the shards (see FAISS_DB.as_retriever).
+        """
+        return ScopedRetriever(
+            store=self,
+            k=k,
+            gu_ids=[str(gu_id) for gu_id in gu_ids] if gu_ids is not None else None,
+            hybrid=self.hybrid if hybrid is None else hybrid
+        )
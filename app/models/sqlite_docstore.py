@@ -0,0 +1,235 @@
+"""
+This module handles the disk-backed docstore of a FAISS_DB.
+
+The vectors stay in the FAISS index; the page texts and metadata live in one SQLite table next to it
+(<persist_directory>/docstore.sqlite), compressed with zstd (zlib if zstandard is not installed).
+A document is only read from disk when it is looked up, i.e. for the top-k hits of a search, so loading
+a store does not read any page text and RAM use does not grow with the size of the corpus text.
+
+Rows are keyed by docstore id, which is never reused, so pages added by a writer are invisible to the
+published snapshot (it does not map to their ids). Deleted pages are only marked as deleted and stay
+readable until the next merge purges them, so searches on a snapshot taken before the delete still find them.
+"""
+
+import os
+import json
+import zlib
+import sqlite3
+import threading
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from app.logger import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DOCSTORE_FILE = "docstore.sqlite"
+ZSTD_LEVEL = 3
+
+
+def _compress(text: str) -> tuple[str, bytes]:
+    """
+    Compresses a page text.
+
+    Returns:
+        (str, bytes): Codec name ("zstd" or "zlib") and compressed bytes.
+    """
+    data = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data)
+
+
+def _decompress(codec: str, data: bytes) -> str:
+    """
+    Decompresses a page text written by _compress.
+    """
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The docstore was written with zstd compression, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def _page_number(metadata: dict) -> (int | None):
+    try:
+        return int(metadata.get("page"))
+    except (TypeError, ValueError):
+        return None
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Docstore in a SQLite table with compressed page texts and an index on (gu_id, page).
+
+    Every thread gets its own connection; with SQLite in WAL mode, searches read alongside a writer.
+
+    Attributes:
+        path (str): Path of the SQLite database.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the SQLiteDocstore class and creates its table if needed.
+
+        Args:
+            path (str): Path of the SQLite database. Created if it does not exist.
+        """
+        self.path = path
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, gu_id TEXT, page INTEGER, codec TEXT NOT NULL, "
+            "content BLOB NOT NULL, metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS documents_gu_id_page ON documents (gu_id, page)")
+
+    def __getstate__(self) -> dict:
+        # Pickled into the base snapshot (.pkl) instead of the documents
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["path"])
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Gets the connection of the calling thread, opening it on first use.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _to_document(doc_id: str, codec: str, content: bytes, metadata: str) -> Document:
+        return Document(id=doc_id, page_content=_decompress(codec, content), metadata=json.loads(metadata))
+
+    def search(self, search: str) -> (Document | str):
+        """
+        Reads one document by docstore id.
+
+        Args:
+            search (str): The docstore id.
+
+        Returns:
+            (Document | str): The document, or an error string if the id is not stored (like InMemoryDocstore).
+        """
+        row = self._connection().execute(
+            "SELECT codec, content, metadata FROM documents WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._to_document(search, *row)
+
+    def mget(self, ids: list) -> list:
+        """
+        Reads several documents in one query per 500 ids.
+
+        Args:
+            ids (list): Docstore ids.
+
+        Returns:
+            (list): The document of each id, None for ids not stored.
+        """
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = list(ids[start:start + 500])
+            rows = self._connection().execute(
+                f"SELECT id, codec, content, metadata FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update((row[0], self._to_document(*row)) for row in rows)
+        return [found.get(doc_id) for doc_id in ids]
+
+    def get_pages(self, gu_id: str, pages: list = None) -> list[Document]:
+        """
+        Reads the pages of a file through the (gu_id, page) index.
+
+        Args:
+            gu_id (str): gu_id of the file.
+            pages (list): Page numbers to read. All pages if None.
+
+        Returns:
+            (list): The documents, ordered by page.
+        """
+        query = "SELECT id, codec, content, metadata FROM documents WHERE gu_id = ? AND deleted = 0"
+        parameters = [str(gu_id)]
+        if pages is not None:
+            query += f" AND page IN ({','.join('?' * len(pages))})"
+            parameters += [int(page) for page in pages]
+        rows = self._connection().execute(query + " ORDER BY page", parameters).fetchall()
+        return [self._to_document(*row) for row in rows]
+
+    def add(self, texts: dict) -> None:
+        """
+        Stores documents in one transaction. Existing ids are overwritten.
+
+        Args:
+            texts (dict): Docstore id -> Document.
+        """
+        rows = []
+        for doc_id, document in texts.items():
+            codec, content = _compress(document.page_content)
+            metadata = document.metadata
+            rows.append((
+                doc_id, str(metadata.get("gu_id")), _page_number(metadata), codec, content,
+                json.dumps(metadata, default=str)
+            ))
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO documents (id, gu_id, page, codec, content, metadata, deleted) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                rows
+            )
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def delete(self, ids: list) -> None:
+        """
+        Marks documents as deleted. They stay readable until purge removes them.
+
+        Args:
+            ids (list): Docstore ids. Unknown ids are ignored.
+        """
+        self._connection().executemany("UPDATE documents SET deleted = 1 WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    def purge(self, keep_ids: set) -> int:
+        """
+        Removes the documents marked as deleted, except those in keep_ids.
+
+        Args:
+            keep_ids (set): Docstore ids still referenced by the store (e.g. a delete that was not logged before a crash).
+
+        Returns:
+            (int): Number of removed documents.
+        """
+        connection = self._connection()
+        deleted_ids = [
+            (doc_id,) for (doc_id,) in connection.execute("SELECT id FROM documents WHERE deleted = 1") if doc_id not in keep_ids
+        ]
+        connection.executemany("DELETE FROM documents WHERE id = ?", deleted_ids)
+        if deleted_ids:
+            logging.info(f"Docstore {self.path} : purged {len(deleted_ids)} deleted documents")
+        return len(deleted_ids)
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM documents WHERE deleted = 0").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        """
+        Gets the size of the database file on disk.
+        """
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
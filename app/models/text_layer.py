@@ -0,0 +1,121 @@
+"""
+This module reads the embedded text layer of PDF pages with pdfplumber.
+
+Born-digital pages carry their text, so they are extracted locally instead of through the vision model;
+only scanned pages (no or unreadable text layer) and image-heavy pages (photos, charts, diagrams the
+OCR prompt describes) are sent to OCR. classify_pages decides, page by page, which path is taken.
+"""
+
+import re
+import sys
+import textwrap
+import pdfplumber
+
+from app.logger import logging
+from app.exception import get_error_message_detail
+
+TEXT_LAYER = "text_layer"
+OCR = "ocr"
+
+# Glyphs without a unicode mapping, extracted as "(cid:123)": the text layer is not usable
+_UNMAPPED_GLYPH = re.compile(r"\(cid:\d+\)")
+_BLANK_LINES = re.compile(r"\n\s*\n(\s*\n)+")
+
+
+def _image_ratio(page) -> float:
+    """
+    Gets the share of the page area covered by embedded images (clipped to the page, overlaps counted twice, at most 1).
+    """
+    page_area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for image in page.images:
+        width = min(image["x1"], page.width) - max(image["x0"], 0)
+        height = min(image["bottom"], page.height) - max(image["top"], 0)
+        if width > 0 and height > 0:
+            covered += width * height
+    return min(1.0, covered / page_area)
+
+
+def _layout_text(page) -> str:
+    """
+    Extracts the text of a page keeping its layout (columns and table cells stay aligned), without the padding.
+    """
+    text = page.extract_text(layout=True) or ""
+    text = textwrap.dedent("\n".join(line.rstrip() for line in text.splitlines()))
+    return _BLANK_LINES.sub("\n\n", text).strip("\n")
+
+
+def page_text(index: int, method: str, text: str = None, characters: int = 0, image_ratio: float = 0.0) -> dict:
+    """
+    Gets the outcome of the classification of one page.
+
+    Args:
+        index (int): 0-based page index.
+        method (str): TEXT_LAYER if the page text is taken from the text layer, OCR if the page goes to the vision model.
+        text (str): Text of the page (None for OCR pages).
+        characters (int): Number of readable characters of the text layer.
+        image_ratio (float): Share of the page area covered by images.
+
+    Returns:
+        (dict): page, method, text, characters and image_ratio.
+    """
+    return {"page": index, "method": method, "text": text, "characters": characters, "image_ratio": image_ratio}
+
+
+def classify_page(page, index: int, min_characters: int, max_image_ratio: float) -> dict:
+    """
+    Decides whether a page is extracted from its text layer or sent to OCR.
+
+    Args:
+        page (pdfplumber.page.Page): The page.
+        index (int): 0-based page index.
+        min_characters (int): Minimum number of readable characters of a text layer page.
+        max_image_ratio (float): Maximum share of the page covered by images of a text layer page.
+
+    Returns:
+        (dict): The path taken, with the text of text layer pages (see page_text).
+    """
+    image_ratio = _image_ratio(page)
+    if image_ratio > max_image_ratio:
+        return page_text(index, OCR, image_ratio=image_ratio)
+
+    text = _layout_text(page)
+    readable = _UNMAPPED_GLYPH.sub("", text)
+    characters = sum(1 for character in readable if character.isalnum())
+    if characters < min_characters or "\ufffd" * 3 in readable:
+        return page_text(index, OCR, characters=characters, image_ratio=image_ratio)
+
+    return page_text(index, TEXT_LAYER, text=text, characters=characters, image_ratio=image_ratio)
+
+
+def classify_pages(pdf_path: str, page_count: int, min_characters: int = 200, max_image_ratio: float = 0.3) -> list[dict]:
+    """
+    Classifies every page of a PDF (blocking, run it in a thread). Pages that cannot be read, or every page
+    if the PDF cannot be opened by pdfplumber, go to OCR.
+
+    Args:
+        pdf_path (str): Local path to the PDF file.
+        page_count (int): Number of pages of the PDF.
+        min_characters (int): Minimum number of readable characters of a text layer page.
+        max_image_ratio (float): Maximum share of the page covered by images of a text layer page.
+
+    Returns:
+        (list): One page_text per page, in page order.
+    """
+    pages = [page_text(index, OCR) for index in range(page_count)]
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            for index, page in enumerate(pdf.pages[:page_count]):
+                try:
+                    pages[index] = classify_page(page, index, min_characters, max_image_ratio)
+                except Exception as e:
+                    logging.warning(f"Text layer of {pdf_path} page {index + 1} not readable, sent to OCR : {e}")
+                finally:
+                    # Parsed page objects are cached by pdfplumber until closed
+                    page.close()
+
+    except Exception as e:
+        error_message = get_error_message_detail(e, sys)
+        logging.warning(f"Text layer of {pdf_path} not readable, every page is sent to OCR : {error_message}")
+
+    return pages
@@ -1,14 +1,290 @@
 """This module handles FAISS vectorstore operations"""
 
+import os
 import sys
+import json
+import uuid
+import pickle
+import asyncio
+import threading
+from contextlib import contextmanager
 
+from typing import Any, List, Optional
+
+import numpy as np
+import faiss
 from langchain_community.vectorstores import FAISS
-from faiss import IndexFlatL2
 from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.models import segment_store
+from app.models.embedding_batcher import aembed_in_batches
+from app.models.mmap_store import MmapFlatIndex, MmapDocstore, has_mmap_docstore, load_index, resident_memory_mb
+from app.models.sqlite_docstore import DOCSTORE_FILE, SQLiteDocstore
+from app.models.lexical_index import LexicalIndex, LexicalSegment, reciprocal_rank_fusion
+from app.models.layered_map import LayeredMap, LayeredSet
+from app.models.index_factory import (
+    create_index, configure_search, build_index, measure_recall, needs_training, supports_compacting_remove,
+    get_index_type, search_parameters, supports_selector, is_exhaustive
+)
 
 from app.logger import logging
 from app.exception import get_error_message_detail, InternalError
 
+# Depth of each ranking fused by hybrid search, as a multiple of k
+HYBRID_FETCH_FACTOR = 3
+# Times rebuild_index trains again when a compaction renumbered the rows during training
+REBUILD_ATTEMPTS = 3
+# Text embedded once to get the dimension of a new store when it is not configured
+DIMENSION_PROBE = "dimension"
+
+class ScopedRetriever(BaseRetriever):
+    """
+    Retriever over a FAISS_DB, optionally restricted to the pages of some files.
+
+    Attributes:
+        store: The FAISS_DB to search.
+        k (int): Number of documents to retrieve.
+        gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+        hybrid (bool): If True, vector hits are fused with BM25 hits (see FAISS_DB.hybrid_search).
+    """
+    store: Any
+    k: int = 10
+    gu_ids: Optional[List[str]] = None
+    hybrid: bool = False
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.hybrid:
+            return self.store.hybrid_search(query, k=self.k, gu_ids=self.gu_ids)
+        return self.store.similarity_search(query, k=self.k, gu_ids=self.gu_ids)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        if self.hybrid:
+            return await self.store.ahybrid_search(query, k=self.k, gu_ids=self.gu_ids)
+        return await self.store.asimilarity_search(query, k=self.k, gu_ids=self.gu_ids)
+
+
+class IndexLock():
+    """
+    Reader-writer lock of the FAISS index shared by the snapshots.
+
+    Searches and reads of stored vectors hold it shared. An append holds it exclusively only while faiss
+    adds the vectors, since the add may reallocate the storage a concurrent search is reading.
+    Waiting appends go first, so a stream of searches cannot starve ingestion. Not reentrant.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def shared(self):
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class VectorstoreSnapshot():
+    """
+    One published version of a FAISS_DB: the LangChain FAISS store and the side-indexes that describe it.
+
+    A published snapshot is never modified. Searches read the current snapshot without taking the write
+    lock. Appends add rows past the ntotal of the current snapshot to its index, docstore and row maps in
+    place, and publish a snapshot with a larger ntotal; older snapshots ignore the rows past their own.
+    Changes that rewrite rows (compaction, rebuild) work on a copy and publish it in one reference assignment.
+    The per-file maps and the tombstones are layered (see app/models/layered_map.py): a change derives them
+    in time proportional to the recent changes, not to the number of files or tombstones.
+
+    Attributes:
+        vectorstore: The FAISS vector store instance.
+        gu_id_index (LayeredMap): gu_id of a file -> docstore ids of its pages.
+        source_index (LayeredMap): source path of a file -> gu_id of the file.
+        id_to_row (dict): docstore id -> row position in the FAISS index.
+        tombstones (LayeredSet): Rows of deleted pages still present in the index, excluded from searches until compaction.
+        lexical (LexicalIndex): BM25 inverted index of the pages (immutable, shared between snapshots).
+        ntotal (int): Number of index rows that belong to this snapshot.
+    """
+
+    __slots__ = (
+        "vectorstore", "gu_id_index", "source_index", "id_to_row", "tombstones", "lexical", "ntotal", "_tombstone_selector"
+    )
+
+    def __init__(
+            self,
+            vectorstore: FAISS,
+            gu_id_index: dict | LayeredMap = None,
+            source_index: dict | LayeredMap = None,
+            id_to_row: dict = None,
+            tombstones: set | LayeredSet = None,
+            lexical: LexicalIndex = None,
+            ntotal: int = None
+            ) -> None:
+        """
+        Initializes the VectorstoreSnapshot class.
+
+        Args:
+            vectorstore (FAISS): The FAISS vector store instance.
+            gu_id_index (dict | LayeredMap): gu_id of a file -> docstore ids of its pages.
+            source_index (dict | LayeredMap): source path of a file -> gu_id of the file.
+            id_to_row (dict): docstore id -> row position. Built from the vector store if not passed.
+            tombstones (set | LayeredSet): Rows of deleted pages still present in the index.
+            lexical (LexicalIndex): BM25 inverted index of the pages.
+            ntotal (int): Number of index rows that belong to the snapshot. All rows of the index if not passed.
+        """
+        self.vectorstore = vectorstore
+        self.gu_id_index = gu_id_index if isinstance(gu_id_index, LayeredMap) else LayeredMap(gu_id_index)
+        self.source_index = source_index if isinstance(source_index, LayeredMap) else LayeredMap(source_index)
+        if id_to_row is None:
+            id_to_row = {doc_id: row for row, doc_id in vectorstore.index_to_docstore_id.items()}
+        self.id_to_row = id_to_row
+        self.tombstones = tombstones if isinstance(tombstones, LayeredSet) else LayeredSet(tombstones or ())
+        self.lexical = lexical if lexical is not None else LexicalIndex()
+        self.ntotal = ntotal if ntotal is not None else vectorstore.index.ntotal
+        self._tombstone_selector = None
+
+    def tombstone_selector(self):
+        """
+        Gets an ID selector excluding the tombstoned rows, built once per snapshot. None if there are none.
+
+        Returns:
+            (faiss.IDSelector | None): The selector.
+        """
+        if not self.tombstones:
+            return None
+        if self._tombstone_selector is None:
+            # The inner selectors are kept referenced: IDSelectorNot does not own them
+            tombstoned = self.tombstones.selector()
+            self._tombstone_selector = (faiss.IDSelectorNot(tombstoned[0]), tombstoned)
+        return self._tombstone_selector[0]
+
+    def tombstoned_ids(self) -> "TombstonedIds":
+        """
+        Gets the docstore ids of the tombstoned rows, as a view looked up through the row map.
+        """
+        return TombstonedIds(self)
+
+    def is_live(self, doc_id: str) -> bool:
+        """
+        Checks whether a docstore id is stored in this snapshot and not tombstoned.
+        """
+        row = self.id_to_row.get(doc_id)
+        return row is not None and row < self.ntotal and row not in self.tombstones
+
+    def live_count(self) -> int:
+        """
+        Gets the number of stored pages that are not tombstoned.
+        """
+        return self.ntotal - len(self.tombstones)
+
+    def for_append(self) -> "VectorstoreSnapshot":
+        """
+        Gets the next snapshot of an append. The index, docstore, row maps and tombstones are shared: pages are
+        appended to them in place, past the ntotal of this snapshot. The per-file maps are derived (see
+        LayeredMap.child), since the gu_id lists of the appended files are replaced.
+
+        Returns:
+            (VectorstoreSnapshot): The modifiable snapshot.
+        """
+        draft = VectorstoreSnapshot(
+            self.vectorstore, self.gu_id_index.child(), self.source_index.child(), self.id_to_row, self.tombstones,
+            self.lexical, self.ntotal
+        )
+        # Same tombstones, so the same selector
+        draft._tombstone_selector = self._tombstone_selector
+        return draft
+
+    def copy_side_indexes(self) -> "VectorstoreSnapshot":
+        """
+        Derives the side-indexes and tombstones (see app/models/layered_map.py), sharing the index, docstore
+        and row map. Enough for a change that only tombstones pages; the gu_id lists are replaced, never modified.
+
+        Returns:
+            (VectorstoreSnapshot): The modifiable copy.
+        """
+        return VectorstoreSnapshot(
+            self.vectorstore, self.gu_id_index.child(), self.source_index.child(), self.id_to_row, self.tombstones.child(),
+            self.lexical, self.ntotal
+        )
+
+    def copy(self) -> "VectorstoreSnapshot":
+        """
+        Copies the snapshot (index, docstore, mappings and side-indexes), for compaction, which rewrites rows,
+        and for merges, which write it while appends continue. Proportional to the store: must be called with
+        the write lock held, when the index holds exactly the rows of the current snapshot.
+        A SQLiteDocstore is shared rather than copied: its ids are never reused and deleted rows
+        stay readable until purged, so changes made through the copy are invisible to this snapshot.
+
+        Returns:
+            (VectorstoreSnapshot): The modifiable copy.
+        """
+        docstore = self.vectorstore.docstore
+        if isinstance(docstore, InMemoryDocstore):
+            docstore = InMemoryDocstore(dict(docstore._dict))
+
+        vectorstore = FAISS(
+            embedding_function=self.vectorstore.embedding_function,
+            index=faiss.clone_index(self.vectorstore.index),
+            docstore=docstore,
+            index_to_docstore_id=dict(self.vectorstore.index_to_docstore_id),
+            normalize_L2=self.vectorstore._normalize_L2
+        )
+        return VectorstoreSnapshot(
+            vectorstore,
+            {gu_id: list(ids) for gu_id, ids in self.gu_id_index.items()},
+            dict(self.source_index),
+            dict(self.id_to_row),
+            set(self.tombstones),
+            self.lexical,
+            self.ntotal
+        )
+
+
+class TombstonedIds():
+    """
+    Docstore ids of the tombstoned rows of a snapshot (the excluded ids of a BM25 search), looked up through
+    the row map of the snapshot rather than collected.
+    """
+
+    __slots__ = ("_snapshot",)
+
+    def __init__(self, snapshot: VectorstoreSnapshot) -> None:
+        self._snapshot = snapshot
+
+    def __contains__(self, doc_id: str) -> bool:
+        row = self._snapshot.id_to_row.get(doc_id)
+        return row is not None and row in self._snapshot.tombstones
+
+    def __len__(self) -> int:
+        return len(self._snapshot.tombstones)
+
+
 # Class for FAISS DB operations
 class FAISS_DB():
     """
@@ -18,61 +294,221 @@ class FAISS_DB():
     vector store using a given embedding function. It allows document storage and 
     retrieval using vector similarity search.
 
+    The state is held in an immutable VectorstoreSnapshot. Searches run against the snapshot
+    current when they start, without the write lock. Writes are serialized and publish a new snapshot,
+    so a search never sees a half-applied write. Adds append in place past the rows of the published
+    snapshot, in time proportional to the pages added; the index lock only keeps the faiss add apart
+    from searches. Deletes derive the per-file maps and tombstones, replacing only the entries of the files
+    changed; compaction copies the whole store.
+    The CPU-bound part of async writes and persistence run in worker threads, off the event loop.
+    Deleted pages are tombstoned (excluded from searches) and physically removed by a background
+    compaction once they make up compact_ratio of the index.
+
     Attributes:
         embedding_function: The embedding function used to generate vector embeddings.
         persist_directory (str): Directory where the FAISS index is stored.
         vectorstore: The FAISS vector store instance.
+        index_type (str): Index type used for new stores and rebuilds (one of index_factory.INDEX_TYPES).
+        index_params (dict): nlist, nprobe, pq_m, hnsw_m and ef_search used to build and query the index.
+        gu_id_index (dict): gu_id of a file -> docstore ids of its pages.
+        source_index (dict): source path of a file -> gu_id of the file.
+        id_to_row (dict): docstore id -> row position in the FAISS index.
+        merge_threshold (int): Number of logged changes after which a new base snapshot is written.
+        read_only (bool): If True, the base snapshot is memory-mapped instead of read into memory and the store cannot be modified.
+        docstore_type (str): 'memory' (InMemoryDocstore) or 'sqlite' (SQLiteDocstore, page texts read from disk on lookup).
+        compact_ratio (float): Share of tombstoned rows in the index above which a background compaction starts.
+        hybrid (bool): If True, retrievers created by as_retriever fuse vector and BM25 hits.
+        embed_params (dict): max_items, max_tokens, max_concurrency and max_retries of the embedding requests made by aadd_documents.
+        dimensions (int): Dimension of the vectors of a new store, None to embed DIMENSION_PROBE to get it.
     """
 
-    def __init__(self, embedding_function, persist_directory = None) -> None:
+    def __init__(
+            self,
+            embedding_function,
+            persist_directory = None,
+            index_type: str = "flat",
+            nlist: int = 1024,
+            nprobe: int = 16,
+            pq_m: int = 64,
+            hnsw_m: int = 32,
+            ef_search: int = 64,
+            merge_threshold: int = 32,
+            read_only: bool = False,
+            embed_batch_size: int = 64,
+            embed_batch_tokens: int = 32000,
+            embed_concurrency: int = 4,
+            embed_max_retries: int = 6,
+            docstore_type: str = "memory",
+            compact_ratio: float = 0.2,
+            hybrid: bool = True,
+            dimensions: int = None
+            ) -> None:
         """
         Initializes the FAISS_DB class.
 
         Args:
             embedding_function: A function to convert text into vector embeddings.
             persist_directory (str): Directory path to save or load the FAISS index.
+            index_type (str): Index type used for new stores and rebuilds: 'flat', 'sq_fp16', 'sq_int8', 'pq',
+                'ivf_flat', 'ivf_pq' or 'hnsw'.
+            nlist (int): Number of IVF lists.
+            nprobe (int): Number of IVF lists visited per query.
+            pq_m (int): Number of PQ sub-quantizers.
+            hnsw_m (int): Number of neighbours per HNSW node.
+            ef_search (int): Size of the HNSW candidate list per query.
+            merge_threshold (int): Number of logged changes after which save_local merges them into a new base snapshot.
+            read_only (bool): If True, load() memory-maps the base snapshot so that processes opening the same
+                store share it through the page cache. Adding or deleting documents then raises an error.
+            embed_batch_size (int): Maximum number of page texts per embedding request.
+            embed_batch_tokens (int): Maximum number of tokens per embedding request.
+            embed_concurrency (int): Maximum number of concurrent embedding requests.
+            embed_max_retries (int): Number of retries of an embedding request rejected with 429.
+            docstore_type (str): 'memory' keeps page texts in RAM (pickled with each base snapshot);
+                'sqlite' keeps them compressed in <persist_directory>/docstore.sqlite and reads them per hit.
+                Used for new stores; an in-memory store loaded with 'sqlite' is converted once.
+            compact_ratio (float): Share of tombstoned rows in the index above which deleted pages are physically
+                removed by a background compaction.
+            hybrid (bool): If True, retrievers created by as_retriever fuse vector hits with BM25 hits
+                of the inverted index kept alongside the index (see hybrid_search).
+            dimensions (int): Dimension of the vectors of a new store. If None, DIMENSION_PROBE is embedded once
+                to get it. Existing stores keep the dimension of their index.
         """
         self.embedding_function = embedding_function
+        self.dimensions = dimensions
         self.persist_directory = persist_directory
+        self.index_type = index_type
+        self.index_params = {"nlist": nlist, "nprobe": nprobe, "pq_m": pq_m, "hnsw_m": hnsw_m, "ef_search": ef_search}
+        self.read_only = read_only
+        self.docstore_type = docstore_type if persist_directory else "memory"
+        self.hybrid = hybrid
+        self.embed_params = {
+            "max_items": embed_batch_size,
+            "max_tokens": embed_batch_tokens,
+            "max_concurrency": embed_concurrency,
+            "max_retries": embed_max_retries
+        }
+
+        # Segmented persistence state (see app/models/segment_store.py)
+        self.merge_threshold = merge_threshold
+        self._manifest = None
+        self._next_file_number = 1
+        self._wal_record_count = 0
+        self._pending_adds = {}
+        self._pending_deletes = set()
+        self._persist_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread = None
+        self._writer_lock = None
+        self.compact_ratio = compact_ratio
+        self._compact_thread = None
+
+        # Published state, replaced as a whole by writers (serialized by the write lock)
+        self._snapshot = None
+        self._write_lock = threading.Lock()
+        self._index_lock = IndexLock()
+
+    @property
+    def vectorstore(self) -> FAISS:
+        return self._snapshot.vectorstore
 
+    @property
+    def gu_id_index(self) -> dict:
+        return self._snapshot.gu_id_index
 
+    @property
+    def source_index(self) -> dict:
+        return self._snapshot.source_index
+
+    @property
+    def id_to_row(self) -> dict:
+        return self._snapshot.id_to_row
 
     def load(self) -> FAISS:
         """
         Loads an existing FAISS vector store from disk.
 
-        If loading fails (e.g., if the stored FAISS index does not exist or is corrupted), 
-        a new FAISS vector store is created and saved locally.
+        The base snapshot named in the manifest is loaded and the changes recorded in the
+        write-ahead log since that snapshot are replayed on top of it.
+        If nothing is stored in the persist directory yet, a new FAISS vector store is
+        created and saved locally. The type of a loaded index is whatever was persisted;
+        only its query-time parameters (nprobe, efSearch) are applied.
+        IVF and trained quantizer types (sq_int8, pq) need training data, so new empty stores
+        of those types start as flat and are converted with rebuild_index once populated.
+        In read-only mode the base snapshot is memory-mapped when the write-ahead log is empty
+        (see _load_mmap); otherwise it is read into memory as usual.
+        With a SQLite docstore only the index is read; page texts stay on disk.
+        A persist directory opened writable is locked (see _lock_persist_directory).
 
         Returns:
             FAISS: The loaded or newly created FAISS vector store.
         """
         try:
-            try:
+            if self.persist_directory and not self.read_only:
+                self._lock_persist_directory()
+            manifest = segment_store.read_manifest(self.persist_directory) if self.persist_directory else None
+
+            if manifest and self.read_only and self._load_mmap(manifest):
+                return self.vectorstore
+
+            if manifest:
                 vectorstore = FAISS.load_local(
                     folder_path=self.persist_directory,
                     embeddings=self.embedding_function,
+                    index_name=manifest["base"],
                     allow_dangerous_deserialization=True
                 )
-                self.vectorstore = vectorstore
-                logging.info(f"Vectrostore loaded from {self.persist_directory} successfully")
+                configure_search(vectorstore.index, nprobe=self.index_params["nprobe"], ef_search=self.index_params["ef_search"])
+                if isinstance(vectorstore.docstore, SQLiteDocstore):
+                    # The pickled docstore only names its file; reopen it where the store is now
+                    vectorstore.docstore = SQLiteDocstore(self._docstore_path())
+                draft = VectorstoreSnapshot(vectorstore)
+                self._manifest = manifest
+                self._next_file_number = segment_store.next_file_number(self.persist_directory)
+                self._load_metadata_index(draft)
+                self._load_lexical_index(draft)
+
+                wal_records = segment_store.read_wal(self._wal_path())
+                self._replay(draft, wal_records)
+                self._wal_record_count = len(wal_records)
+
+                convert_docstore = (
+                    self.docstore_type == "sqlite" and not self.read_only and isinstance(vectorstore.docstore, InMemoryDocstore)
+                )
+                if convert_docstore:
+                    self._move_to_sqlite_docstore(draft)
+                self._snapshot = draft
+                if convert_docstore:
+                    self.merge(background=False)
+
+                logging.info(
+                    f"Vectrostore loaded from {self.persist_directory} successfully ({len(wal_records)} logged changes replayed), "
+                    f"RSS {resident_memory_mb()} MB"
+                )
                 return self.vectorstore
 
-            except:
-                dimensions: int = len(self.embedding_function.embed_query(""))
+            elif self.read_only:
+                raise InternalError(f"Nothing is stored in read-only vectorstore {self.persist_directory}")
+
+            else:
+                # A non-empty text: the embeddings endpoint may reject an empty input
+                dimensions: int = self.dimensions or len(self.embedding_function.embed_query(DIMENSION_PROBE))
+                index_type = "flat" if needs_training(self.index_type) else self.index_type
+                index = create_index(dimensions, index_type=index_type, hnsw_m=self.index_params["hnsw_m"])
 
                 vectorstore = FAISS(
                     embedding_function=self.embedding_function,
-                    index=IndexFlatL2(dimensions),
-                    docstore=InMemoryDocstore(),
+                    index=configure_search(index, ef_search=self.index_params["ef_search"]),
+                    docstore=SQLiteDocstore(self._docstore_path()) if self.docstore_type == "sqlite" else InMemoryDocstore(),
                     index_to_docstore_id={},
                     normalize_L2=False
                 )
                 logging.info("Vectrostore created successfully")
-                if self.persist_directory:
-                    vectorstore.save_local(self.persist_directory)
+                self._snapshot = VectorstoreSnapshot(vectorstore)
+                if self.persist_directory and not self.read_only:
+                    os.makedirs(self.persist_directory, exist_ok=True)
+                    self._next_file_number = segment_store.next_file_number(self.persist_directory)
+                    self.merge(background=False)
                     logging.info(f"Vectrostore saved to {self.persist_directory} successfully")
-                self.vectorstore = vectorstore
                 return self.vectorstore
 
         except Exception as e:
@@ -81,11 +517,560 @@ class FAISS_DB():
             raise InternalError("An error occurred while loading vectorstore : " + str(e))
 
 
+    def _load_mmap(self, manifest: dict) -> bool:
+        """
+        Opens the base snapshot of the manifest memory-mapped, without reading the index or the documents.
+
+        Only possible when no change was logged since the snapshot and the snapshot has its
+        memory-mappable docstore files (written by every merge).
+
+        Args:
+            manifest (dict): The manifest of the persist directory.
+
+        Returns:
+            (bool): True if the store was opened memory-mapped, False if it has to be read into memory.
+        """
+        base = manifest["base"]
+        if segment_store.read_wal(os.path.join(self.persist_directory, manifest["wal"]) if manifest.get("wal") else None):
+            logging.warning(f"Vectorstore {self.persist_directory} has logged changes since its last merge. Loading it into memory.")
+            return False
+
+        rss_before = resident_memory_mb()
+        if os.path.exists(self._docstore_path()):
+            # SQLite docstore: the base .pkl only holds the docstore file name and the row -> id mapping
+            with open(os.path.join(self.persist_directory, f"{base}.pkl"), "rb") as docstore_file:
+                docstore, index_to_docstore_id = pickle.load(docstore_file)
+            if not isinstance(docstore, SQLiteDocstore):
+                logging.warning(f"Vectorstore {self.persist_directory} was not merged since its docstore was moved to SQLite. Loading it into memory.")
+                return False
+            docstore = SQLiteDocstore(self._docstore_path())
+        elif has_mmap_docstore(self.persist_directory, base):
+            docstore = MmapDocstore(self.persist_directory, base)
+            index_to_docstore_id = dict(enumerate(docstore.ids))
+        else:
+            logging.warning(f"Vectorstore {self.persist_directory} has no memory-mappable docstore yet. Loading it into memory.")
+            return False
+
+        index = load_index(os.path.join(self.persist_directory, f"{base}.faiss"))
+        if not isinstance(index, MmapFlatIndex):
+            configure_search(index, nprobe=self.index_params["nprobe"], ef_search=self.index_params["ef_search"])
+
+        draft = VectorstoreSnapshot(FAISS(
+            embedding_function=self.embedding_function,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            normalize_L2=False
+        ))
+        self._manifest = manifest
+        self._load_metadata_index(draft)
+        self._load_lexical_index(draft)
+        self._snapshot = draft
+
+        logging.info(
+            f"Vectrostore {self.persist_directory} opened read-only (memory-mapped), "
+            f"RSS {rss_before} MB before, {resident_memory_mb()} MB after"
+        )
+        return True
+
+    def _lock_persist_directory(self) -> None:
+        """
+        Takes the writer lock of the persist directory for as long as this store is open.
+
+        A second writer (another API worker, a sync or rebuild run) would log changes and merge under the
+        first one, and a merge deletes the files its own manifest does not reference; it fails here instead.
+        Read-only stores do not lock, so they can be opened alongside the writer.
+        """
+        if self._writer_lock is not None:
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+        try:
+            self._writer_lock = segment_store.lock_writer(self.persist_directory)
+        except BlockingIOError:
+            raise InternalError(
+                f"Vectorstore {self.persist_directory} is already opened writable by another process "
+                "(open it read-only, or stop the other writer)"
+            )
+
+    def _check_writable(self) -> None:
+        """
+        Raises an error if the store was opened read-only.
+        """
+        if self.read_only:
+            raise InternalError(f"Vectorstore {self.persist_directory} is opened read-only")
+
+    def _wal_path(self) -> (str | None):
+        """
+        Gets the path of the current write-ahead log, None if the store has none yet.
+        """
+        if not self._manifest or not self._manifest.get("wal"):
+            return None
+        return os.path.join(self.persist_directory, self._manifest["wal"])
+
+    def _docstore_path(self) -> str:
+        """
+        Gets the path of the SQLite docstore of the persist directory.
+        """
+        return os.path.join(self.persist_directory, DOCSTORE_FILE)
+
+    def _move_to_sqlite_docstore(self, draft: VectorstoreSnapshot) -> None:
+        """
+        Copies the documents of an in-memory docstore into the SQLite docstore and switches the snapshot to it.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being loaded, not published yet.
+        """
+        docstore = SQLiteDocstore(self._docstore_path())
+        documents = draft.vectorstore.docstore._dict
+        ids = list(documents)
+        for start in range(0, len(ids), 1000):
+            docstore.add({doc_id: documents[doc_id] for doc_id in ids[start:start + 1000]})
+        draft.vectorstore.docstore = docstore
+        logging.info(f"Vectorstore {self.persist_directory} : {len(ids)} documents moved to {docstore.path}")
+
+    def _load_metadata_index(self, draft: VectorstoreSnapshot) -> None:
+        """
+        Loads the gu_id / source side-index persisted with the base snapshot.
+
+        Snapshots saved without a side-index (or whose side-index does not match the
+        docstore) are indexed once from the docstore and the side-index is saved.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being loaded, not published yet.
+        """
+        base = self._manifest["base"]
+        index_path = segment_store.metadata_path(self.persist_directory, base)
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as index_file:
+                    metadata_index = json.load(index_file)
+
+                draft.gu_id_index = LayeredMap(metadata_index.get("gu_ids", {}))
+                draft.source_index = LayeredMap(metadata_index.get("sources", {}))
+                draft.tombstones = LayeredSet(
+                    draft.id_to_row[doc_id] for doc_id in metadata_index.get("tombstones", []) if doc_id in draft.id_to_row
+                )
+
+                if sum(len(ids) for ids in draft.gu_id_index.values()) == draft.live_count():
+                    return
+
+            except ValueError:
+                pass
+
+            logging.warning(f"Metadata index of {self.persist_directory} is out of sync with the docstore. Rebuilding it.")
+
+        draft.gu_id_index, draft.source_index = LayeredMap(), LayeredMap()
+        tombstoned_ids = {draft.vectorstore.index_to_docstore_id[row] for row in draft.tombstones}
+        for doc_id in draft.id_to_row:
+            if doc_id in tombstoned_ids:
+                continue
+            document = draft.vectorstore.docstore.search(doc_id)
+            self._index_metadata(draft, doc_id, document.metadata)
+
+        if not self.read_only:
+            segment_store.write_metadata(self.persist_directory, base, self._metadata_snapshot(draft))
+        logging.info(f"Metadata index built for {self.persist_directory} : {len(draft.gu_id_index)} files")
+
+    def _load_lexical_index(self, draft: VectorstoreSnapshot) -> None:
+        """
+        Loads the BM25 inverted index persisted with the base snapshot.
+
+        Snapshots saved without one (or with one that does not match the live pages) are indexed
+        once from the docstore and the inverted index is saved.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being loaded, with its side-index and tombstones.
+        """
+        base = self._manifest["base"]
+        try:
+            arrays = segment_store.read_lexical(self.persist_directory, base)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Inverted index of {self.persist_directory} could not be read : {e}")
+            arrays = None
+
+        if arrays is not None:
+            segment = LexicalSegment.from_arrays(arrays)
+            if len(segment) == draft.live_count():
+                draft.lexical = LexicalIndex([segment])
+                return
+            logging.warning(f"Inverted index of {self.persist_directory} is out of sync with the docstore. Rebuilding it.")
+
+        lexical = LexicalIndex()
+        live_ids = [doc_id for row, doc_id in sorted(draft.vectorstore.index_to_docstore_id.items()) if row not in draft.tombstones]
+        for start in range(0, len(live_ids), 1000):
+            ids = live_ids[start:start + 1000]
+            lexical = lexical.add(ids, [draft.vectorstore.docstore.search(doc_id).page_content for doc_id in ids])
+        draft.lexical = lexical
+
+        if not self.read_only:
+            segment_store.write_lexical(self.persist_directory, base, LexicalSegment.merge(lexical.segments).to_arrays())
+        logging.info(f"Inverted index built for {self.persist_directory} : {len(lexical)} pages")
+
+    @staticmethod
+    def _metadata_snapshot(snapshot: VectorstoreSnapshot) -> dict:
+        """
+        Copies the gu_id / source side-index and the tombstoned ids of a snapshot into a JSON-serialisable dict.
+        """
+        return {
+            "gu_ids": {gu_id: list(ids) for gu_id, ids in snapshot.gu_id_index.items()},
+            "sources": dict(snapshot.source_index),
+            "tombstones": [snapshot.vectorstore.index_to_docstore_id[row] for row in sorted(snapshot.tombstones)]
+        }
+
+    @staticmethod
+    def _index_metadata(draft: VectorstoreSnapshot, doc_id: str, metadata: dict) -> None:
+        """
+        Registers a single docstore id in the gu_id / source side-index.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being modified.
+            doc_id (str): Docstore id of the page.
+            metadata (dict): Metadata of the page.
+        """
+        gu_id = str(metadata.get("gu_id"))
+        draft.gu_id_index.setdefault(gu_id, []).append(doc_id)
+        if "source" in metadata:
+            draft.source_index[metadata["source"]] = gu_id
+
+    def _index_added(self, draft: VectorstoreSnapshot, ids: list, metadatas: list, texts: list) -> None:
+        """
+        Updates the side-index, row map and inverted index after pages were appended to the index.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being modified.
+            ids (list): Docstore ids returned by the FAISS vector store.
+            metadatas (list): Metadata of the added pages, in the same order.
+            texts (list): Texts of the added pages, in the same order.
+        """
+        starting_row = draft.vectorstore.index.ntotal - len(ids)
+        added_by_gu_id = {}
+        for offset, (doc_id, metadata) in enumerate(zip(ids, metadatas)):
+            draft.id_to_row[doc_id] = starting_row + offset
+            gu_id = str(metadata.get("gu_id"))
+            added_by_gu_id.setdefault(gu_id, []).append(doc_id)
+            if "source" in metadata:
+                draft.source_index[metadata["source"]] = gu_id
+        # The lists may be shared with published snapshots, so they are replaced rather than extended
+        for gu_id, added_ids in added_by_gu_id.items():
+            draft.gu_id_index[gu_id] = draft.gu_id_index.get(gu_id, []) + added_ids
+        draft.ntotal = draft.vectorstore.index.ntotal
+        draft.lexical = draft.lexical.add(ids, texts, is_live=draft.is_live)
+
+    def _remove_ids(self, draft: VectorstoreSnapshot, ids: list) -> list:
+        """
+        Tombstones pages: they leave the side-index and are excluded from searches, but stay in the
+        index and the docstore until compaction. The cost is proportional to the number of pages.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being modified.
+            ids (list): Docstore ids to remove. Unknown and already tombstoned ids are ignored.
+
+        Returns:
+            (list): The ids that were removed.
+        """
+        ids = [doc_id for doc_id in ids if doc_id in draft.id_to_row and draft.id_to_row[doc_id] not in draft.tombstones]
+        if not ids:
+            return []
+
+        removed_by_gu_id, sources_by_gu_id = {}, {}
+        for doc_id in ids:
+            metadata = draft.vectorstore.docstore.search(doc_id).metadata
+            gu_id = str(metadata.get("gu_id"))
+            removed_by_gu_id.setdefault(gu_id, set()).add(doc_id)
+            if "source" in metadata:
+                sources_by_gu_id.setdefault(gu_id, set()).add(metadata["source"])
+            draft.tombstones.add(draft.id_to_row[doc_id])
+
+        # Only the entries of the files changed are replaced
+        for gu_id, removed_ids in removed_by_gu_id.items():
+            remaining_ids = [doc_id for doc_id in draft.gu_id_index.get(gu_id, []) if doc_id not in removed_ids]
+            if remaining_ids:
+                draft.gu_id_index[gu_id] = remaining_ids
+            else:
+                draft.gu_id_index.pop(gu_id, None)
+                for source in sources_by_gu_id.get(gu_id, ()):
+                    if draft.source_index.get(source) == gu_id:
+                        del draft.source_index[source]
+
+        return ids
+
+    def _remove_tombstoned(self, draft: VectorstoreSnapshot) -> int:
+        """
+        Physically removes the tombstoned rows from the index and the docstore.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being modified (a full copy).
+
+        Returns:
+            (int): Number of removed rows.
+        """
+        ids = [draft.vectorstore.index_to_docstore_id[row] for row in sorted(draft.tombstones)]
+        if not ids:
+            return 0
+
+        if supports_compacting_remove(draft.vectorstore.index):
+            draft.vectorstore.delete(ids=ids)
+        else:
+            # IVF / HNSW indexes keep stale row labels after remove_ids, so they are rebuilt without the pages
+            self._rebuild_without(draft, set(ids))
+        draft.lexical = draft.lexical.compact(is_live=draft.is_live)
+
+        # FAISS renumbers the remaining rows after a delete
+        draft.id_to_row = {doc_id: row for row, doc_id in draft.vectorstore.index_to_docstore_id.items()}
+        draft.tombstones = LayeredSet()
+        draft.ntotal = draft.vectorstore.index.ntotal
+        return len(ids)
+
+    def compact(self) -> dict:
+        """
+        Physically removes the tombstoned pages from the index and the docstore, then writes a new base snapshot.
+
+        The rows are renumbered, so this copies the index and rewrites it; writes wait for it, searches
+        keep using the previous snapshot until the compacted one is published.
+
+        Returns:
+            (dict): Number of removed rows and of remaining rows.
+        """
+        try:
+            self._check_writable()
+            with self._write_lock:
+                if not self._snapshot.tombstones:
+                    return {"removed": 0, "ntotal": int(self._snapshot.vectorstore.index.ntotal)}
+                draft = self._snapshot.copy()
+                removed = self._remove_tombstoned(draft)
+                # Only the layout changes: the deletes are already logged, so nothing is pending
+                self._commit(draft)
+
+            self.merge(background=False)
+            report = {"removed": removed, "ntotal": int(draft.vectorstore.index.ntotal)}
+            logging.info(f"Vectorstore {self.persist_directory} compacted : {report}")
+            return report
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error("An error occurred while compacting the vectorstore : " + error_message)
+            raise InternalError("An error occurred while compacting the vectorstore : " + str(e))
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except InternalError:
+            pass
+
+    def _schedule_compaction(self) -> None:
+        """
+        Starts a background compaction if the tombstoned rows passed compact_ratio of the index
+        and none is running. Must be called with the write lock held.
+        """
+        snapshot = self._snapshot
+        ntotal = snapshot.ntotal
+        if not ntotal or len(snapshot.tombstones) < self.compact_ratio * ntotal:
+            return
+        if self._compact_thread and self._compact_thread.is_alive():
+            return
+        logging.info(f"Vectorstore {self.persist_directory} : {len(snapshot.tombstones)} of {ntotal} rows tombstoned, compacting")
+        self._compact_thread = threading.Thread(target=self._compact_in_background, daemon=True)
+        self._compact_thread.start()
+
+    def _replay(self, draft: VectorstoreSnapshot, wal_records: list) -> None:
+        """
+        Applies write-ahead log records to the loaded base snapshot.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being loaded, not published yet.
+            wal_records (list): Records read from the log, in order.
+        """
+        for record in wal_records:
+            if record["op"] == "add":
+                vectors, documents = segment_store.read_segment(self.persist_directory, record["segment"])
+                ids = [doc_id for doc_id, _ in documents]
+                metadatas = [document.metadata for _, document in documents]
+                text_embeddings = [(document.page_content, vector) for (_, document), vector in zip(documents, vectors)]
+                self._append(draft, text_embeddings, metadatas, ids)
+                self._index_added(draft, ids, metadatas, [document.page_content for _, document in documents])
+
+            elif record["op"] == "delete":
+                self._remove_ids(draft, record["ids"])
+
+    def _commit(self, draft: VectorstoreSnapshot, added_ids: list = (), removed_ids: list = ()) -> None:
+        """
+        Publishes a modified snapshot and records the change for the next save_local.
+        Must be called with the write lock held.
+
+        Args:
+            draft (VectorstoreSnapshot): The modified snapshot.
+            added_ids (list): Docstore ids added by the change.
+            removed_ids (list): Docstore ids removed by the change.
+        """
+        with self._persist_lock:
+            self._snapshot = draft
+            for doc_id in removed_ids:
+                if doc_id in self._pending_adds:
+                    del self._pending_adds[doc_id]
+                else:
+                    self._pending_deletes.add(doc_id)
+            for doc_id in added_ids:
+                self._pending_adds[doc_id] = None
+
+    def _flush_pending(self) -> None:
+        """
+        Writes the changes made since the last save as one segment plus log records.
+        Must be called with the persist lock held.
+        """
+        if not self._pending_adds and not self._pending_deletes:
+            return
+
+        if self._wal_path() is None:
+            # Store saved in the legacy single-file layout: start a log on top of it
+            self._manifest = {"base": self._manifest["base"], "wal": f"wal-{self._take_file_number():06d}.jsonl"}
+            segment_store.write_wal(self._wal_path(), [])
+            segment_store.write_manifest(self.persist_directory, self._manifest)
+
+        wal_records = []
+        # Deletes first: an id deleted and added again since the last save is re-added by the segment
+        if self._pending_deletes:
+            wal_records.append({"op": "delete", "ids": sorted(self._pending_deletes)})
+
+        if self._pending_adds:
+            snapshot = self._snapshot
+            ids = list(self._pending_adds)
+            rows = np.array([snapshot.id_to_row[doc_id] for doc_id in ids], dtype=np.int64)
+            with self._index_lock.shared():
+                vectors = snapshot.vectorstore.index.reconstruct_batch(rows)
+            documents = [(doc_id, snapshot.vectorstore.docstore.search(doc_id)) for doc_id in ids]
+
+            segment_name = f"segment-{self._take_file_number():06d}"
+            segment_store.write_segment(self.persist_directory, segment_name, vectors, documents)
+            wal_records.append({"op": "add", "segment": segment_name})
+
+        segment_store.append_wal(self._wal_path(), wal_records)
+        self._wal_record_count += len(wal_records)
+        self._pending_adds = {}
+        self._pending_deletes = set()
+
+    def _take_file_number(self) -> int:
+        """
+        Reserves the next base / log / segment file number.
+        """
+        number = self._next_file_number
+        self._next_file_number += 1
+        return number
+
     def save_local(self) -> None:
         """
-        Saves the current FAISS vector store to the specified directory.
+        Persists the changes made since the last save.
+
+        Only the added pages (as a new immutable segment) and the deleted ids are written,
+        so the cost is proportional to the change, not to the store. Once the log holds
+        merge_threshold records, a background merge writes a new base snapshot.
+        """
+        if not self.persist_directory:
+            return
+        self._check_writable()
+
+        with self._persist_lock:
+            self._flush_pending()
+            merge_due = self._wal_record_count >= self.merge_threshold
+
+        if merge_due and not (self._merge_thread and self._merge_thread.is_alive()):
+            self.merge(background=True)
+
+    async def asave_local(self) -> None:
+        """
+        Persists the changes made since the last save in a worker thread, off the event loop (see save_local).
+        """
+        await asyncio.to_thread(self.save_local)
+
+    def merge(self, background: bool = True) -> None:
+        """
+        Writes the current state as a new base snapshot and starts a new write-ahead log.
+
+        Appends change the index and docstore of the published snapshot in place, so the state is
+        copied under the write lock (see VectorstoreSnapshot.copy); the copy is written outside the
+        locks (in a background thread if requested), so writes and saves can continue meanwhile.
+        Log records written during the merge are carried over to the new log before the
+        manifest is switched, then obsolete files are removed.
+        Merges (e.g. one started by save_local and one by a compaction) run one at a time, each
+        taking its snapshot once the previous one has switched the manifest.
+
+        Args:
+            background (bool): If True, the snapshot is written in a background thread.
+        """
+        if not self.persist_directory:
+            return
+        self._check_writable()
+
+        if background:
+            self._merge_thread = threading.Thread(target=self._run_merge, daemon=True)
+            self._merge_thread.start()
+        else:
+            self._run_merge()
+
+    def _run_merge(self) -> None:
+        """
+        Takes a copy of the current state and writes it, holding the merge lock.
+        """
+        with self._merge_lock:
+            with self._write_lock, self._persist_lock:
+                self._flush_pending()
+                snapshot = {
+                    "number": self._take_file_number(),
+                    "state": self._snapshot.copy(),
+                    "wal_position": self._wal_record_count
+                }
+            self._write_merge(snapshot)
+
+    def _write_merge(self, snapshot: dict) -> None:
+        """
+        Writes a snapshot taken by merge and switches the manifest to it.
+
+        Args:
+            snapshot (dict): Copy of the state taken by merge.
         """
-        self.vectorstore.save_local(folder_path=self.persist_directory)
+        try:
+            base = f"base-{snapshot['number']:06d}"
+            wal = f"wal-{snapshot['number']:06d}.jsonl"
+
+            vectorstore = snapshot["state"].vectorstore
+            segment_store.write_base(
+                self.persist_directory, base, vectorstore.index, vectorstore.docstore, vectorstore.index_to_docstore_id
+            )
+            segment_store.write_metadata(self.persist_directory, base, self._metadata_snapshot(snapshot["state"]))
+            segment_store.write_lexical(
+                self.persist_directory, base,
+                LexicalSegment.merge(snapshot["state"].lexical.segments, is_live=snapshot["state"].is_live).to_arrays()
+            )
+            if not isinstance(vectorstore.docstore, SQLiteDocstore):
+                segment_store.write_mmap_docstore(
+                    self.persist_directory, base, vectorstore.docstore, vectorstore.index_to_docstore_id
+                )
+
+            with self._persist_lock:
+                old_manifest = self._manifest
+                tail_records = segment_store.read_wal(self._wal_path())[snapshot["wal_position"]:]
+                segment_store.write_wal(os.path.join(self.persist_directory, wal), tail_records)
+
+                self._manifest = {"base": base, "wal": wal}
+                segment_store.write_manifest(self.persist_directory, self._manifest)
+                self._wal_record_count = len(tail_records)
+
+                keep = {base, wal.split(".")[0]} | segment_store.referenced_segments(tail_records)
+                segment_store.remove_unreferenced_files(self.persist_directory, keep)
+
+                if old_manifest and old_manifest["base"] == segment_store.LEGACY_BASE:
+                    for file_name in ("index.faiss", "index.pkl", "index.metadata.json", "metadata_index.json"):
+                        if os.path.exists(os.path.join(self.persist_directory, file_name)):
+                            os.remove(os.path.join(self.persist_directory, file_name))
+
+            if isinstance(vectorstore.docstore, SQLiteDocstore):
+                # Deleted pages are no longer referenced by the new base snapshot
+                vectorstore.docstore.purge(keep_ids=set(vectorstore.index_to_docstore_id.values()))
+
+            logging.info(f"Vectorstore {self.persist_directory} merged into {base}")
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error("An error occurred while merging vectorstore segments : " + error_message)
 
     def add_documents(self, documents) -> None:
         """
@@ -94,16 +1079,155 @@ class FAISS_DB():
         Args:
             documents (list): A list of document objects to be indexed.
         """
-        self.vectorstore.add_documents(documents=documents)
+        self._check_writable()
+        if not documents:
+            return
+
+        texts = [document.page_content for document in documents]
+        embeddings = self.embedding_function.embed_documents(texts)
+        self._add_embedded(list(zip(texts, embeddings)), [document.metadata for document in documents], self._document_ids(documents))
 
     async def aadd_documents(self, documents) -> None:
         """
         Asynchronously adds a list of documents to the FAISS vector store.
 
+        The page texts are embedded in batches bounded by item and token count, a few requests at a time,
+        with rate-limited requests retried (see embedding_batcher). The embeddings are then added to the
+        index in one contiguous add, in a worker thread so that searches on the event loop are not held up.
+
         Args:
             documents (list): A list of document objects to be indexed.
         """
-        await self.vectorstore.aadd_documents(documents=documents)
+        self._check_writable()
+        if not documents:
+            return
+
+        texts = [document.page_content for document in documents]
+        embeddings = await aembed_in_batches(self.embedding_function, texts, **self.embed_params)
+
+        metadatas = [document.metadata for document in documents]
+        await asyncio.to_thread(self._add_embedded, list(zip(texts, embeddings)), metadatas, self._document_ids(documents))
+
+    def add_embeddings(self, text_embeddings, metadatas, ids) -> None:
+        """
+        Adds precomputed embeddings (e.g. copied from another vectorstore) to the FAISS vector store.
+
+        Args:
+            text_embeddings (list): A list of (text, embedding) pairs.
+            metadatas (list): A list of metadata dictionaries.
+            ids (list): A list of docstore ids.
+        """
+        self._check_writable()
+        self._add_embedded(list(text_embeddings), metadatas, ids)
+
+    @staticmethod
+    def _document_ids(documents: list) -> (list | None):
+        """
+        Gets the ids of the documents if all of them have one, None otherwise (new ids are generated).
+        """
+        return [document.id for document in documents] if all(document.id for document in documents) else None
+
+    def _add_embedded(self, text_embeddings: list, metadatas: list, ids: list = None) -> list:
+        """
+        Appends embedded pages past the rows of the current snapshot and publishes a snapshot including them.
+        Nothing is copied but the per-file maps, so the cost is proportional to the pages added.
+
+        Args:
+            text_embeddings (list): A list of (text, embedding) pairs.
+            metadatas (list): A list of metadata dictionaries.
+            ids (list): A list of docstore ids. Generated if None.
+
+        Returns:
+            (list): The docstore ids of the added pages.
+        """
+        metadatas = list(metadatas) if metadatas else [{} for _ in text_embeddings]
+        with self._write_lock:
+            draft = self._snapshot.for_append()
+            ids = self._append(draft, text_embeddings, metadatas, ids)
+            self._index_added(draft, ids, metadatas, [text for text, _ in text_embeddings])
+            self._commit(draft, added_ids=ids)
+        return ids
+
+    def _append(self, draft: VectorstoreSnapshot, text_embeddings: list, metadatas: list, ids: list = None) -> list:
+        """
+        Appends pages in place to the index, docstore and row -> id map of a snapshot's vector store
+        (what LangChain's FAISS.add_embeddings does, without its copy of the whole in-memory docstore).
+        Published snapshots sharing them ignore the rows past their ntotal.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being modified.
+            text_embeddings (list): A list of (text, embedding) pairs.
+            metadatas (list): A list of metadata dictionaries.
+            ids (list): A list of docstore ids. Generated if None.
+
+        Returns:
+            (list): The docstore ids of the added pages.
+        """
+        vectorstore = draft.vectorstore
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in text_embeddings]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Duplicate ids found in the ids list.")
+        existing_ids = [doc_id for doc_id in ids if doc_id in draft.id_to_row]
+        if existing_ids:
+            raise ValueError(f"Tried to add ids that already exist: {existing_ids[:10]}")
+
+        vectors = np.array([embedding for _, embedding in text_embeddings], dtype=np.float32).reshape(len(ids), -1)
+        if vectors.shape[1] != vectorstore.index.d:
+            raise ValueError(f"Embeddings of dimension {vectors.shape[1]} cannot be added to an index of dimension {vectorstore.index.d}")
+        if vectorstore._normalize_L2:
+            faiss.normalize_L2(vectors)
+
+        documents = {
+            doc_id: Document(id=doc_id, page_content=text, metadata=metadata)
+            for doc_id, (text, _), metadata in zip(ids, text_embeddings, metadatas)
+        }
+        if isinstance(vectorstore.docstore, InMemoryDocstore):
+            vectorstore.docstore._dict.update(documents)
+        else:
+            vectorstore.docstore.add(documents)
+
+        starting_row = vectorstore.index.ntotal
+        vectorstore.index_to_docstore_id.update({starting_row + offset: doc_id for offset, doc_id in enumerate(ids)})
+        with self._index_lock.exclusive():
+            vectorstore.index.add(vectors)
+        return ids
+
+    def memory_bytes(self) -> int:
+        """
+        Estimates the memory held by this vectorstore: the stored vectors and the page texts.
+        Memory-mapped parts live in the shared page cache and are not counted.
+
+        Returns:
+            (int): Estimated size in bytes.
+        """
+        if self._snapshot is None:
+            return 0
+
+        vectorstore = self._snapshot.vectorstore
+        size = 0
+        if not isinstance(vectorstore.index, MmapFlatIndex):
+            size += vectorstore.index.ntotal * vectorstore.index.d * 4
+        if isinstance(vectorstore.docstore, InMemoryDocstore):
+            # Listed first: appends may add documents meanwhile
+            size += sum(len(document.page_content) for document in list(vectorstore.docstore._dict.values()))
+        size += self._snapshot.lexical.nbytes()
+        return size
+
+    def stats(self) -> dict:
+        """
+        Gets the size of the store without reading the documents.
+
+        Returns:
+            (dict): documents (not tombstoned), tombstones, files, docstore type and memory_bytes.
+        """
+        snapshot = self._snapshot
+        return {
+            "documents": snapshot.live_count(),
+            "tombstones": len(snapshot.tombstones),
+            "files": len(snapshot.gu_id_index),
+            "docstore": type(snapshot.vectorstore.docstore).__name__,
+            "memory_bytes": self.memory_bytes()
+        }
 
     async def get_files_in_vectorstore(self) -> tuple[set, set]:
         """
@@ -113,17 +1237,9 @@ class FAISS_DB():
             (list, list) : A list of filenames stored in vectorstore, A list of file gu_ids stored in vectorstore
         """
         try:
-            file_paths = set()
-            gu_id_list = set()
-
-            if self.vectorstore.index.ntotal != 0:
-
-                all_docs = await self.vectorstore.asimilarity_search("", k=self.vectorstore.index.ntotal)  # Empty query fetches all
-
-                # Print stored documents
-                for _, doc in enumerate(all_docs):
-                    file_paths.add(doc.metadata['source'])
-                    gu_id_list.add(doc.metadata['gu_id'])
+            snapshot = self._snapshot
+            file_paths = set(snapshot.source_index)
+            gu_id_list = set(snapshot.gu_id_index)
 
             return file_paths, gu_id_list
 
@@ -134,6 +1250,71 @@ class FAISS_DB():
 
 
 
+    def get_page(self, offset: int = 0, limit: int = 1000, include_vectors: bool = False) -> list[dict]:
+        """
+        Reads one page of stored documents directly from the docstore, in index row order.
+
+        No embedding call or similarity search is made.
+
+        Args:
+            offset (int): Row position of the first document of the page.
+            limit (int): Maximum number of documents in the page.
+            include_vectors (bool): If True, the stored vectors are reconstructed from the index.
+
+        Returns:
+            (list): A list of dicts with keys 'id', 'page_content', 'metadata' (and 'vector').
+                Tombstoned rows are skipped, so a page may hold fewer than limit documents.
+        """
+        return self._read_page(self._snapshot, offset, limit, include_vectors)
+
+    def _read_page(self, snapshot: VectorstoreSnapshot, offset: int, limit: int, include_vectors: bool) -> list[dict]:
+        """
+        Reads the rows [offset, offset + limit) of a snapshot, see get_page.
+        """
+        vectorstore = snapshot.vectorstore
+        start = max(offset, 0)
+        stop = min(start + max(limit, 0), snapshot.ntotal)
+        if start >= stop:
+            return []
+
+        vectors = None
+        if include_vectors:
+            with self._index_lock.shared():
+                vectors = vectorstore.index.reconstruct_n(start, stop - start)
+
+        records = []
+        for position, row in enumerate(range(start, stop)):
+            if row in snapshot.tombstones:
+                continue
+            doc_id = vectorstore.index_to_docstore_id[row]
+            document = vectorstore.docstore.search(doc_id)
+            record = {"id": doc_id, "page_content": document.page_content, "metadata": document.metadata}
+            if include_vectors:
+                record["vector"] = vectors[position].tolist()
+            records.append(record)
+
+        return records
+
+    def iter_documents(self, batch_size: int = 1000, include_vectors: bool = False, offset: int = 0):
+        """
+        Streams the stored documents page by page, holding a single page in memory at a time.
+        The whole stream reads the snapshot current when it starts, so it is not affected by writes or compaction.
+
+        Args:
+            batch_size (int): Number of documents per page.
+            include_vectors (bool): If True, the stored vectors are reconstructed from the index.
+            offset (int): Row position to start streaming from.
+
+        Yields:
+            (list): A page of documents, as returned by get_page.
+        """
+        snapshot = self._snapshot
+        while offset < snapshot.ntotal:
+            page = self._read_page(snapshot, offset, batch_size, include_vectors)
+            offset += batch_size
+            if page:
+                yield page
+
     async def get(self) -> (dict[str, list] | dict):
         """
         Get a list of files stored in vectorstore
@@ -145,12 +1326,11 @@ class FAISS_DB():
             documents = []
             metadatas = []
 
-            all_docs = await self.vectorstore.asimilarity_search("", k=self.vectorstore.index.ntotal)  # Empty query fetches all
+            for page in self.iter_documents():
+                for record in page:
+                    documents.append(record["page_content"])
+                    metadatas.append(record["metadata"])
 
-            for _, doc in enumerate(all_docs):
-                documents.append(doc.page_content)
-                metadatas.append(doc.metadata)
-            
             all_docs_dict = {"documents" : documents,
                              "metadatas" : metadatas}
 
@@ -171,26 +1351,36 @@ class FAISS_DB():
 
         """
         try:
-            data_dict = self.vectorstore.docstore.__dict__
+            ids_to_delete = list(self.gu_id_index.get(str(gu_id), []))
 
-            ids_to_delete = []
-            for _,data in data_dict.items():
-                for key, value in data.items():
-                    if str(value.metadata["gu_id"]) == str(gu_id):
-                        ids_to_delete.append(key)
-            
             if ids_to_delete:
-                self.vectorstore.delete(ids=ids_to_delete)
-                self.vectorstore.save_local(self.persist_directory)
+                self._check_writable()
+                # Removal may rebuild the index, so it runs off the event loop like the save
+                await asyncio.to_thread(self._delete_ids, ids_to_delete)
             
             else:
-                print("Nothing to delete")
+                logging.info(f"Nothing to delete in vectorstore {self.persist_directory} for gu_id {gu_id}")
 						
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
             logging.error("An error occurred while deleting data from vectorstore : " + error_message)
             raise InternalError("An error occurred while deleting data from vectorstore : " + str(e))
 
+    def _delete_ids(self, ids: list) -> None:
+        """
+        Tombstones pages in a copy of the side-indexes, publishes it and logs the change.
+        The index itself is not copied or modified, so the cost is proportional to the number of pages.
+
+        Args:
+            ids (list): Docstore ids to remove.
+        """
+        with self._write_lock:
+            draft = self._snapshot.copy_side_indexes()
+            removed_ids = self._remove_ids(draft, ids)
+            self._commit(draft, removed_ids=removed_ids)
+            self._schedule_compaction()
+        self.save_local()
+
 
     async def get_embeddings_and_ids(self, gu_id) -> tuple[list, list, list]:
         """
@@ -204,28 +1394,396 @@ class FAISS_DB():
             
         """
         try:
-            # Get all docs
-            docs = self.vectorstore.docstore._dict
-
-            # Get all embeddings
-            faiss_index = self.vectorstore.index
-            all_embeddings = faiss_index.reconstruct_n(0, faiss_index.ntotal)
-
             # Initialize variables
             embeddings = []
             metadatas = []
-            ids = []
-
-            # Get all embeddings, metadatas and ids of the corresponding file.
-            for i, (doc_id, document) in enumerate(docs.items()):
-                if str(document.metadata['gu_id']) == str(gu_id):
-                    embeddings.append((document.page_content, all_embeddings[i]))
-                    metadatas.append(document.metadata)
-                    ids.append(doc_id)
+            snapshot = self._snapshot
+            ids = list(snapshot.gu_id_index.get(str(gu_id), []))
+
+            if not ids:
+                return embeddings, metadatas, ids
+
+            # Reconstruct only the rows belonging to the file
+            rows = np.array([snapshot.id_to_row[doc_id] for doc_id in ids], dtype=np.int64)
+            with self._index_lock.shared():
+                file_embeddings = snapshot.vectorstore.index.reconstruct_batch(rows)
+
+            # Get embeddings and metadatas of the corresponding file.
+            for doc_id, embedding in zip(ids, file_embeddings):
+                document = snapshot.vectorstore.docstore.search(doc_id)
+                embeddings.append((document.page_content, embedding))
+                metadatas.append(document.metadata)
                     
             return embeddings, metadatas, ids
         
         except Exception as e:
             error_message = get_error_message_detail(e, sys)
             logging.error(error_message)
-            raise InternalError("An error occurred while taking embeddings, metadata and ids of a file from the vectorstore: " + str(e))
\ No newline at end of file
+            raise InternalError("An error occurred while taking embeddings, metadata and ids of a file from the vectorstore: " + str(e))
+
+
+    def _rebuild_without(self, draft: VectorstoreSnapshot, exclude_ids: set) -> None:
+        """
+        Removes documents by rebuilding the index from the remaining vectors.
+
+        Used for index types whose remove_ids() does not renumber the remaining rows (IVF, HNSW).
+        The trained state of the index (IVF centroids, PQ codebooks) is kept.
+
+        Args:
+            draft (VectorstoreSnapshot): The snapshot being modified.
+            exclude_ids (set): Docstore ids to remove.
+        """
+        vectorstore = draft.vectorstore
+        old_index = vectorstore.index
+        keep_rows = [row for row, doc_id in sorted(vectorstore.index_to_docstore_id.items()) if doc_id not in exclude_ids]
+
+        new_index = faiss.clone_index(old_index)
+        new_index.reset()
+        if keep_rows:
+            new_index.add(old_index.reconstruct_batch(np.array(keep_rows, dtype=np.int64)))
+        configure_search(new_index, nprobe=self.index_params["nprobe"], ef_search=self.index_params["ef_search"])
+
+        vectorstore.docstore.delete(list(exclude_ids))
+        vectorstore.index_to_docstore_id = {
+            new_row: vectorstore.index_to_docstore_id[old_row] for new_row, old_row in enumerate(keep_rows)
+        }
+        vectorstore.index = new_index
+
+
+    def rebuild_index(
+            self,
+            index_type: str = None,
+            sample_size: int = 200,
+            k: int = 10
+            ) -> dict:
+        """
+        Retrains and rebuilds the whole index into the given index type, reports its recall against
+        flat search on a sample of stored vectors, and saves the store.
+
+        Row order (and therefore the docstore mapping) is unchanged. Rebuilding from a quantized index
+        (sq_fp16, sq_int8, pq, ivf_pq) starts from its approximate (decoded) vectors. Training runs
+        without the write lock, so searches and writes continue; the lock is only taken to add the pages
+        appended meanwhile and publish the new index. A compaction during training renumbers the rows,
+        so training starts again (up to REBUILD_ATTEMPTS times).
+
+        Args:
+            index_type (str): Target index type. Defaults to the index_type of this FAISS_DB.
+            sample_size (int): Number of stored vectors used as queries for the recall check.
+            k (int): Number of neighbours used for the recall check.
+
+        Returns:
+            (dict): Old and new index type, number of vectors and recall@k of the new index.
+        """
+        try:
+            self._check_writable()
+            index_type = index_type or self.index_type
+            for _ in range(REBUILD_ATTEMPTS):
+                snapshot = self._snapshot
+                old_index = snapshot.vectorstore.index
+                with self._index_lock.shared():
+                    vectors = old_index.reconstruct_n(0, snapshot.ntotal) if snapshot.ntotal else np.zeros((0, old_index.d), dtype=np.float32)
+
+                new_index = build_index(
+                    vectors,
+                    index_type=index_type,
+                    nlist=self.index_params["nlist"],
+                    nprobe=self.index_params["nprobe"],
+                    pq_m=self.index_params["pq_m"],
+                    hnsw_m=self.index_params["hnsw_m"],
+                    ef_search=self.index_params["ef_search"]
+                )
+                recall = measure_recall(new_index, vectors, sample_size=sample_size, k=k)
+
+                with self._write_lock:
+                    current = self._snapshot
+                    if current.vectorstore is not snapshot.vectorstore:
+                        logging.warning(f"Vectorstore {self.persist_directory} was compacted during the rebuild. Training again.")
+                        continue
+                    if current.ntotal > snapshot.ntotal:
+                        # Pages appended during training; no append runs while the write lock is held
+                        new_index.add(old_index.reconstruct_n(snapshot.ntotal, current.ntotal - snapshot.ntotal))
+
+                    # Only the index changes; the docstore and side-indexes are shared with the old snapshot
+                    vectorstore = FAISS(
+                        embedding_function=current.vectorstore.embedding_function,
+                        index=new_index,
+                        docstore=current.vectorstore.docstore,
+                        index_to_docstore_id=current.vectorstore.index_to_docstore_id,
+                        normalize_L2=current.vectorstore._normalize_L2
+                    )
+                    self._commit(VectorstoreSnapshot(
+                        vectorstore, current.gu_id_index, current.source_index, current.id_to_row, current.tombstones,
+                        current.lexical, current.ntotal
+                    ))
+                    self.index_type = index_type
+                    break
+            else:
+                raise InternalError(f"Vectorstore {self.persist_directory} was compacted during each of {REBUILD_ATTEMPTS} rebuilds")
+
+            # The whole index changed, so it is written as a new base snapshot
+            self.merge(background=False)
+
+            report = {
+                "from": get_index_type(old_index),
+                "to": get_index_type(new_index),
+                "ntotal": int(new_index.ntotal),
+                f"recall@{k}": recall
+            }
+            logging.info(f"Vectorstore {self.persist_directory} rebuilt : {report}")
+            return report
+
+        except Exception as e:
+            error_message = get_error_message_detail(e, sys)
+            logging.error("An error occurred while rebuilding the vectorstore index : " + error_message)
+            raise InternalError("An error occurred while rebuilding the vectorstore index : " + str(e))
+
+    def similarity_search_by_vector(
+            self,
+            embedding: list,
+            k: int = 10,
+            gu_ids: list = None
+            ) -> list[Document]:
+        """
+        Searches the index with an embedding, optionally restricted to the pages of some files.
+
+        On exhaustive indexes (flat, sq_fp16, sq_int8) the restriction is applied inside the FAISS search
+        with an ID selector, so a file-specific search runs on the shared index without copying any vectors.
+        IVF and HNSW searches only reach the rows near the query, and pq takes no selector, so on those the
+        vectors of the scoped rows are read back and ranked exactly. Tombstoned rows are excluded with a
+        selector, or by fetching that many extra hits for indexes without selector support.
+
+        Args:
+            embedding (list): The query embedding.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, closest first.
+        """
+        # The snapshot is read once, so the whole search sees a single version of the store
+        snapshot = self._snapshot
+        vectorstore = snapshot.vectorstore
+        return [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[row])
+            for row, _ in self._search_hits(snapshot, embedding, k, gu_ids)
+        ]
+
+    def search_ids_by_vector(self, embedding: list, k: int = 10, gu_ids: list = None) -> list[tuple[str, float]]:
+        """
+        Searches the index like similarity_search_by_vector, without reading the docstore.
+
+        Args:
+            embedding (list): The query embedding.
+            k (int): Number of hits to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): (docstore id, squared L2 distance) of the matching pages, closest first.
+        """
+        snapshot = self._snapshot
+        return [
+            (snapshot.vectorstore.index_to_docstore_id[row], distance)
+            for row, distance in self._search_hits(snapshot, embedding, k, gu_ids)
+        ]
+
+    def lexical_search_ids(self, query: str, k: int = 10, gu_ids: list = None) -> list[tuple[str, float]]:
+        """
+        Searches the BM25 inverted index, without reading the docstore.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of hits to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): (docstore id, BM25 score) of the matching pages, best first.
+        """
+        return self._lexical_hits(self._snapshot, query, k, gu_ids)
+
+    def get_documents(self, ids: list) -> list[Document]:
+        """
+        Reads documents by docstore id, e.g. the hits of search_ids_by_vector.
+
+        Args:
+            ids (list): Docstore ids.
+
+        Returns:
+            (list): The document of each id, None for ids no longer stored.
+        """
+        docstore = self._snapshot.vectorstore.docstore
+        documents = [docstore.search(doc_id) for doc_id in ids]
+        return [document if isinstance(document, Document) else None for document in documents]
+
+    def _search_hits(self, snapshot: VectorstoreSnapshot, embedding: list, k: int, gu_ids: list = None) -> list[tuple[int, float]]:
+        """
+        Searches the index of a snapshot, see similarity_search_by_vector.
+
+        Returns:
+            (list): (row, distance) of the matching pages, closest first.
+        """
+        index = snapshot.vectorstore.index
+        rows = None
+
+        if gu_ids is not None:
+            rows = np.array(
+                [snapshot.id_to_row[doc_id] for gu_id in gu_ids for doc_id in snapshot.gu_id_index.get(str(gu_id), [])],
+                dtype=np.int64
+            )
+            if not len(rows):
+                return []
+            k = min(k, len(rows))
+
+        k = min(k, snapshot.live_count())
+        if k <= 0:
+            return []
+
+        # Scoped rows never include tombstoned ones (they left gu_id_index) nor rows appended after the snapshot
+        tombstones = snapshot.tombstones if rows is None else set()
+        query = np.array([embedding], dtype=np.float32)
+
+        with self._index_lock.shared():
+            # Rows appended since the snapshot are not excluded by the selectors: fetch that many more
+            fetch_k = k + index.ntotal - snapshot.ntotal
+            if tombstones and (isinstance(index, MmapFlatIndex) or not supports_selector(index)):
+                fetch_k += len(tombstones)
+            fetch_k = min(fetch_k, index.ntotal)
+
+            if isinstance(index, MmapFlatIndex):
+                distances, found_rows = index.search(query, fetch_k, rows=rows)
+            elif rows is not None and not (supports_selector(index) and is_exhaustive(index)):
+                # A selector would only keep the scoped rows that the IVF probes or HNSW walk happen to reach:
+                # the scoped rows are few, so their (decoded) vectors are ranked exactly
+                rows = np.sort(rows)
+                distances, positions = faiss.knn(query, index.reconstruct_batch(rows), k)
+                found_rows = rows[positions]
+            else:
+                selector = faiss.IDSelectorBatch(rows) if rows is not None else snapshot.tombstone_selector()
+                if not supports_selector(index):
+                    selector = None
+                params = search_parameters(index, selector, nprobe=self.index_params["nprobe"], ef_search=self.index_params["ef_search"])
+                distances, found_rows = index.search(query, fetch_k, params=params)
+
+        found = [
+            (int(row), float(distance)) for row, distance in zip(found_rows[0], distances[0])
+            if row != -1 and row < snapshot.ntotal and int(row) not in tombstones
+        ]
+        return found[:k]
+
+    @staticmethod
+    def _lexical_hits(snapshot: VectorstoreSnapshot, query: str, k: int, gu_ids: list = None) -> list[tuple[str, float]]:
+        """
+        Searches the inverted index of a snapshot, see lexical_search_ids.
+        """
+        allowed_ids = None
+        if gu_ids is not None:
+            allowed_ids = {doc_id for gu_id in gu_ids for doc_id in snapshot.gu_id_index.get(str(gu_id), [])}
+        return snapshot.lexical.search(query, k, allowed_ids=allowed_ids, excluded_ids=snapshot.tombstoned_ids())
+
+    def hybrid_search_by_vector(self, query: str, embedding: list, k: int = 10, gu_ids: list = None) -> list[Document]:
+        """
+        Fuses vector hits and BM25 hits of the inverted index with reciprocal rank fusion.
+
+        Exact tokens (dealer codes, question numbers like "148c", labels) are found by BM25 even when
+        the embedding ranks them poorly, so fewer pages are needed for the same recall.
+
+        Args:
+            query (str): The query text, for BM25.
+            embedding (list): The query embedding.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, best fused rank first.
+        """
+        snapshot = self._snapshot
+        vectorstore = snapshot.vectorstore
+        # Each ranking is deeper than k so that a page ranked moderately by both can win
+        fetch_k = k * HYBRID_FETCH_FACTOR
+
+        vector_ids = [vectorstore.index_to_docstore_id[row] for row, _ in self._search_hits(snapshot, embedding, fetch_k, gu_ids)]
+        lexical_ids = [doc_id for doc_id, _ in self._lexical_hits(snapshot, query, fetch_k, gu_ids)]
+
+        fused_ids = reciprocal_rank_fusion([vector_ids, lexical_ids])[:k]
+        return [vectorstore.docstore.search(doc_id) for doc_id in fused_ids]
+
+    def hybrid_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        """
+        Embeds the query and runs hybrid_search_by_vector.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, best fused rank first.
+        """
+        embedding = self.embedding_function.embed_query(query)
+        return self.hybrid_search_by_vector(query, embedding, k=k, gu_ids=gu_ids)
+
+    async def ahybrid_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        """
+        Asynchronously embeds the query and runs hybrid_search_by_vector.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, best fused rank first.
+        """
+        embedding = await self.embedding_function.aembed_query(query)
+        return self.hybrid_search_by_vector(query, embedding, k=k, gu_ids=gu_ids)
+
+
+    def similarity_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        """
+        Embeds the query and searches the index, optionally restricted to the pages of some files.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, closest first.
+        """
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, gu_ids=gu_ids)
+
+
+    async def asimilarity_search(self, query: str, k: int = 10, gu_ids: list = None) -> list[Document]:
+        """
+        Asynchronously embeds the query and searches the index, optionally restricted to the pages of some files.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of documents to return.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+
+        Returns:
+            (list): Matching documents, closest first.
+        """
+        embedding = await self.embedding_function.aembed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, gu_ids=gu_ids)
+
+
+    def as_retriever(self, k: int = 10, gu_ids: list = None, hybrid: bool = None) -> ScopedRetriever:
+        """
+        Creates a retriever over this vectorstore.
+
+        Args:
+            k (int): Number of documents to retrieve.
+            gu_ids (list): gu_ids of the files to search in. All files are searched if None.
+            hybrid (bool): If True, vector and BM25 hits are fused. Defaults to the hybrid setting of this FAISS_DB.
+
+        Returns:
+            (ScopedRetriever): Retriever usable in LangChain chains.
+        """
+        return ScopedRetriever(
+            store=self,
+            k=k,
+            gu_ids=[str(gu_id) for gu_id in gu_ids] if gu_ids is not None else None,
+            hybrid=self.hybrid if hybrid is None else hybrid
+        )
\ No newline at end of file
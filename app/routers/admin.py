@@ -0,0 +1,229 @@
+"""This module handles admin routers for inspecting the vectorstore"""
+
+import sys
+import json
+from fastapi import APIRouter, Depends, Query, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.info import auth_info
+from app import utils
+from app.models.embedding_cache import CachedEmbeddings
+from app.models.query_cache import QueryEmbeddingCache
+from app.logger import logging
+from app.exception import get_error_message_detail
+
+
+# Create FastAPI router
+router = APIRouter()
+
+
+@router.get("/export")
+async def export_vectorstore(
+    valid_api_key: bool = Depends(auth_info.validate_api_key),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    include_vectors: bool = Query(False)
+) -> StreamingResponse:
+    """
+    Endpoint to dump the documents stored in RENAULT_DB as newline-delimited JSON.
+
+    The docstore is streamed page by page, so memory use does not depend on the size of the store,
+    and no embedding call is made.
+
+    Parameters:
+        valid_api_key (bool): If validation of API key is success or not
+        offset (int): Row position of the first document to export.
+        limit (int): Maximum number of documents to export. All remaining documents if not passed.
+        batch_size (int): Number of documents read from the docstore at a time.
+        include_vectors (bool): If True, each line also contains the stored vector.
+
+    Returns:
+        (StreamingResponse): One JSON document per line.
+    """
+    try:
+        vectorstore = utils.RENAULT_DB
+        logging.info(f"Exporting vectorstore {vectorstore.persist_directory} from offset {offset}")
+
+        def generate_lines():
+            remaining = limit
+            for page in vectorstore.iter_documents(batch_size=batch_size, include_vectors=include_vectors, offset=offset):
+                if remaining is not None:
+                    page = page[:remaining]
+                    remaining -= len(page)
+
+                for record in page:
+                    yield json.dumps(record, default=str) + "\n"
+
+                if remaining is not None and remaining <= 0:
+                    break
+
+        return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
+
+    except Exception as e:
+        error_message = get_error_message_detail(e, sys)
+        logging.error(f"Error in vectorstore export: {error_message}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"message": "An internal server error occurred while exporting the vectorstore", "error": True, "data": []}
+        )
+
+
+@router.get("/vectorstore-stats")
+async def vectorstore_stats(
+    valid_api_key: bool = Depends(auth_info.validate_api_key)
+) -> JSONResponse:
+    """
+    Endpoint to get the size of RENAULT_DB without reading the documents.
+
+    Parameters:
+        valid_api_key (bool): If validation of API key is success or not
+
+    Returns:
+        (JSONResponse): contains http status code and content with output data.
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "Vectorstore stats retrieved successfully",
+            "error": False,
+            "data": utils.RENAULT_DB.stats()
+        }
+    )
+
+
+@router.get("/session-cache-stats")
+async def session_cache_stats(
+    valid_api_key: bool = Depends(auth_info.validate_api_key)
+) -> JSONResponse:
+    """
+    Endpoint to get the hit / miss / eviction counters and the size of the chat session cache.
+
+    Parameters:
+        valid_api_key (bool): If validation of API key is success or not
+
+    Returns:
+        (JSONResponse): contains http status code and content with output data.
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "Session cache stats retrieved successfully",
+            "error": False,
+            "data": utils.chat_sessions.stats()
+        }
+    )
+
+
+@router.get("/embedding-cache-stats")
+async def embedding_cache_stats(
+    valid_api_key: bool = Depends(auth_info.validate_api_key)
+) -> JSONResponse:
+    """
+    Endpoint to get the hit / miss / eviction counters and the size of the persistent embedding cache.
+
+    Parameters:
+        valid_api_key (bool): If validation of API key is success or not
+
+    Returns:
+        (JSONResponse): contains http status code and content with output data.
+    """
+    embeddings = utils.EMBEDDINGS
+    if isinstance(embeddings, QueryEmbeddingCache):
+        embeddings = embeddings.underlying_embeddings
+
+    if not isinstance(embeddings, CachedEmbeddings):
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Embedding cache is disabled", "error": True, "data": []}
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "Embedding cache stats retrieved successfully",
+            "error": False,
+            "data": embeddings.stats()
+        }
+    )
+
+
+@router.get("/ocr-scheduler-stats")
+async def ocr_scheduler_stats(
+    valid_api_key: bool = Depends(auth_info.validate_api_key)
+) -> JSONResponse:
+    """
+    Endpoint to get the queue depth per priority, requests in flight, retry counters and queue wait times of the OCR scheduler.
+
+    Parameters:
+        valid_api_key (bool): If validation of API key is success or not
+
+    Returns:
+        (JSONResponse): contains http status code and content with output data.
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "OCR scheduler stats retrieved successfully",
+            "error": False,
+            "data": utils.ocr_scheduler.stats()
+        }
+    )
+
+
+@router.get("/ocr-cache-stats")
+async def ocr_cache_stats(
+    valid_api_key: bool = Depends(auth_info.validate_api_key)
+) -> JSONResponse:
+    """
+    Endpoint to get the hit rate, size, evictions and prompt version of the persistent OCR result cache.
+
+    Parameters:
+        valid_api_key (bool): If validation of API key is success or not
+
+    Returns:
+        (JSONResponse): contains http status code and content with output data.
+    """
+    if utils.ocr_cache is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "OCR cache is disabled", "error": True, "data": []}
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "OCR cache stats retrieved successfully",
+            "error": False,
+            "data": utils.ocr_cache.stats()
+        }
+    )
+
+
+@router.get("/query-cache-stats")
+async def query_cache_stats(
+    valid_api_key: bool = Depends(auth_info.validate_api_key)
+) -> JSONResponse:
+    """
+    Endpoint to get the hit rate, expiration / eviction counters and the size of the in-memory query embedding cache.
+
+    Parameters:
+        valid_api_key (bool): If validation of API key is success or not
+
+    Returns:
+        (JSONResponse): contains http status code and content with output data.
+    """
+    if not isinstance(utils.EMBEDDINGS, QueryEmbeddingCache):
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Query embedding cache is disabled", "error": True, "data": []}
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "Query embedding cache stats retrieved successfully",
+            "error": False,
+            "data": utils.EMBEDDINGS.stats()
+        }
+    )
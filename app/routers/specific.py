@@ -27,6 +27,7 @@ from app.info import db_info
 from fastapi.responses import JSONResponse
 from langchain.schema import HumanMessage, AIMessage
 from app.models.vectorstore import FAISS_DB
+from app.models import segment_store
 from app.components.heartbeat import heartbeat
 from urllib.parse import urlparse, unquote
 
@@ -242,11 +243,12 @@ async def upload_file(
             )
             db.add(chat_entry)
 
-            # Create and store the conversational chain in memory for this session
-            persist_path = f'{PERSIST_DIRECTORY}/{chatid}'
-            retriever_chain, chat_history = await create_specific_chain(gu_id, vectorstore, persist_path)
+            # Create and store the conversational chain in memory for this session.
+            # Retrieval is scoped to the file on the shared vectorstore, nothing is copied.
+            retriever_chain, chat_history = await create_specific_chain(gu_id, vectorstore)
             utils.chat_sessions[chatid] = {
                 "retriever_chain": retriever_chain,
+                "vectorstore": vectorstore,
                 "chat_history": chat_history
             }
             db.commit()
@@ -380,6 +382,7 @@ async def embed_pdf(
 
             utils.chat_sessions[chatid] = {
                 "retriever_chain": retriever_chain,
+                "vectorstore": vectorstore,
                 "chat_history": chat_history
             }
             logging.info(f"Specific retriever chain created for chatid: {chatid}")
@@ -412,15 +415,20 @@ async def embed_pdf(
    
     except Exception as e:
         logging.error(f"Embedding failed for chat {chatid}: {e}")
+        removed = True
         try:
-            embed_failure_cleaning(db=db, chatid=UUID4(chatid) )
+            removed = embed_failure_cleaning(db=db, chatid=UUID4(chatid) )
+            db.commit()
         except Exception as cleanup_err:
             db.rollback()
             logging.error(f"Failed embedding failure cleanup for chat {chatid}: {cleanup_err}")
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={
-                "message": "An internal server error occurred while Embedding. Saved data removed",
+                "message": (
+                    "An internal server error occurred while Embedding. Saved data removed" if removed else
+                    "An internal server error occurred while Embedding. Extracted pages were kept, retry to resume"
+                ),
                 "error": True,
                 "data": []
             }
@@ -647,28 +655,42 @@ async def specific_chat(
         heartbeat(chatid)
 
         # ----- Initialize / rebuild session -----
-        if chatid not in utils.chat_sessions:
+        # Stores are opened read-only and nothing is embedded, so a rebuild makes no embedding call
+        if utils.chat_sessions.lookup(chatid) is None:
             logging.info(f"Reconstructing session for chatid {chatid}")
             vectorstore = None
+            gu_ids = None
             vectorstore_path = f'{PERSIST_DIRECTORY}/{chatid}'
 
-            if os.path.exists(vectorstore_path):
-                vectorstore = FAISS_DB(embedding_function=EMBEDDINGS, persist_directory=vectorstore_path)
+            if segment_store.read_manifest(vectorstore_path):
+                # Newly uploaded files are embedded into a vectorstore of their own chat
+                vectorstore = FAISS_DB(
+                    embedding_function=EMBEDDINGS, persist_directory=vectorstore_path, read_only=True, hybrid=utils.HYBRID_SEARCH
+                )
                 vectorstore.load()
                 logging.info("Vectorstore loaded for chat session.")
             else:
-                logging.info("No vectorstore found. Proceeding without document retrieval.")
+                # Files that were already embedded are searched in the shared vectorstore
+                upload_records = db.query(UploadFileInfo).filter(UploadFileInfo.chat_id == chatid).all()
+                gu_ids = [str(record.file_id) for record in upload_records if str(record.file_id) in utils.RENAULT_DB.gu_id_index]
+                if gu_ids:
+                    vectorstore = utils.RENAULT_DB
+                    logging.info(f"Chat session scoped to files {gu_ids} of the shared vectorstore.")
+                else:
+                    logging.info("No vectorstore found. Proceeding without document retrieval.")
 
 
 
             # Create the agent — pass vectorstore only if it exists
             graph, _ = await create_renault_agent(
                 existing_file_db=vectorstore,
+                gu_ids=gu_ids,
                 chat_history=chat_history
             )
 
             utils.chat_sessions[chatid] = {
                 "graph": graph,
+                "vectorstore": vectorstore,
                 "chat_history": chat_history
             }
 
@@ -706,6 +728,8 @@ async def specific_chat(
 
         # ----- Save updated history -----
         session["chat_history"] = chat_history
+        # Storing the session again re-measures its size in the cache
+        utils.chat_sessions[chatid] = session
         final_out = output_source_correction(result=result)
 
         chat_log.append({"sender": "user", "text": request.query})
@@ -1,16 +1,23 @@
 import os
 import sys
 import re
+from functools import partial
 from dotenv import load_dotenv
 
 from langchain_openai.embeddings.azure import AzureOpenAIEmbeddings
 from langchain_openai import AzureChatOpenAI
 
 from app.models.vectorstore import FAISS_DB
+from app.models.sharded_vectorstore import SHARDED_FAISS_DB
+from app.models.embedding_cache import CachedEmbeddings
+from app.models.query_cache import QueryEmbeddingCache
+from app.models.ocr_scheduler import OCR_SCHEDULER
+from app.models.ocr_cache import OCRResultCache
+from app.models.prompts import OCR_PROMPT, TILED_PAGE_PROMPT, BATCH_PAGES_PROMPT, PAGE_MARKER
+from app.components.session_cache import SESSION_CACHE
 from app.logger import logging
 from app.exception import get_error_message_detail, InternalError
 
-chat_sessions = {}  # Store active chat sessions
 last_seen = {} # Track last activity timestamps for each chatid
 
 # load .env file data
@@ -32,6 +39,8 @@ try:
     EMBEDDING_OPENAI_API_KEY = os.getenv("EMBEDDING_OPENAI_API_KEY")
     EMBDDDING_ENDPOINT = os.getenv("EMBDDDING_ENDPOINT")
     EMBEDDINGS_DEPLOYMENT_NAME = os.getenv("EMBEDDINGS_DEPLOYMENT_NAME")
+    # Dimension of the embeddings (0 = asked to the embeddings deployment when a new store is created)
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
 
     SITE_URL = os.getenv("SITE_URL")
     SHAREPOINT_URL = os.getenv("SHAREPOINT_URL")
@@ -39,6 +48,92 @@ try:
     # FAISS Storage directory
     PERSIST_DIRECTORY = os.getenv("PERSIST_DIRECTORY")
 
+    # FAISS index type of RENAULT_DB : flat, sq_fp16, sq_int8, pq, ivf_flat, ivf_pq or hnsw
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+    FAISS_NLIST = int(os.getenv("FAISS_NLIST", "1024"))
+    FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+    # Open RENAULT_DB read-only and memory-mapped, so that API workers share one page-cached copy
+    FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() == "true"
+
+    # Docstore of the FAISS stores : memory, or sqlite (page texts compressed on disk, read per search hit)
+    FAISS_DOCSTORE = os.getenv("FAISS_DOCSTORE", "memory")
+
+    # Share of deleted (tombstoned) rows after which the FAISS index is compacted in the background
+    FAISS_COMPACT_RATIO = float(os.getenv("FAISS_COMPACT_RATIO", "0.2"))
+
+    # Sharded RENAULT_DB : number of local shard worker processes (0 = not sharded), or host:port of shard servers
+    FAISS_SHARDS = int(os.getenv("FAISS_SHARDS", "0"))
+    FAISS_SHARD_ADDRESSES = [address.strip() for address in os.getenv("FAISS_SHARD_ADDRESSES", "").split(",") if address.strip()]
+
+    # Retrieval : fuse vector hits with BM25 hits of the inverted index, and number of pages passed to the LLM
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+    RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "6"))
+
+    # Bounds of the in-memory chat session cache
+    CHAT_CACHE_MAX_SESSIONS = int(os.getenv("CHAT_CACHE_MAX_SESSIONS", "256"))
+    CHAT_CACHE_MAX_MB = int(os.getenv("CHAT_CACHE_MAX_MB", "2048"))
+
+    # Batching of the embedding requests made when documents are added to RENAULT_DB
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "32000"))
+    EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+    # SharePoint sync : files processed at the same time, batch size of the vectorstore commits, root of the per-file scratch directories
+    SYNC_FILE_CONCURRENCY = int(os.getenv("SYNC_FILE_CONCURRENCY", "4"))
+    SYNC_COMMIT_PAGES = int(os.getenv("SYNC_COMMIT_PAGES", "500"))
+    SYNC_COMMIT_FILES = int(os.getenv("SYNC_COMMIT_FILES", "20"))
+    SYNC_SCRATCH_DIRECTORY = os.getenv("SYNC_SCRATCH_DIRECTORY", "temp_dir")
+
+    # Retry rounds of the failed pages of a file within one attempt, and attempts at a page before its file is given up
+    PAGE_RETRY_ROUNDS = int(os.getenv("PAGE_RETRY_ROUNDS", "2"))
+    PAGE_MAX_ATTEMPTS = int(os.getenv("PAGE_MAX_ATTEMPTS", "6"))
+
+    # Quota of the vision deployment used for OCR, estimated tokens per page request, requests in flight and retries
+    OCR_REQUESTS_PER_MINUTE = int(os.getenv("OCR_REQUESTS_PER_MINUTE", "60"))
+    OCR_TOKENS_PER_MINUTE = int(os.getenv("OCR_TOKENS_PER_MINUTE", "60000"))
+    OCR_TOKENS_PER_PAGE = int(os.getenv("OCR_TOKENS_PER_PAGE", "2000"))
+    OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+    OCR_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", "6"))
+
+    # PDF rasterization : pages rendered per pdftoppm call, rendered pages waiting for OCR and pages of a file in OCR at the same time
+    RASTER_WINDOW_PAGES = int(os.getenv("RASTER_WINDOW_PAGES", "4"))
+    RASTER_QUEUE_PAGES = int(os.getenv("RASTER_QUEUE_PAGES", "8"))
+    OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", "4"))
+    RASTER_MAX_SIDE = int(os.getenv("RASTER_MAX_SIDE", "1600"))
+
+    # Encoding of the page images sent to OCR : format (auto, png, jpeg, webp), bytes per image, grayscale and tiling (auto, true/false)
+    OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "auto").lower()
+    OCR_IMAGE_BYTE_BUDGET = int(os.getenv("OCR_IMAGE_BYTE_BUDGET", "200000"))
+    OCR_IMAGE_GRAYSCALE = os.getenv("OCR_IMAGE_GRAYSCALE", "auto").lower()
+    OCR_IMAGE_TILING = os.getenv("OCR_IMAGE_TILING", "auto").lower()
+    OCR_TILE_DENSITY = float(os.getenv("OCR_TILE_DENSITY", "0.12"))
+    OCR_MAX_TILES = int(os.getenv("OCR_MAX_TILES", "3"))
+
+    # Pages sent in one OCR request (1 = one request per page, at most 4)
+    OCR_BATCH_PAGES = min(4, max(1, int(os.getenv("OCR_BATCH_PAGES", "1"))))
+
+    # Pages with a usable text layer (enough readable characters, little image area) are extracted without OCR
+    TEXT_LAYER_EXTRACTION = os.getenv("TEXT_LAYER_EXTRACTION", "true").lower() == "true"
+    TEXT_LAYER_MIN_CHARACTERS = int(os.getenv("TEXT_LAYER_MIN_CHARACTERS", "200"))
+    TEXT_LAYER_MAX_IMAGE_RATIO = float(os.getenv("TEXT_LAYER_MAX_IMAGE_RATIO", "0.3"))
+
+    # Persistent cache of OCR results (disabled if the path is empty) and its size limit
+    OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite")
+    OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+
+    # Persistent embedding cache (disabled if the path is empty), size limit per document / query cache
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+
+    # In-memory LRU cache of query embeddings (disabled if the size is 0) and age after which an entry is dropped
+    QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2048"))
+    QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+
 except Exception as error:
     error_message = get_error_message_detail(error, sys)
     logging.error(f"Error while getting .env data: {error_message}")
@@ -54,6 +149,35 @@ EMBEDDINGS = AzureOpenAIEmbeddings(
     model=EMBEDDINGS_DEPLOYMENT_NAME
 )
 
+# Page texts and queries embedded before are served from the cache instead of Azure
+if EMBEDDING_CACHE_PATH:
+    EMBEDDINGS = CachedEmbeddings(
+        EMBEDDINGS,
+        model=EMBEDDINGS_DEPLOYMENT_NAME,
+        path=EMBEDDING_CACHE_PATH,
+        max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 ** 2
+    )
+
+# Recent queries are answered from memory; shared by every FAISS_DB and retriever built on EMBEDDINGS
+if QUERY_CACHE_MAX_ENTRIES > 0:
+    EMBEDDINGS = QueryEmbeddingCache(EMBEDDINGS, max_entries=QUERY_CACHE_MAX_ENTRIES, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+
+# Every OCR request of the process waits its turn here (rate limits, /embed uploads before the SharePoint sync)
+ocr_scheduler = OCR_SCHEDULER(
+    requests_per_minute=OCR_REQUESTS_PER_MINUTE,
+    tokens_per_minute=OCR_TOKENS_PER_MINUTE,
+    max_concurrency=OCR_MAX_CONCURRENCY,
+    max_retries=OCR_MAX_RETRIES
+)
+
+# Pages OCR'd before with the same prompts, page marker and deployment are served from the cache instead of the vision model
+ocr_cache = OCRResultCache(
+    OCR_CACHE_PATH,
+    deployment=DEPLOYMENT_NAME,
+    ocr_prompt=[OCR_PROMPT, TILED_PAGE_PROMPT, BATCH_PAGES_PROMPT, PAGE_MARKER],
+    max_bytes=OCR_CACHE_MAX_MB * 1024 ** 2
+) if OCR_CACHE_PATH else None
+
 #Creating model (LLM)
 CHAT_MODEL = AzureChatOpenAI(
     azure_endpoint=OPENAI_API_BASE,
@@ -65,7 +189,31 @@ CHAT_MODEL = AzureChatOpenAI(
 )
 
 try:
-    RENAULT_DB = FAISS_DB(embedding_function=EMBEDDINGS, persist_directory=PERSIST_DIRECTORY)
+    # The sharded store has the same interface, with shards in worker processes or on other nodes
+    if FAISS_SHARDS or FAISS_SHARD_ADDRESSES:
+        VECTORSTORE_CLASS = partial(SHARDED_FAISS_DB, shards=FAISS_SHARDS, addresses=FAISS_SHARD_ADDRESSES)
+    else:
+        VECTORSTORE_CLASS = FAISS_DB
+
+    RENAULT_DB = VECTORSTORE_CLASS(
+        embedding_function=EMBEDDINGS,
+        persist_directory=PERSIST_DIRECTORY,
+        index_type=FAISS_INDEX_TYPE,
+        nlist=FAISS_NLIST,
+        nprobe=FAISS_NPROBE,
+        pq_m=FAISS_PQ_M,
+        hnsw_m=FAISS_HNSW_M,
+        ef_search=FAISS_EF_SEARCH,
+        read_only=FAISS_MMAP,
+        docstore_type=FAISS_DOCSTORE,
+        compact_ratio=FAISS_COMPACT_RATIO,
+        hybrid=HYBRID_SEARCH,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        embed_batch_tokens=EMBED_BATCH_TOKENS,
+        embed_concurrency=EMBED_CONCURRENCY,
+        embed_max_retries=EMBED_MAX_RETRIES,
+        dimensions=EMBEDDING_DIMENSIONS or None
+    )
     RENAULT_DB.load()
     
 except Exception as e:
@@ -73,6 +221,13 @@ except Exception as e:
     logging.error(error_message)
     raise InternalError(f"Error while loading vectorstore : {str(error_message)}")
 
+# Store active chat sessions (LRU, RENAULT_DB is shared and not counted in the size of a session)
+chat_sessions = SESSION_CACHE(
+    max_sessions=CHAT_CACHE_MAX_SESSIONS,
+    max_bytes=CHAT_CACHE_MAX_MB * 1024 ** 2,
+    shared_vectorstores=(RENAULT_DB,)
+)
+
  
 def output_source_correction(
         result:str